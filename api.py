@@ -0,0 +1,947 @@
+from flask import request, jsonify
+from flask_login import login_required, current_user
+from app import app, db
+from models import Company, Employee, Pallet, PalletSpec
+from utils import DIMENSION_FIELDS, calculate_component_volumes_batch, desi_to_decimal
+from data_version import bump_data_version
+from cutting_plan import (
+    CuttingPlanError, build_cutting_plan, parse_kerf, parse_order_items, parse_stock_lengths
+)
+from repricing import RepricingConflict, RepricingError, parse_repricing_params, reprice
+from company_stats import StatsChanges, apply_stats_changes, company_stats, summarize_stats
+from search_index import DEFAULT_SUGGESTIONS, MAX_SUGGESTIONS, autocomplete
+from similar_pallets import DEFAULT_NEIGHBOURS, MAX_NEIGHBOURS, find_similar, log_pallet_changes
+from pallet_specs import DEFAULT_USAGE_LIMIT, DESI_COLUMNS, MAX_USAGE_LIMIT, assign_specs, pallet_rows, spec_usage
+from personnel import (
+    PersonnelConflict, PersonnelError, add_advance, advance_to_dict, delete_advance, delete_employee,
+    employee_to_dict, get_user_employee, has_payment_history, parse_week, pay_week, payment_history,
+    save_attendance, user_employees, validate_employee_data, week_advances, weekly_attendance, weekly_payroll
+)
+from cache import user_companies
+from pallet_queries import (
+    LISTING_COLUMNS, FilterError, filtered_pallet_query, paginate_pallets, parse_page_size,
+    parse_pallet_filters
+)
+from sqlalchemy import delete, insert, select, update
+from decimal import Decimal, InvalidOperation
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Upper limit of items per operation list in one batch request
+MAX_BATCH_ITEMS = 10000
+# Size of IN (...) lists when loading or deleting rows by id
+ID_CHUNK_SIZE = 1000
+
+QUANTITY_FIELDS = ('upper_board_quantity', 'lower_board_quantity', 'closure_quantity')
+MEASUREMENT_FIELDS = tuple(field for field in DIMENSION_FIELDS if field not in QUANTITY_FIELDS)
+PALLET_FIELDS = ('name', 'company_id', 'price') + DIMENSION_FIELDS
+# Largest value that fits in a Numeric(10, 2) column
+MAX_NUMERIC = Decimal('99999999.99')
+
+
+def _float(value):
+    return float(value) if value is not None else None
+
+
+def pallet_to_dict(pallet):
+    """JSON dict of a pallet or of a row with every column of ``LISTING_COLUMNS``"""
+    data = {'id': pallet.id, 'name': pallet.name, 'company_id': pallet.company_id}
+    for field in ('price',) + MEASUREMENT_FIELDS + tuple(DESI_COLUMNS.values()):
+        data[field] = _float(getattr(pallet, field))
+    for field in QUANTITY_FIELDS:
+        data[field] = getattr(pallet, field)
+    company_name = getattr(pallet, 'company_name', None)
+    if company_name is not None:
+        data['company_name'] = company_name
+    return data
+
+
+def company_to_dict(company):
+    return {
+        'id': company.id,
+        'name': company.name,
+        'contact_email': company.contact_email,
+        'created_at': company.created_at.isoformat() if company.created_at else None
+    }
+
+
+def _parse_decimal(value, positive):
+    number = Decimal(str(value))
+    if not number.is_finite():
+        raise ValueError
+    if number < 0 or (positive and number == 0) or number > MAX_NUMERIC:
+        raise ValueError
+    return number.quantize(Decimal('0.01'))
+
+
+def validate_pallet_data(data, company_ids, partial=False):
+    """Validate pallet fields from a JSON payload.
+
+    Returns ``(values, errors)``; ``errors`` maps field names to Turkish
+    messages. With ``partial`` only the fields present are validated.
+    """
+    values = {}
+    errors = {}
+    if not isinstance(data, dict):
+        return values, {'_': 'Geçersiz palet verisi'}
+
+    for field in PALLET_FIELDS:
+        if field not in data:
+            if not partial:
+                errors[field] = 'Bu alan zorunludur'
+            continue
+        value = data[field]
+        try:
+            if field == 'name':
+                name = str(value or '').strip()
+                if not 1 <= len(name) <= 100:
+                    raise ValueError
+                values[field] = name
+            elif field == 'company_id':
+                company_id = int(value)
+                if company_id not in company_ids:
+                    errors[field] = 'Firma bulunamadı'
+                    continue
+                values[field] = company_id
+            elif field in QUANTITY_FIELDS:
+                quantity = int(value)
+                if quantity < 0 or quantity != Decimal(str(value)):
+                    raise ValueError
+                values[field] = quantity
+            else:
+                values[field] = _parse_decimal(value, positive=field != 'price')
+        except (ValueError, TypeError, InvalidOperation):
+            errors[field] = 'Geçersiz değer'
+    return values, errors
+
+
+def apply_desi(rows):
+    """Calculate desi for a list of value dicts in one batch, in place.
+
+    Returns the indexes of rows whose dimensions could not be calculated.
+    """
+    if not rows:
+        return []
+    columns = {field: [row[field] for row in rows] for field in DIMENSION_FIELDS}
+    volumes = calculate_component_volumes_batch(columns)
+    failed = []
+    for i, row in enumerate(rows):
+        if volumes['error'][i]:
+            failed.append(i)
+            continue
+        for field, column in DESI_COLUMNS.items():
+            row[column] = desi_to_decimal(volumes[field][i])
+    return failed
+
+
+def user_company_ids(user_id):
+    return {company.id for company in user_companies(user_id)}
+
+
+def _chunks(items, size=ID_CHUNK_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def load_user_pallets(user_id, pallet_ids):
+    """Return ``{id: row}`` for the given pallet ids owned by the user, with the dimensions of their spec"""
+    columns = [Pallet.id, Pallet.company_id, Pallet.name, Pallet.price] + \
+        [getattr(PalletSpec, column) for column in DESI_COLUMNS.values()] + \
+        [getattr(PalletSpec, field) for field in DIMENSION_FIELDS]
+    found = {}
+    for chunk in _chunks(sorted(set(pallet_ids))):
+        rows = db.session.execute(
+            select(*columns)
+            .join(Company, Pallet.company_id == Company.id)
+            .join(PalletSpec, Pallet.spec_id == PalletSpec.id)
+            .where(Company.user_id == user_id, Pallet.id.in_(chunk))
+        ).all()
+        found.update((row.id, row) for row in rows)
+    return found
+
+
+def get_user_pallet(pallet_id):
+    return (
+        Pallet.query.join(Company)
+        .filter(Pallet.id == pallet_id, Company.user_id == current_user.id)
+        .first()
+    )
+
+
+def get_user_company(company_id):
+    return Company.query.filter_by(id=company_id, user_id=current_user.id).first()
+
+
+def error_response(message, status, **extra):
+    return jsonify({'message': message, **extra}), status
+
+
+# Companies
+
+@app.route('/api/companies', methods=['GET'])
+@login_required
+def api_list_companies():
+    companies = user_companies(current_user.id)
+    return jsonify([company_to_dict(company) for company in companies])
+
+
+def validate_company_data(data, partial=False):
+    values = {}
+    errors = {}
+    if not isinstance(data, dict):
+        return values, {'_': 'Geçersiz firma verisi'}
+    if 'name' in data or not partial:
+        name = str(data.get('name') or '').strip()
+        if not 2 <= len(name) <= 100:
+            errors['name'] = 'Firma adı 2-100 karakter olmalıdır'
+        values['name'] = name
+    if 'contact_email' in data or not partial:
+        email = str(data.get('contact_email') or '').strip()
+        if '@' not in email or len(email) > 120:
+            errors['contact_email'] = 'Geçerli bir e-posta adresi giriniz'
+        values['contact_email'] = email
+    return values, errors
+
+
+@app.route('/api/companies', methods=['POST'])
+@login_required
+def api_create_company():
+    values, errors = validate_company_data(request.get_json(silent=True))
+    if errors:
+        return error_response(next(iter(errors.values())), 400, errors=errors)
+    try:
+        company = Company(user_id=current_user.id, **values)
+        db.session.add(company)
+        db.session.commit()
+        return jsonify(company_to_dict(company)), 201
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error creating company: {str(e)}")
+        return error_response('Firma kaydedilirken bir hata oluştu', 500)
+
+
+@app.route('/api/companies/<int:company_id>', methods=['GET'])
+@login_required
+def api_get_company(company_id):
+    company = get_user_company(company_id)
+    if not company:
+        return error_response('Firma bulunamadı', 404)
+    return jsonify(company_to_dict(company))
+
+
+@app.route('/api/companies/<int:company_id>', methods=['PUT'])
+@login_required
+def api_update_company(company_id):
+    company = get_user_company(company_id)
+    if not company:
+        return error_response('Firma bulunamadı', 404)
+    values, errors = validate_company_data(request.get_json(silent=True), partial=True)
+    if errors:
+        return error_response(next(iter(errors.values())), 400, errors=errors)
+    try:
+        for field, value in values.items():
+            setattr(company, field, value)
+        db.session.commit()
+        return jsonify(company_to_dict(company))
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error updating company {company_id}: {str(e)}")
+        return error_response('Firma güncellenirken bir hata oluştu', 500)
+
+
+@app.route('/api/companies/<int:company_id>', methods=['DELETE'])
+@login_required
+def api_delete_company(company_id):
+    company = get_user_company(company_id)
+    if not company:
+        return error_response('Firma bulunamadı', 404)
+    try:
+        # Delete the pallets in one statement instead of loading them for the ORM cascade
+        db.session.execute(delete(Pallet).where(Pallet.company_id == company_id))
+        db.session.delete(company)
+        db.session.commit()
+        return jsonify({'message': 'Firma silindi'})
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error deleting company {company_id}: {str(e)}")
+        return error_response('Firma silinirken bir hata oluştu', 500)
+
+
+# Statistics
+
+@app.route('/api/stats/companies', methods=['GET'])
+@login_required
+def api_company_stats():
+    """Pallet count, price and desi totals per company from the stored aggregates"""
+    stats = company_stats(current_user.id)
+    return jsonify({'summary': summarize_stats(stats), 'companies': stats})
+
+
+# Search
+
+@app.route('/api/search/autocomplete', methods=['GET'])
+@login_required
+def api_autocomplete():
+    """Pallet and company names with a word starting with ``q``"""
+    text = (request.args.get('q') or '').strip()
+    try:
+        limit = int(request.args.get('limit') or DEFAULT_SUGGESTIONS)
+    except ValueError:
+        return error_response('Geçersiz limit değeri', 400)
+    limit = max(1, min(limit, MAX_SUGGESTIONS))
+    if not text:
+        return jsonify({'query': text, 'pallets': [], 'companies': []})
+    return jsonify({'query': text, **autocomplete(current_user.id, text, limit)})
+
+
+# Pallets
+
+@app.route('/api/pallets', methods=['GET'])
+@login_required
+def api_list_pallets():
+    """List pallets with the /pallets filters and keyset pagination"""
+    try:
+        filters = parse_pallet_filters(request.args, current_user.id)
+    except FilterError as e:
+        return error_response(str(e), 400)
+    page = paginate_pallets(
+        filtered_pallet_query(filters, current_user.id, columns=LISTING_COLUMNS),
+        sort=filters.sort,
+        after=request.args.get('after'),
+        before=request.args.get('before'),
+        page_size=parse_page_size(request.args.get('per_page'))
+    )
+    return jsonify({
+        'items': [pallet_to_dict(row) for row in page.items],
+        'next_cursor': page.next_cursor,
+        'prev_cursor': page.prev_cursor
+    })
+
+
+@app.route('/api/pallets', methods=['POST'])
+@login_required
+def api_create_pallet():
+    values, errors = validate_pallet_data(request.get_json(silent=True), user_company_ids(current_user.id))
+    if not errors and apply_desi([values]):
+        errors['_'] = 'Desi hesaplanamadı'
+    if errors:
+        return error_response(next(iter(errors.values())), 400, errors=errors)
+    try:
+        assign_specs([values])
+        pallet = Pallet(**pallet_rows([values])[0])
+        db.session.add(pallet)
+        db.session.commit()
+        return jsonify(pallet_to_dict(pallet)), 201
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error creating pallet: {str(e)}")
+        return error_response('Palet kaydedilirken bir hata oluştu', 500)
+
+
+@app.route('/api/pallets/<int:pallet_id>', methods=['GET'])
+@login_required
+def api_get_pallet(pallet_id):
+    pallet = get_user_pallet(pallet_id)
+    if not pallet:
+        return error_response('Palet bulunamadı', 404)
+    return jsonify(pallet_to_dict(pallet))
+
+
+@app.route('/api/pallets/<int:pallet_id>', methods=['PUT'])
+@login_required
+def api_update_pallet(pallet_id):
+    pallet = get_user_pallet(pallet_id)
+    if not pallet:
+        return error_response('Palet bulunamadı', 404)
+    values, errors = validate_pallet_data(
+        request.get_json(silent=True), user_company_ids(current_user.id), partial=True
+    )
+    if not errors:
+        merged = {field: getattr(pallet, field) for field in DIMENSION_FIELDS}
+        merged.update(values)
+        if apply_desi([merged]):
+            errors['_'] = 'Desi hesaplanamadı'
+        values.update(merged)
+    if errors:
+        return error_response(next(iter(errors.values())), 400, errors=errors)
+    try:
+        assign_specs([values])
+        for field, value in pallet_rows([values])[0].items():
+            setattr(pallet, field, value)
+        db.session.commit()
+        return jsonify(pallet_to_dict(pallet))
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error updating pallet {pallet_id}: {str(e)}")
+        return error_response('Palet güncellenirken bir hata oluştu', 500)
+
+
+@app.route('/api/pallets/<int:pallet_id>', methods=['DELETE'])
+@login_required
+def api_delete_pallet(pallet_id):
+    pallet = get_user_pallet(pallet_id)
+    if not pallet:
+        return error_response('Palet bulunamadı', 404)
+    try:
+        db.session.delete(pallet)
+        db.session.commit()
+        return jsonify({'message': 'Palet silindi'})
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error deleting pallet {pallet_id}: {str(e)}")
+        return error_response('Palet silinirken bir hata oluştu', 500)
+
+
+def batch_stats_changes(create_rows, update_rows, delete_ids, existing, owned):
+    """Company stats deltas of a batch; ``existing`` and ``owned`` hold the rows before it"""
+    changes = StatsChanges()
+    changes.add_rows(create_rows)
+    for row in update_rows:
+        before = existing[row['id']]
+        changes.add(before.company_id, before.price, before.total_volume, count=-1)
+        changes.add(row.get('company_id', before.company_id), row.get('price', before.price), row['total_volume'])
+    changes.add_rows([owned[pallet_id] for pallet_id in delete_ids], count=-1)
+    return changes
+
+
+def apply_pallet_batch(user_id, payload):
+    """Validate and apply a batch of pallet creates, updates and deletes.
+
+    All valid operations run in one transaction with executemany-style bulk
+    statements and desi is calculated for all rows in one vectorized call.
+    Returns ``(result, status)`` where ``result`` lists per-item errors; with
+    ``atomic`` set, any error leaves the database untouched.
+    """
+    creates = payload.get('create') or []
+    updates = payload.get('update') or []
+    deletes = payload.get('delete') or []
+    atomic = bool(payload.get('atomic', False))
+    if not all(isinstance(items, list) for items in (creates, updates, deletes)):
+        return {'message': 'create, update ve delete liste olmalıdır'}, 400
+    if max(len(creates), len(updates), len(deletes)) > MAX_BATCH_ITEMS:
+        return {'message': f'Her işlem listesi en fazla {MAX_BATCH_ITEMS} kayıt içerebilir'}, 413
+
+    company_ids = user_company_ids(user_id)
+    errors = []
+
+    # Creates
+    create_rows = []
+    create_indexes = []
+    for index, item in enumerate(creates):
+        values, item_errors = validate_pallet_data(item, company_ids)
+        if item_errors:
+            errors.append({'operation': 'create', 'index': index, 'errors': item_errors})
+            continue
+        create_rows.append(values)
+        create_indexes.append(index)
+
+    # Deletes win over updates of the same pallet in the batch
+    deleted_ids = set()
+    for pallet_id in deletes:
+        try:
+            deleted_ids.add(int(pallet_id))
+        except (TypeError, ValueError):
+            pass
+
+    # Updates: merge with the stored dimensions so desi can be recalculated
+    update_ids = []
+    for item in updates:
+        try:
+            update_ids.append(int(item.get('id')))
+        except (AttributeError, TypeError, ValueError):
+            continue
+    existing = load_user_pallets(user_id, update_ids)
+    update_rows = []
+    update_indexes = []
+    seen = set()
+    for index, item in enumerate(updates):
+        try:
+            pallet_id = int(item.get('id'))
+        except (AttributeError, TypeError, ValueError):
+            errors.append({'operation': 'update', 'index': index, 'errors': {'id': 'Geçersiz kimlik'}})
+            continue
+        if pallet_id in deleted_ids:
+            continue
+        if pallet_id in seen:
+            errors.append({'operation': 'update', 'index': index, 'id': pallet_id,
+                           'errors': {'id': 'Palet bu istekte birden fazla kez güncelleniyor'}})
+            continue
+        seen.add(pallet_id)
+        row = existing.get(pallet_id)
+        if row is None:
+            errors.append({'operation': 'update', 'index': index, 'id': pallet_id,
+                           'errors': {'id': 'Palet bulunamadı'}})
+            continue
+        values, item_errors = validate_pallet_data(
+            {key: value for key, value in item.items() if key != 'id'}, company_ids, partial=True
+        )
+        if item_errors:
+            errors.append({'operation': 'update', 'index': index, 'id': pallet_id, 'errors': item_errors})
+            continue
+        merged = {field: getattr(row, field) for field in DIMENSION_FIELDS}
+        merged.update(values)
+        merged['id'] = pallet_id
+        update_rows.append(merged)
+        update_indexes.append(index)
+
+    # Deletes
+    delete_ids = []
+    requested_deletes = []
+    for index, pallet_id in enumerate(deletes):
+        try:
+            requested_deletes.append((index, int(pallet_id)))
+        except (TypeError, ValueError):
+            errors.append({'operation': 'delete', 'index': index, 'errors': {'id': 'Geçersiz kimlik'}})
+    owned = load_user_pallets(user_id, [pallet_id for _, pallet_id in requested_deletes])
+    seen = set()
+    for index, pallet_id in requested_deletes:
+        if pallet_id in seen:
+            errors.append({'operation': 'delete', 'index': index, 'id': pallet_id,
+                           'errors': {'id': 'Palet bu istekte birden fazla kez siliniyor'}})
+        elif pallet_id in owned:
+            seen.add(pallet_id)
+            delete_ids.append(pallet_id)
+        else:
+            errors.append({'operation': 'delete', 'index': index, 'id': pallet_id,
+                           'errors': {'id': 'Palet bulunamadı'}})
+
+    # Desi for all created and updated rows in one vectorized call each
+    for operation, rows, indexes in (('create', create_rows, create_indexes),
+                                     ('update', update_rows, update_indexes)):
+        failed = set(apply_desi(rows))
+        for i in sorted(failed, reverse=True):
+            errors.append({'operation': operation, 'index': indexes[i], 'errors': {'_': 'Desi hesaplanamadı'}})
+            del rows[i]
+            del indexes[i]
+
+    errors.sort(key=lambda error: (error['operation'], error['index']))
+    if atomic and errors:
+        return {'message': 'Hatalı kayıtlar nedeniyle hiçbir değişiklik uygulanmadı',
+                'created': 0, 'updated': 0, 'deleted': 0, 'errors': errors}, 400
+
+    result = {'created': 0, 'updated': 0, 'deleted': 0, 'errors': errors}
+    try:
+        # The rows keep their dimensions and desi for the stats; the table only gets the spec
+        assign_specs(create_rows + update_rows)
+        if create_rows:
+            statement = insert(Pallet)
+            if db.engine.dialect.insert_executemany_returning:
+                created_ids = db.session.execute(statement.returning(Pallet.id, sort_by_parameter_order=True),
+                                                 pallet_rows(create_rows)).scalars().all()
+                result['created_ids'] = created_ids
+            else:
+                db.session.execute(statement, pallet_rows(create_rows))
+            result['created'] = len(create_rows)
+        if update_rows:
+            db.session.execute(update(Pallet), pallet_rows(update_rows))
+            result['updated'] = len(update_rows)
+        for chunk in _chunks(delete_ids):
+            db.session.execute(delete(Pallet).where(Pallet.id.in_(chunk)))
+        result['deleted'] = len(delete_ids)
+        if create_rows or update_rows or delete_ids:
+            bump_data_version([user_id])
+            apply_stats_changes(batch_stats_changes(create_rows, update_rows, delete_ids, existing, owned))
+            # Without RETURNING the new ids are unknown; their companies are logged instead
+            log_pallet_changes(
+                user_id,
+                pallet_ids=result.get('created_ids', []) + [row['id'] for row in update_rows] + delete_ids,
+                company_ids=[] if 'created_ids' in result else [row['company_id'] for row in create_rows],
+            )
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error applying pallet batch: {str(e)}")
+        return {'message': 'Toplu işlem sırasında bir hata oluştu', 'errors': errors}, 500
+
+    logger.info(
+        f"Pallet batch for user {user_id}: {result['created']} created, {result['updated']} updated, "
+        f"{result['deleted']} deleted, {len(errors)} rejected"
+    )
+    return result, 200
+
+
+@app.route('/api/pallets/reprice', methods=['POST'])
+@login_required
+def api_reprice_pallets():
+    """Preview or apply prices computed from desi, lumber rates, labor and margin.
+
+    Body: ``{"board_rate": 9.5, "block_rate": 12, "labor_per_piece": 1.5, "margin": 20,
+    "round_to": 1, "company_id": null, "dry_run": true, "expected_version": 3}``
+    """
+    payload = request.get_json(silent=True)
+    try:
+        params = parse_repricing_params(payload)
+        company_id = payload.get('company_id')
+        expected_version = payload.get('expected_version')
+        result = reprice(
+            current_user.id, params,
+            company_id=int(company_id) if company_id not in (None, '') else None,
+            dry_run=payload.get('dry_run', True) is not False,
+            expected_version=int(expected_version) if expected_version not in (None, '') else None
+        )
+    except RepricingConflict as e:
+        return error_response(str(e), 409)
+    except RepricingError as e:
+        return error_response(str(e), 400)
+    except (TypeError, ValueError):
+        return error_response('Geçersiz firma veya sürüm', 400)
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error repricing pallets: {str(e)}")
+        return error_response('Fiyatlar güncellenirken bir hata oluştu', 500)
+    return jsonify(result)
+
+
+@app.route('/api/pallets/batch', methods=['POST'])
+@login_required
+def api_pallet_batch():
+    """Create, update and delete many pallets in one request and one transaction.
+
+    Body: ``{"create": [{...}], "update": [{"id": 1, ...}], "delete": [ids], "atomic": false}``
+    """
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        return error_response('Geçersiz JSON verisi', 400)
+    result, status = apply_pallet_batch(current_user.id, payload)
+    return jsonify(result), status
+
+
+# Pallet specs
+
+@app.route('/api/pallet-specs', methods=['GET'])
+@login_required
+def api_pallet_specs():
+    """The user's most used dimension specs with their pallet and company counts"""
+    try:
+        limit = int(request.args.get('limit') or DEFAULT_USAGE_LIMIT)
+    except ValueError:
+        return error_response('Geçersiz limit değeri', 400)
+    return jsonify(spec_usage(current_user.id, max(1, min(limit, MAX_USAGE_LIMIT))))
+
+
+# Similar pallets
+
+def parse_neighbour_count(value):
+    try:
+        k = int(value) if value not in (None, '') else DEFAULT_NEIGHBOURS
+    except (TypeError, ValueError):
+        k = DEFAULT_NEIGHBOURS
+    return max(1, min(k, MAX_NEIGHBOURS))
+
+
+def similar_pallets_response(user_id, vector, k, company_id=None, exclude_id=None):
+    ids, scores = find_similar(user_id, vector, k, company_id, exclude_id)
+    rows = load_user_pallets(user_id, ids)
+    company_names = {company.id: company.name for company in user_companies(user_id)}
+    items = []
+    for pallet_id, score in zip(ids, scores):
+        row = rows.get(pallet_id)
+        if row is None:
+            # Deleted after the index was refreshed
+            continue
+        item = pallet_to_dict(row)
+        item['company_name'] = company_names.get(row.company_id)
+        item['difference_percent'] = round(score * 100, 2)
+        items.append(item)
+    return jsonify({'items': items})
+
+
+@app.route('/api/pallets/similar', methods=['POST'])
+@login_required
+def api_similar_pallets():
+    """The k pallets with the closest dimensions to a spec across the user's companies.
+
+    Body: the 13 dimension fields plus optional ``k``, ``company_id`` and
+    ``exclude_id``. ``difference_percent`` is the similarity score in
+    percent: the root mean square of the differences in the 13 dimensions,
+    each relative to the requested value (see ``similar_pallets``).
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return error_response('Geçersiz JSON verisi', 400)
+    values, errors = validate_pallet_data(
+        {field: data[field] for field in DIMENSION_FIELDS if field in data}, set(), partial=True
+    )
+    errors.update({field: 'Bu alan zorunludur' for field in DIMENSION_FIELDS if field not in data})
+    if errors:
+        return error_response(next(iter(errors.values())), 400, errors=errors)
+    try:
+        company_id, exclude_id = (int(data[key]) if data.get(key) not in (None, '') else None
+                                  for key in ('company_id', 'exclude_id'))
+    except (TypeError, ValueError):
+        return error_response('Geçersiz firma veya palet kimliği', 400)
+    vector = [float(values[field]) for field in DIMENSION_FIELDS]
+    return similar_pallets_response(current_user.id, vector, parse_neighbour_count(data.get('k')),
+                                    company_id, exclude_id)
+
+
+@app.route('/api/pallets/<int:pallet_id>/similar', methods=['GET'])
+@login_required
+def api_pallet_similar(pallet_id):
+    """Pallets with the closest dimensions to a stored pallet, excluding itself"""
+    pallet = load_user_pallets(current_user.id, [pallet_id]).get(pallet_id)
+    if pallet is None:
+        return error_response('Palet bulunamadı', 404)
+    vector = [float(getattr(pallet, field)) for field in DIMENSION_FIELDS]
+    try:
+        company_id = int(request.args['company_id']) if request.args.get('company_id') else None
+    except ValueError:
+        return error_response('Firma bulunamadı', 400)
+    return similar_pallets_response(current_user.id, vector, parse_neighbour_count(request.args.get('k')),
+                                    company_id, exclude_id=pallet_id)
+
+
+# Cutting plans
+
+def plan_user_order(user_id, items, stock_lengths=None, kerf=None, mode='fast'):
+    """Cutting plan for an order of the user's pallets; raises CuttingPlanError"""
+    quantities = parse_order_items(items)
+    pallets = load_user_pallets(user_id, list(quantities))
+    missing = [pallet_id for pallet_id in quantities if pallet_id not in pallets]
+    if missing:
+        raise CuttingPlanError(f"Palet bulunamadı: {', '.join(str(pallet_id) for pallet_id in missing[:10])}")
+    plan = build_cutting_plan(
+        [(pallets[pallet_id], quantity) for pallet_id, quantity in quantities.items()],
+        stock_lengths=parse_stock_lengths(stock_lengths), kerf=parse_kerf(kerf), mode=mode or 'fast'
+    )
+    plan['items'] = [
+        {'pallet_id': pallet_id, 'name': pallets[pallet_id].name, 'quantity': quantity}
+        for pallet_id, quantity in quantities.items()
+    ]
+    return plan
+
+
+@app.route('/api/cutting-plan', methods=['POST'])
+@login_required
+def api_cutting_plan():
+    """Stock boards and cuts for an order.
+
+    Body: ``{"items": [{"pallet_id": 1, "quantity": 500}], "mode": "fast", "stock_lengths": [250, 400], "kerf": 0.4}``
+    """
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        return error_response('Geçersiz JSON verisi', 400)
+    try:
+        plan = plan_user_order(current_user.id, payload.get('items'), payload.get('stock_lengths'),
+                               payload.get('kerf'), payload.get('mode'))
+    except CuttingPlanError as e:
+        return error_response(str(e), 400)
+    return jsonify(plan)
+
+
+# Personnel
+
+EMPLOYEE_UNIQUE_FIELDS = {
+    'national_id': 'Bu TC kimlik numarası ile kayıtlı personel var',
+    'card_number': 'Bu kart numarası başka bir personele ait',
+}
+
+
+def taken_employee_field(values, employee_id=None):
+    """Message for the first unique field in ``values`` another employee of the user has"""
+    for field, message in EMPLOYEE_UNIQUE_FIELDS.items():
+        if not values.get(field):
+            continue
+        query = Employee.query.filter_by(user_id=current_user.id, **{field: values[field]})
+        if employee_id is not None:
+            query = query.filter(Employee.id != employee_id)
+        if query.first() is not None:
+            return message
+    return None
+
+
+@app.route('/api/employees', methods=['GET'])
+@login_required
+def api_list_employees():
+    include_inactive = request.args.get('include_inactive', '1') != '0'
+    return jsonify([employee_to_dict(employee) for employee in user_employees(current_user.id, include_inactive)])
+
+
+@app.route('/api/employees', methods=['POST'])
+@login_required
+def api_create_employee():
+    values, errors = validate_employee_data(request.get_json(silent=True))
+    if errors:
+        return error_response(next(iter(errors.values())), 400, errors=errors)
+    taken = taken_employee_field(values)
+    if taken:
+        return error_response(taken, 409)
+    try:
+        employee = Employee(user_id=current_user.id, **values)
+        db.session.add(employee)
+        db.session.commit()
+        return jsonify(employee_to_dict(employee)), 201
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error creating employee: {str(e)}")
+        return error_response('Personel kaydedilirken bir hata oluştu', 500)
+
+
+@app.route('/api/employees/<int:employee_id>', methods=['GET'])
+@login_required
+def api_get_employee(employee_id):
+    employee = get_user_employee(current_user.id, employee_id)
+    if not employee:
+        return error_response('Personel bulunamadı', 404)
+    return jsonify(employee_to_dict(employee))
+
+
+@app.route('/api/employees/<int:employee_id>', methods=['PUT'])
+@login_required
+def api_update_employee(employee_id):
+    employee = get_user_employee(current_user.id, employee_id)
+    if not employee:
+        return error_response('Personel bulunamadı', 404)
+    values, errors = validate_employee_data(request.get_json(silent=True), partial=True)
+    if errors:
+        return error_response(next(iter(errors.values())), 400, errors=errors)
+    taken = taken_employee_field(values, employee_id)
+    if taken:
+        return error_response(taken, 409)
+    try:
+        for field, value in values.items():
+            setattr(employee, field, value)
+        db.session.commit()
+        return jsonify(employee_to_dict(employee))
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error updating employee {employee_id}: {str(e)}")
+        return error_response('Personel güncellenirken bir hata oluştu', 500)
+
+
+@app.route('/api/employees/<int:employee_id>', methods=['DELETE'])
+@login_required
+def api_delete_employee(employee_id):
+    employee = get_user_employee(current_user.id, employee_id)
+    if not employee:
+        return error_response('Personel bulunamadı', 404)
+    if has_payment_history(employee_id):
+        return error_response('Ödeme geçmişi olan personel silinemez, pasif yapılabilir', 409)
+    try:
+        delete_employee(employee)
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error deleting employee {employee_id}: {str(e)}")
+        return error_response('Personel silinirken bir hata oluştu', 500)
+    return jsonify({'message': 'Personel silindi'})
+
+
+@app.route('/api/employees/<int:employee_id>/payments', methods=['GET'])
+@login_required
+def api_employee_payments(employee_id):
+    """Advances and salary payments of an employee, newest first"""
+    employee = get_user_employee(current_user.id, employee_id)
+    if not employee:
+        return error_response('Personel bulunamadı', 404)
+    return jsonify({'employee': employee_to_dict(employee), 'payments': payment_history(employee_id)})
+
+
+@app.route('/api/attendance', methods=['GET'])
+@login_required
+def api_get_attendance():
+    """Attendance grid of the week containing ``week`` (an ISO date; default: this week)"""
+    try:
+        start = parse_week(request.args.get('week'))
+    except PersonnelError as e:
+        return error_response(str(e), 400)
+    return jsonify(weekly_attendance(current_user.id, start))
+
+
+@app.route('/api/attendance', methods=['PUT'])
+@login_required
+def api_save_attendance():
+    """Store the attendance of one week.
+
+    Body: ``{"week": "2024-11-04", "items": [{"employee_id": 1, "days": [true, true, true, false, true, true]}],
+    "notes": [{"employee_id": 1, "date": "2024-11-07", "note": "Raporlu"}]}``
+    """
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        return error_response('Geçersiz JSON verisi', 400)
+    try:
+        result = save_attendance(current_user.id, parse_week(payload.get('week')),
+                                 payload.get('items') or [], payload.get('notes') or [])
+    except PersonnelConflict as e:
+        return error_response(str(e), 409)
+    except PersonnelError as e:
+        return error_response(str(e), 400)
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error saving attendance: {str(e)}")
+        return error_response('Puantaj kaydedilirken bir hata oluştu', 500)
+    return jsonify(result)
+
+
+@app.route('/api/advances', methods=['GET'])
+@login_required
+def api_list_advances():
+    """Advances paid in the week containing ``week``"""
+    try:
+        start = parse_week(request.args.get('week'))
+    except PersonnelError as e:
+        return error_response(str(e), 400)
+    return jsonify([advance_to_dict(advance) for advance in week_advances(current_user.id, start)])
+
+
+@app.route('/api/advances', methods=['POST'])
+@login_required
+def api_create_advance():
+    """Body: ``{"employee_id": 1, "amount": 500, "date": "2024-11-06", "note": ""}``"""
+    try:
+        advance = add_advance(current_user.id, request.get_json(silent=True))
+    except PersonnelConflict as e:
+        return error_response(str(e), 409)
+    except PersonnelError as e:
+        return error_response(str(e), 400)
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error creating advance: {str(e)}")
+        return error_response('Avans kaydedilirken bir hata oluştu', 500)
+    return jsonify(advance_to_dict(advance)), 201
+
+
+@app.route('/api/advances/<int:advance_id>', methods=['DELETE'])
+@login_required
+def api_delete_advance(advance_id):
+    try:
+        if not delete_advance(current_user.id, advance_id):
+            return error_response('Avans bulunamadı', 404)
+    except PersonnelConflict as e:
+        return error_response(str(e), 409)
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error deleting advance {advance_id}: {str(e)}")
+        return error_response('Avans silinirken bir hata oluştu', 500)
+    return jsonify({'message': 'Avans silindi'})
+
+
+@app.route('/api/payroll', methods=['GET'])
+@login_required
+def api_weekly_payroll():
+    """Pay list of the week containing ``week``: days worked, gross pay, advances and net pay"""
+    try:
+        start = parse_week(request.args.get('week'))
+    except PersonnelError as e:
+        return error_response(str(e), 400)
+    return jsonify(weekly_payroll(current_user.id, start))
+
+
+@app.route('/api/payroll/pay', methods=['POST'])
+@login_required
+def api_pay_week():
+    """Record the pay list of a week as paid. Body: ``{"week": "2024-11-04"}``"""
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        return error_response('Geçersiz JSON verisi', 400)
+    try:
+        result = pay_week(current_user.id, parse_week(payload.get('week')))
+    except PersonnelConflict as e:
+        return error_response(str(e), 409)
+    except PersonnelError as e:
+        return error_response(str(e), 400)
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error paying week: {str(e)}")
+        return error_response('Ödeme kaydedilirken bir hata oluştu', 500)
+    return jsonify(result)
@@ -6,6 +6,7 @@ from sqlalchemy.orm import DeclarativeBase
 from flask_login import LoginManager
 import pymysql
 import sys
+from db_metrics import InstrumentedQueuePool, instrument_engine
 
 # Configure logging
 logging.basicConfig(
@@ -24,6 +25,29 @@ class Base(DeclarativeBase):
 db = SQLAlchemy(model_class=Base)
 login_manager = LoginManager()
 
+def engine_options(database_url):
+    """Connection pool settings from the environment.
+
+    ``DB_POOL_TIMEOUT`` is how long a request waits for a free connection
+    before failing; keep it short so a saturated pool fails fast.
+    """
+    options = {
+        "pool_pre_ping": os.environ.get("DB_POOL_PRE_PING", "1") != "0",
+        "pool_recycle": int(os.environ.get("DB_POOL_RECYCLE", "300")),
+    }
+    if database_url.startswith("sqlite") and (database_url == "sqlite://" or ":memory:" in database_url):
+        # In-memory SQLite uses a single shared connection, no queue to size
+        return options
+    options.update({
+        "poolclass": InstrumentedQueuePool,
+        "pool_size": int(os.environ.get("DB_POOL_SIZE", "10")),
+        "max_overflow": int(os.environ.get("DB_MAX_OVERFLOW", "5")),
+        # Whole seconds: Flask-SQLAlchemy passes the options through engine_from_config, which casts to int
+        "pool_timeout": int(os.environ.get("DB_POOL_TIMEOUT", "10")),
+        "pool_use_lifo": os.environ.get("DB_POOL_USE_LIFO", "0") == "1",
+    })
+    return options
+
 def create_app():
     app = Flask(__name__)
     
@@ -53,13 +77,7 @@ def create_app():
         
         # MySQL specific configuration
         app.config["SQLALCHEMY_DATABASE_URI"] = DATABASE_URL
-        app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
-            "pool_pre_ping": True,
-            "pool_recycle": 300,
-            "pool_timeout": 900,
-            "pool_size": 10,
-            "max_overflow": 5
-        }
+        app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(DATABASE_URL)
         app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 
         # Initialize extensions with app
@@ -80,8 +98,8 @@ app = create_app()
 
 @login_manager.user_loader
 def load_user(user_id):
-    from models import User
-    return User.query.get(int(user_id))
+    from cache import cached_user
+    return cached_user(int(user_id))
 
 # Error handlers
 @app.errorhandler(403)
@@ -113,24 +131,24 @@ def shutdown_session(exception=None):
     except:
         pass
 
-# Initialize database and import routes
+# Register models, hooks, routes and CLI commands. Nothing here touches the
+# database: tables are created with "flask --app main init-db" and sample data
+# is loaded with "flask --app main seed" (see cli.py).
 with app.app_context():
     try:
+        instrument_engine(db.engine)
         import models
-        db.create_all()
-        logger.info("Database tables created successfully")
-        
-        # Import routes after db initialization
+        import data_version  # Registers the data version hooks
+        import company_stats  # Registers the company stats hooks
+        import similar_pallets  # Registers the pallet change log hook
+        import cache  # Registers the cache invalidation hooks
         import auth  # Import authentication routes
+        import api  # JSON API routes
         from routes import *  # Import other routes
-        
-        # Only seed data if tables are empty
-        from models import User
-        if not User.query.first():
-            from seed_data import seed_data
-            seed_data()
-            logger.info("Initial data seeding completed")
-            
+        import request_metrics  # Request metrics, /metrics and the profiler
+        import compression  # Gzip/Brotli response compression middleware
+        import assets  # Fingerprinted static URLs and precompressed files
+        import cli  # Maintenance commands
     except Exception as e:
-        logger.error(f"Error during database initialization: {str(e)}")
+        logger.error(f"Error during application initialization: {str(e)}")
         raise
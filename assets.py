@@ -0,0 +1,246 @@
+"""Fingerprinted static files, long-lived caching and precompressed variants.
+
+``flask --app main build-assets`` copies every file under ``static`` to
+``static/dist`` with a content hash in its name, writes ``.gz`` (and with
+the ``brotli`` package ``.br``) files next to the text assets and renders
+the images in ``IMAGE_VARIANTS`` in a few widths as WebP and JPEG (PNG for
+the icon). ``static/dist/manifest.json`` maps the original names to the
+built ones.
+
+At runtime ``url_for('static', filename=...)`` returns the hashed URL of
+every file in the manifest. Hashed files never change, so they are served
+with a one-year ``immutable`` Cache-Control and repeat visits do not request
+them at all; text files are sent as the precompressed file the client
+accepts. Without a build (development) URLs and caching stay as they are.
+When the manifest is loaded, entries whose source file changed since the
+build are dropped, so an edited file is served from ``static`` (with a
+warning to re-run ``build-assets``) instead of as its old hashed copy.
+"""
+from flask import request, send_from_directory, url_for
+from werkzeug.http import parse_accept_header
+from app import app
+from compression import COMPRESSION_MIN_SIZE, brotli
+import gzip
+import hashlib
+import io
+import json
+import logging
+import mimetypes
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+DIST_DIR = os.path.join(app.static_folder, 'dist')
+MANIFEST_PATH = os.path.join(DIST_DIR, 'manifest.json')
+HASH_LENGTH = 12
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+PRECOMPRESSED_EXTENSIONS = {'.css', '.js', '.json', '.svg', '.txt', '.map'}
+
+# Logical name -> (source relative to the project, widths in px, formats)
+IMAGE_VARIANTS = {
+    # Dashboard tiles are at least 300 px wide; 800 px covers high density screens
+    'images/pallet.jpg': ('static/images/pallet.jpg', (400, 800), ('webp', 'jpeg')),
+    'images/staff.jpg': ('static/images/staff.jpg', (400, 800), ('webp', 'jpeg')),
+    'images/accounting.jpg': ('static/images/accounting.jpg', (400, 800), ('webp', 'jpeg')),
+    # Favicon and home screen icon from the 1024 px project icon
+    'images/icon.png': ('generated-icon.png', (32, 180), ('png',)),
+}
+IMAGE_FORMATS = {
+    'webp': ('WEBP', '.webp', {'quality': 75, 'method': 6}),
+    'jpeg': ('JPEG', '.jpg', {'quality': 80, 'optimize': True, 'progressive': True}),
+    'png': ('PNG', '.png', {'optimize': True}),
+}
+
+
+def load_manifest(path=MANIFEST_PATH):
+    try:
+        with open(path, encoding='utf-8') as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return {'files': {}, 'images': {}}
+    except (OSError, ValueError) as e:
+        logger.error(f"Error reading asset manifest {path}: {str(e)}")
+        return {'files': {}, 'images': {}}
+    _drop_stale_files(manifest)
+    manifest['loaded_at'] = time.time()
+    logger.info(f"Loaded asset manifest with {len(manifest['files'])} files")
+    return manifest
+
+
+def _drop_stale_files(manifest):
+    """Remove manifest entries whose source no longer hashes to the built name"""
+    stale = []
+    for name, built in list(manifest['files'].items()):
+        try:
+            with open(os.path.join(app.static_folder, name), 'rb') as f:
+                current = hashed_name(name, f.read())
+        except OSError:
+            current = None
+        if current != built:
+            stale.append(name)
+            del manifest['files'][name]
+    if stale:
+        logger.warning(f"Static files changed since the last build-assets and are served unhashed: "
+                       f"{', '.join(stale)}")
+
+
+def hashed_name(name, data):
+    """``css/custom.css`` -> ``css/custom.<first 12 hex digits of SHA-256>.css``"""
+    root, extension = os.path.splitext(name)
+    return f'{root}.{hashlib.sha256(data).hexdigest()[:HASH_LENGTH]}{extension}'
+
+
+_manifest = load_manifest()
+
+
+def _write(name, data):
+    """Write a built file; existing files are kept, their name is their content"""
+    path = os.path.join(DIST_DIR, name)
+    if os.path.exists(path):
+        return False
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary = f'{path}.{os.getpid()}.tmp'
+    with open(temporary, 'wb') as f:
+        f.write(data)
+    os.replace(temporary, path)
+    return True
+
+
+def _build_file(name, data, stats):
+    built = hashed_name(name, data)
+    stats['written'] += _write(built, data)
+    if os.path.splitext(name)[1] in PRECOMPRESSED_EXTENSIONS and len(data) >= COMPRESSION_MIN_SIZE:
+        stats['written'] += _write(built + '.gz', gzip.compress(data, 9, mtime=0))
+        if brotli is not None:
+            stats['written'] += _write(built + '.br', brotli.compress(data, quality=11))
+    return built
+
+
+def _build_image(name, source, widths, formats, stats):
+    from PIL import Image, ImageOps
+
+    variants = []
+    with Image.open(source) as image:
+        image = ImageOps.exif_transpose(image)
+        for width in sorted({min(width, image.width) for width in widths}):
+            height = round(image.height * width / image.width)
+            resized = image.resize((width, height), Image.Resampling.LANCZOS, reducing_gap=3.0)
+            variant = {'width': width, 'height': height}
+            for image_format in formats:
+                pil_format, extension, options = IMAGE_FORMATS[image_format]
+                buffer = io.BytesIO()
+                (resized.convert('RGB') if image_format == 'jpeg' else resized).save(buffer, pil_format, **options)
+                root = os.path.splitext(name)[0]
+                variant[image_format] = _build_file(f'{root}-{width}{extension}', buffer.getvalue(), stats)
+            variants.append(variant)
+    stats['images'] += 1
+    return variants
+
+
+def build_assets():
+    """Build ``static/dist`` and its manifest; returns counts of what was built"""
+    manifest = {'files': {}, 'images': {}}
+    stats = {'files': 0, 'images': 0, 'written': 0, 'missing': []}
+    static_dir = app.static_folder
+    for directory, subdirectories, filenames in os.walk(static_dir):
+        subdirectories[:] = sorted(name for name in subdirectories if os.path.join(directory, name) != DIST_DIR)
+        for filename in sorted(filenames):
+            path = os.path.join(directory, filename)
+            name = os.path.relpath(path, static_dir).replace(os.sep, '/')
+            with open(path, 'rb') as f:
+                manifest['files'][name] = _build_file(name, f.read(), stats)
+            stats['files'] += 1
+
+    for name, (source, widths, formats) in IMAGE_VARIANTS.items():
+        source = os.path.join(ROOT, source)
+        if not os.path.isfile(source):
+            stats['missing'].append(name)
+            continue
+        manifest['images'][name] = _build_image(name, source, widths, formats, stats)
+
+    _write_manifest(manifest)
+    logger.info(f"Built {stats['files']} static files and {stats['images']} images, "
+                f"{stats['written']} new files in {DIST_DIR}")
+    return stats
+
+
+def _write_manifest(manifest):
+    os.makedirs(DIST_DIR, exist_ok=True)
+    temporary = f'{MANIFEST_PATH}.{os.getpid()}.tmp'
+    with open(temporary, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(temporary, MANIFEST_PATH)
+
+
+@app.url_defaults
+def _hashed_static_url(endpoint, values):
+    """Point ``url_for('static', ...)`` at the built file when there is one"""
+    if endpoint == 'static':
+        name = values.get('filename')
+        built = _manifest['files'].get(name)
+        if built and app.debug and _edited_since_load(name):
+            # The reloader only watches Python files; an edit while running must still show up
+            logger.warning(f"Static file {name} changed since the manifest was loaded and is served unhashed")
+            _manifest['files'].pop(name, None)
+            built = None
+        if built:
+            values['filename'] = f'dist/{built}'
+
+
+def _edited_since_load(name):
+    try:
+        return os.path.getmtime(os.path.join(app.static_folder, name)) > _manifest.get('loaded_at', 0)
+    except OSError:
+        return True
+
+
+@app.template_global()
+def image_variants(name):
+    """Built widths of an image with the URL of every format, smallest first; empty without a build"""
+    return [
+        {key: url_for('static', filename=f'dist/{value}') if key in IMAGE_FORMATS else value
+         for key, value in variant.items()}
+        for variant in _manifest['images'].get(name, [])
+    ]
+
+
+def serve_static(filename):
+    """Static files; built files with an immutable Cache-Control and precompressed if accepted"""
+    if not filename.startswith('dist/'):
+        return app.send_static_file(filename)
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    accepted = parse_accept_header(request.headers.get('Accept-Encoding'))
+    response = None
+    for encoding, extension in (('br', '.br'), ('gzip', '.gz')):
+        if accepted.quality(encoding) and os.path.isfile(os.path.join(app.static_folder, filename + extension)):
+            response = send_from_directory(app.static_folder, filename + extension, mimetype=mimetype,
+                                           max_age=IMMUTABLE_MAX_AGE)
+            response.headers['Content-Encoding'] = encoding
+            break
+    if response is None:
+        response = send_from_directory(app.static_folder, filename, mimetype=mimetype, max_age=IMMUTABLE_MAX_AGE)
+    if os.path.splitext(filename)[1] in PRECOMPRESSED_EXTENSIONS:
+        response.vary.add('Accept-Encoding')
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+class StaticSessionInterface(type(app.session_interface)):
+    """Leaves the session alone on hashed static files.
+
+    Reading the session (Flask-Login does on every request) adds
+    ``Vary: Cookie``, so every new session cookie, e.g. after a flash
+    message, would miss the browser cache of all static files.
+    """
+
+    def save_session(self, app, session, response):
+        if request.endpoint == 'static' and request.view_args.get('filename', '').startswith('dist/'):
+            return
+        super().save_session(app, session, response)
+
+
+app.view_functions['static'] = serve_static
+app.session_interface = StaticSessionInterface()
@@ -0,0 +1,239 @@
+"""Streaming import of time clock punch logs into the attendance table.
+
+A log line holds the employee's number on the device and the punch time,
+separated by ``;``, ``,``, a tab or plain spaces; further columns (device,
+direction, ...) are ignored::
+
+    00012;2024-11-04 07:58:12;1
+    00012;04.11.2024 17:31;2
+
+Punches are collapsed to the days an employee was present and merged into
+the weekly attendance masks: a day is only ever added, so importing the same
+log again changes nothing and days entered by hand are kept. The file is
+read line by line and the collected weeks are written in chunks with the
+bulk upsert of the personnel module, one commit per chunk.
+"""
+from app import db
+from models import Employee
+from personnel import (
+    PersonnelError, WORK_DAYS, attendance_masks, paid_weeks, upsert_attendance_weeks, week_days, week_start,
+)
+from sqlalchemy import select
+from collections import Counter
+from datetime import date
+import io
+import logging
+import re
+import time
+
+logger = logging.getLogger(__name__)
+
+# Employee weeks collected before they are written
+DEFAULT_CHUNK_SIZE = 2000
+# Problem rows beyond this are counted but not listed in the report
+MAX_REPORTED_ROWS = 1000
+
+# Employee field the numbers in the log are matched against
+MATCH_FIELDS = {
+    'card_number': Employee.card_number,
+    'national_id': Employee.national_id,
+    'id': Employee.id,
+}
+
+# 2024-11-04, 2024/11/04 or 04.11.2024, 04/11/2024
+DATE_PATTERN = re.compile(r'^(?:(\d{4})[-/.](\d{1,2})[-/.](\d{1,2})|(\d{1,2})[-/.](\d{1,2})[-/.](\d{4}))')
+
+
+class AttendanceImportError(PersonnelError):
+    """Raised when a log cannot be imported at all (as opposed to single lines)"""
+
+
+def normalize_key(value):
+    """Devices pad card numbers with zeros: ``00012`` and ``12`` are the same card"""
+    value = value.strip().strip('"').strip().upper()
+    if value.isdigit():
+        return value.lstrip('0') or '0'
+    return value
+
+
+def parse_punch_date(value, cache):
+    """The day of a timestamp cell, ``None`` when it is not a date"""
+    token = value.strip().strip('"').split(maxsplit=1)[0].split('T', 1)[0] if value.strip() else ''
+    try:
+        return cache[token]
+    except KeyError:
+        pass
+    day = None
+    match = DATE_PATTERN.match(token)
+    if match:
+        year, month, dom = match.group(1, 2, 3) if match.group(1) else match.group(6, 5, 4)
+        try:
+            day = date(int(year), int(month), int(dom))
+        except ValueError:
+            pass
+    cache[token] = day
+    return day
+
+
+def load_employee_keys(user_id, match):
+    """``{normalized number: (id, start_date)}`` of the user's employees and the numbers shared by several"""
+    column = MATCH_FIELDS[match]
+    employees = {}
+    ambiguous = set()
+    rows = db.session.execute(
+        select(column, Employee.id, Employee.start_date).where(Employee.user_id == user_id, column.isnot(None))
+    )
+    for number, employee_id, start_date in rows:
+        key = normalize_key(str(number))
+        if key in employees:
+            ambiguous.add(key)
+        employees[key] = (employee_id, start_date)
+    return employees, ambiguous
+
+
+def _open_text(stream):
+    if isinstance(stream, io.TextIOBase):
+        return stream
+    # Device exports are not always clean UTF-8; a bad byte only spoils one line
+    return io.TextIOWrapper(stream, encoding='utf-8-sig', errors='replace', newline='')
+
+
+def import_attendance_log(stream, user_id, match='card_number', chunk_size=DEFAULT_CHUNK_SIZE, progress=None,
+                          dry_run=False):
+    """Import the punches of a time clock log for ``user_id`` from a file object.
+
+    ``match`` names the employee field the numbers in the log are compared
+    with. Punches of unknown numbers are counted per number; punches that
+    cannot be recorded (Sunday, a day before the employee started, a future
+    day or a week whose pay is already recorded) are reported as conflicts
+    once per employee and day. ``progress`` is called with the running stats
+    after every chunk. Returns the stats dict.
+    """
+    if match not in MATCH_FIELDS:
+        raise AttendanceImportError(f'Geçersiz eşleştirme alanı: {match}')
+    text = _open_text(stream)
+    employees, ambiguous = load_employee_keys(user_id, match)
+    numbers = {employee_id: key for key, (employee_id, _) in employees.items()}
+    today = date.today()
+
+    stats = {
+        'match': match, 'lines': 0, 'punches': 0, 'days': 0, 'weeks_created': 0, 'weeks_updated': 0,
+        'invalid': 0, 'invalid_rows': [], 'unknown_punches': 0, 'unknown_employees': [],
+        'conflicts': 0, 'conflict_rows': [], 'chunks': 0,
+    }
+    started = time.perf_counter()
+    unknown = Counter()
+    dates = {}
+    conflicts = set()
+    # Employee weeks written by this import: {(employee_id, week_start): days}
+    recorded = {}
+    pending = {}
+    # Line of the first punch of every pending (employee_id, day), for the report
+    first_lines = {}
+
+    def invalid(line, message):
+        stats['invalid'] += 1
+        if len(stats['invalid_rows']) < MAX_REPORTED_ROWS:
+            stats['invalid_rows'].append({'line': line, 'message': message})
+
+    def conflict(line, key, employee_id, day, message):
+        if (employee_id, day) in conflicts:
+            return
+        conflicts.add((employee_id, day))
+        stats['conflicts'] += 1
+        if len(stats['conflict_rows']) < MAX_REPORTED_ROWS:
+            stats['conflict_rows'].append({'line': line, 'employee': key, 'date': day.isoformat(), 'message': message})
+
+    def flush():
+        keys = list(pending)
+        try:
+            stored = attendance_masks(user_id, keys)
+            paid = paid_weeks(user_id, keys)
+            rows = []
+            for week_key, days in pending.items():
+                old = stored.get(week_key, 0) | recorded.get(week_key, 0)
+                added = days & ~old
+                if not added:
+                    continue
+                employee_id, start = week_key
+                if week_key in paid:
+                    for index, day in enumerate(week_days(start)):
+                        if added >> index & 1:
+                            conflict(first_lines[employee_id, day], numbers[employee_id], employee_id, day,
+                                     'Bu haftanın ödemesi yapılmış')
+                    continue
+                if week_key not in recorded:
+                    stats['weeks_created' if week_key not in stored else 'weeks_updated'] += 1
+                recorded[week_key] = old | days
+                stats['days'] += bin(added).count('1')
+                rows.append({'employee_id': employee_id, 'week_start': start, 'days': old | days})
+            if rows and not dry_run:
+                upsert_attendance_weeks(user_id, rows, existing=set(stored))
+                db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error importing attendance chunk at line {stats['lines']}: {str(e)}")
+            raise
+        pending.clear()
+        first_lines.clear()
+        stats['chunks'] += 1
+        logger.info(f"Attendance import: {stats['lines']} lines read, {stats['days']} days recorded, "
+                    f"{stats['conflicts']} conflicts")
+        if progress:
+            progress(stats)
+
+    delimiter = None
+    for line, raw in enumerate(text, start=1):
+        if not raw.strip():
+            continue
+        stats['lines'] += 1
+        if delimiter is None:
+            # First line decides: ';' from Turkish spreadsheets, ',' or tab, otherwise spaces
+            delimiter = max(';,\t', key=raw.count)
+            if not raw.count(delimiter):
+                delimiter = ''
+        cells = raw.split(delimiter) if delimiter else raw.split()
+        day = parse_punch_date(cells[1], dates) if len(cells) > 1 else None
+        if day is None:
+            if stats['lines'] > 1:
+                invalid(line, 'Satır "numara, tarih saat" biçiminde değil')
+            continue
+        key = normalize_key(cells[0])
+        if not key:
+            invalid(line, 'Personel numarası boş')
+            continue
+        stats['punches'] += 1
+        employee = employees.get(key)
+        if employee is None:
+            stats['unknown_punches'] += 1
+            unknown[key] += 1
+            continue
+        employee_id, start_date = employee
+        if key in ambiguous:
+            conflict(line, key, key, day, 'Numara birden fazla personelle eşleşiyor')
+        elif day.weekday() >= WORK_DAYS:
+            conflict(line, key, employee_id, day, 'Pazar günleri puantajda yer almıyor')
+        elif day > today:
+            conflict(line, key, employee_id, day, 'İleri tarihli kayıt')
+        elif day < start_date:
+            conflict(line, key, employee_id, day, 'İşe başlama tarihinden önce')
+        else:
+            week_key = (employee_id, week_start(day))
+            days = pending.get(week_key, 0)
+            bit = 1 << day.weekday()
+            if not days & bit:
+                first_lines[employee_id, day] = line
+                pending[week_key] = days | bit
+            if len(pending) >= chunk_size:
+                flush()
+    if pending:
+        flush()
+    if not stats['lines']:
+        raise AttendanceImportError('Dosya boş')
+
+    stats['unknown_employees'] = [{'employee': key, 'punches': count}
+                                  for key, count in unknown.most_common(MAX_REPORTED_ROWS)]
+    stats['seconds'] = round(time.perf_counter() - started, 3)
+    logger.info(f"Attendance import finished in {stats['seconds']} s: {stats['days']} days recorded, "
+                f"{stats['unknown_punches']} punches of unknown employees, {stats['conflicts']} conflicts")
+    return stats
@@ -2,7 +2,10 @@ from flask import render_template, redirect, url_for, flash, request
 from flask_login import login_user, logout_user, login_required, current_user
 from app import app, db
 from models import User
-from werkzeug.security import check_password_hash
+from passwords import PasswordHasherBusy, hash_password_bounded, needs_rehash, verify_password_bounded
+import logging
+
+logger = logging.getLogger(__name__)
 
 @app.route('/login', methods=['GET', 'POST'])
 def login():
@@ -15,7 +18,14 @@ def login():
         remember = bool(request.form.get('remember'))
         
         user = User.query.filter_by(username=username).first()
-        if user and user.check_password(password):
+        try:
+            valid = verify_password_bounded(user.password_hash if user else None, password or '')
+        except PasswordHasherBusy:
+            flash('Sistem şu anda yoğun. Lütfen birkaç saniye sonra tekrar deneyin.', 'warning')
+            return render_template('login.html'), 503
+        if valid:
+            if needs_rehash(user.password_hash):
+                upgrade_password_hash(user, password)
             login_user(user, remember=remember)
             next_page = request.args.get('next')
             return redirect(next_page if next_page else url_for('dashboard'))
@@ -23,6 +33,18 @@ def login():
     
     return render_template('login.html')
 
+def upgrade_password_hash(user, password):
+    """Re-hash a password stored with old parameters; failures only postpone the upgrade"""
+    try:
+        user.password_hash = hash_password_bounded(password)
+        db.session.commit()
+        logger.info(f"Upgraded password hash of user {user.id}")
+    except PasswordHasherBusy:
+        db.session.rollback()
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error upgrading password hash of user {user.id}: {str(e)}")
+
 @app.route('/logout')
 @login_required
 def logout():
@@ -53,7 +75,11 @@ def register():
             return render_template('register.html')
         
         user = User(username=username, email=email)
-        user.set_password(password)
+        try:
+            user.password_hash = hash_password_bounded(password)
+        except PasswordHasherBusy:
+            flash('Sistem şu anda yoğun. Lütfen birkaç saniye sonra tekrar deneyin.', 'warning')
+            return render_template('register.html'), 503
         
         try:
             db.session.add(user)
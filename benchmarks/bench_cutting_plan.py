@@ -0,0 +1,74 @@
+"""Time of both cutting plan modes for orders with many distinct pallets.
+
+Every order holds about ``--pieces`` pieces spread over N pallets with random
+lengths, so the number of distinct piece lengths per profile grows with N.
+No database is needed. Usage::
+
+    python benchmarks/bench_cutting_plan.py
+    python benchmarks/bench_cutting_plan.py --pallets 30 100 --pieces 10000 --json results.json
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from types import SimpleNamespace
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+DEFAULT_PALLETS = (10, 30, 50, 100)
+# Pieces of one pallet: 5 upper, 3 lower and 3 closure boards and 9 blocks
+PIECES_PER_PALLET = 20
+
+
+def synthetic_order(pallets, pieces, seed=1):
+    """``(pallet, quantity)`` pairs with random lengths on a few shared profiles"""
+    rng = random.Random(seed)
+    quantity = max(pieces // (pallets * PIECES_PER_PALLET), 1)
+    order = []
+    for _ in range(pallets):
+        pallet = SimpleNamespace(
+            board_thickness=rng.choice((2.0, 2.2)),
+            upper_board_length=rng.randrange(160, 281) / 2, upper_board_width=10, upper_board_quantity=5,
+            lower_board_length=rng.randrange(160, 281) / 2, lower_board_width=10, lower_board_quantity=3,
+            closure_length=rng.randrange(120, 241) / 2, closure_width=rng.choice((8, 10)), closure_quantity=3,
+            block_length=rng.randrange(16, 31) / 2, block_width=10, block_height=rng.choice((8, 10)),
+        )
+        order.append((pallet, quantity))
+    return order
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pallets', type=int, nargs='+', default=DEFAULT_PALLETS,
+                        help='distinct pallets per order')
+    parser.add_argument('--pieces', type=int, default=10000, help='pieces per order')
+    parser.add_argument('--json', help='write the results to this file')
+    args = parser.parse_args()
+
+    from cutting_plan import MODES, build_cutting_plan
+
+    results = []
+    print(f"{'pallets':>8}{'pieces':>9}{'mode':>9}{'seconds':>10}{'boards':>9}{'waste %':>9}")
+    for pallets in args.pallets:
+        order = synthetic_order(pallets, args.pieces)
+        for mode in MODES:
+            started = time.perf_counter()
+            plan = build_cutting_plan(order, mode=mode)
+            seconds = time.perf_counter() - started
+            totals = plan['totals']
+            results.append({'pallets': pallets, 'pieces': totals['piece_count'], 'mode': mode,
+                            'seconds': round(seconds, 4), 'boards': totals['board_count'],
+                            'waste_percent': totals['waste_percent']})
+            print(f"{pallets:>8}{totals['piece_count']:>9}{mode:>9}{seconds:>10.3f}"
+                  f"{totals['board_count']:>9}{totals['waste_percent']:>9.2f}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
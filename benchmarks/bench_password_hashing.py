@@ -0,0 +1,73 @@
+"""Logins per second per core for password hashing settings.
+
+Measures ``verify_password`` (the work done by a login) for each method, first
+on one thread and then on the bounded hashing pool with every core busy.
+Usage::
+
+    python benchmarks/bench_password_hashing.py
+    python benchmarks/bench_password_hashing.py --methods scrypt pbkdf2:sha256:600000 --seconds 5
+"""
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from passwords import hash_password, method_prefix, verify_password  # noqa: E402
+
+DEFAULT_METHODS = ('scrypt', 'scrypt:16384:8:1', 'pbkdf2:sha256:1000000', 'pbkdf2:sha256:600000')
+
+
+def measure(method, seconds, threads):
+    """Return the number of verifications per second with ``threads`` threads"""
+    pwhash = hash_password('benchmark-password', method=method)
+    deadline = time.perf_counter() + seconds
+
+    def work():
+        count = 0
+        while time.perf_counter() < deadline:
+            verify_password(pwhash, 'benchmark-password')
+            count += 1
+        return count
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        total = sum(pool.map(lambda _: work(), range(threads)))
+    return total / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--methods', nargs='+', default=list(DEFAULT_METHODS))
+    parser.add_argument('--seconds', type=float, default=3.0, help='duration of every measurement')
+    parser.add_argument('--threads', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--json', help='write the results to this file')
+    args = parser.parse_args()
+
+    results = []
+    print(f"{'method':<28}{'ms/login':>10}{'logins/s/core':>15}{f'logins/s x{args.threads}':>16}")
+    for method in args.methods:
+        single = measure(method, args.seconds, 1)
+        parallel = measure(method, args.seconds, args.threads)
+        result = {
+            'method': method_prefix(method),
+            'ms_per_login': round(1000 / single, 2),
+            'logins_per_second_per_core': round(single, 1),
+            'threads': args.threads,
+            'logins_per_second': round(parallel, 1),
+        }
+        results.append(result)
+        print(f"{result['method']:<28}{result['ms_per_login']:>10.1f}"
+              f"{result['logins_per_second_per_core']:>15.1f}{result['logins_per_second']:>16.1f}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
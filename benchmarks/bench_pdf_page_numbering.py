@@ -0,0 +1,100 @@
+"""Peak memory and time of the PDF export for both page numbering modes.
+
+Every measurement runs in its own child process so ``ru_maxrss`` reflects a
+single export. Usage::
+
+    python benchmarks/bench_pdf_page_numbering.py
+    python benchmarks/bench_pdf_page_numbering.py --rows 100 1000 --json results.json
+"""
+import argparse
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+DEFAULT_ROWS = (100, 1000, 10000)
+MODES = ('deferred', 'placeholder')
+
+
+def synthetic_pallets(count):
+    """Export rows shaped like ``EXPORT_COLUMNS`` without touching a database"""
+    return [
+        {
+            'id': i,
+            'name': f'Palet {i:06d}',
+            'company_name': f'Firma {i % 50}',
+            'price': 250 + i % 100,
+            'total_volume': 35.4,
+            'board_thickness': 2.2,
+            'upper_board_length': 120, 'upper_board_width': 10, 'upper_board_quantity': 5,
+            'lower_board_length': 120, 'lower_board_width': 10, 'lower_board_quantity': 3,
+            'closure_length': 80, 'closure_width': 10, 'closure_quantity': 3,
+            'block_length': 10, 'block_width': 10, 'block_height': 10,
+        }
+        for i in range(count)
+    ]
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def run_child(mode, rows):
+    from pdf_export import build_pallets_pdf
+
+    pallets = synthetic_pallets(rows)
+    baseline = peak_rss_mb()
+    buffer = io.BytesIO()
+    started = time.perf_counter()
+    build_pallets_pdf(buffer, pallets, page_numbering=mode)
+    seconds = time.perf_counter() - started
+    print(json.dumps({
+        'mode': mode,
+        'rows': rows,
+        'seconds': round(seconds, 3),
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+        'baseline_rss_mb': round(baseline, 1),
+        'pdf_bytes': buffer.getbuffer().nbytes,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=list(DEFAULT_ROWS))
+    parser.add_argument('--modes', nargs='+', default=list(MODES), choices=MODES)
+    parser.add_argument('--json', help='write the results to this file')
+    parser.add_argument('--child', nargs=2, metavar=('MODE', 'ROWS'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child[0], int(args.child[1]))
+        return
+
+    results = []
+    print(f"{'mode':<12}{'rows':>8}{'seconds':>10}{'peak MB':>10}{'PDF KB':>10}")
+    for rows in args.rows:
+        for mode in args.modes:
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '--child', mode, str(rows)],
+                check=True, capture_output=True, text=True
+            ).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            results.append(result)
+            print(f"{mode:<12}{rows:>8}{result['seconds']:>10.2f}{result['peak_rss_mb']:>10.1f}"
+                  f"{result['pdf_bytes'] / 1024:>10.0f}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
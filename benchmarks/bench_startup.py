@@ -0,0 +1,106 @@
+"""Worker startup time: importing the app and serving the first request.
+
+Every run is a fresh interpreter, like a new worker. Usage::
+
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --runs 10 --importtime --json startup.json
+
+``DATABASE_URL`` defaults to an empty SQLite file; the first request
+(``GET /login``) does not need any tables.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_child():
+    started = time.perf_counter()
+    import app
+    imported = time.perf_counter()
+    response = app.app.test_client().get('/login')
+    served = time.perf_counter()
+    heavy = [name for name in ('reportlab', 'pdf_export', 'pallet_import', 'numpy') if name in sys.modules]
+    print(json.dumps({
+        'import_ms': round((imported - started) * 1000, 1),
+        'first_request_ms': round((served - imported) * 1000, 1),
+        'status': response.status_code,
+        'loaded': heavy,
+    }))
+
+
+def child_env():
+    env = dict(os.environ)
+    env.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.gettempdir(), 'palet_bench_startup.db'))
+    env['PYTHONPATH'] = ROOT + os.pathsep + env.get('PYTHONPATH', '')
+    return env
+
+
+def slowest_imports(count):
+    """Return the modules with the largest cumulative import time (``-X importtime``)"""
+    output = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import app'],
+        env=child_env(), capture_output=True, text=True, check=True
+    ).stderr
+    timings = []
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = (part.strip() for part in line[len('import time:'):].split('|'))
+        if not name.startswith(' ') and '.' not in name.strip():
+            timings.append((int(cumulative) / 1000, name.strip()))
+    return sorted(timings, reverse=True)[:count]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--importtime', action='store_true', help='also list the slowest top-level imports')
+    parser.add_argument('--json', help='write the results to this file')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child()
+        return
+
+    runs = []
+    for _ in range(args.runs):
+        started = time.perf_counter()
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--child'],
+            env=child_env(), capture_output=True, text=True, check=True
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        result['process_ms'] = round((time.perf_counter() - started) * 1000, 1)
+        runs.append(result)
+
+    summary = {
+        name: round(statistics.median(run[name] for run in runs), 1)
+        for name in ('import_ms', 'first_request_ms', 'process_ms')
+    }
+    summary['loaded_at_startup'] = runs[-1]['loaded']
+    print(f"import app:     {summary['import_ms']:8.1f} ms (median of {args.runs})")
+    print(f"first request:  {summary['first_request_ms']:8.1f} ms")
+    print(f"whole process:  {summary['process_ms']:8.1f} ms")
+    print(f"heavy modules loaded at startup: {', '.join(summary['loaded_at_startup']) or 'none'}")
+
+    if args.importtime:
+        summary['slowest_imports'] = slowest_imports(15)
+        print('\nslowest top-level imports (cumulative ms):')
+        for milliseconds, name in summary['slowest_imports']:
+            print(f"  {milliseconds:8.1f}  {name}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'summary': summary, 'runs': runs}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,186 @@
+"""Synthetic data for benchmarks: N users x M companies x K pallets and employees.
+
+Rows are written with executemany inserts in chunks and desi values are
+calculated in one batch per chunk, so a million pallets take seconds rather
+than hours. Every user gets the same password (``BENCH_PASSWORD``), hashed
+once. Usage::
+
+    DATABASE_URL=sqlite:////tmp/bench.db python benchmarks/datagen.py --users 10 --companies 20 --pallets 500
+
+Must run inside an app context when used as a module (``generate``).
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+BENCH_PASSWORD = 'bench-password'
+INSERT_CHUNK_SIZE = 5000
+
+# Weeks of attendance and advances generated per employee, ending with the current week
+EMPLOYEE_WEEKS = 4
+
+PALLET_TYPES = ('Euro', 'Endüstriyel', 'Hafif', 'Ağır Yük', 'İhracat', 'Kimya', 'Gıda', 'Tek Kullanımlık')
+
+
+def bench_username(index):
+    return f'bench{index:04d}'
+
+
+def random_pallet(rng, company_id, number):
+    """One pallet row with plausible dimensions in cm"""
+    board_width = rng.choice((8, 10, 12, 14))
+    upper_length = rng.choice((80, 100, 110, 120, 140))
+    return {
+        'name': f'{rng.choice(PALLET_TYPES)} Palet {number:06d}',
+        'company_id': company_id,
+        'price': round(rng.uniform(80, 900), 2),
+        'board_thickness': rng.choice((1.7, 2.0, 2.2, 2.5)),
+        'upper_board_length': upper_length,
+        'upper_board_width': board_width,
+        'upper_board_quantity': rng.randint(3, 9),
+        'lower_board_length': upper_length,
+        'lower_board_width': board_width,
+        'lower_board_quantity': rng.randint(2, 5),
+        'closure_length': rng.choice((60, 80, 100, 120)),
+        'closure_width': board_width,
+        'closure_quantity': 3,
+        'block_length': rng.choice((8, 10, 12, 14)),
+        'block_width': rng.choice((8, 10, 12, 14)),
+        'block_height': rng.choice((7.8, 9, 10, 12)),
+    }
+
+
+def _insert_chunks(table, rows):
+    from app import db
+    from sqlalchemy import insert
+
+    for start in range(0, len(rows), INSERT_CHUNK_SIZE):
+        db.session.execute(insert(table), rows[start:start + INSERT_CHUNK_SIZE])
+
+
+def generate(users, companies, pallets, seed=1, employees=0):
+    """Insert ``users`` users, ``companies`` companies per user and ``pallets`` pallets per company.
+
+    With ``employees`` every user also gets that many employees with
+    ``EMPLOYEE_WEEKS`` weeks of attendance and advances.
+
+    Returns the number of rows inserted per table and the seconds it took.
+    """
+    from app import db
+    from company_stats import recompute_company_stats
+    from models import Company, User
+    from passwords import hash_password
+    from sqlalchemy import select
+
+    started = time.perf_counter()
+    rng = random.Random(seed)
+    password_hash = hash_password(BENCH_PASSWORD)
+
+    first = (db.session.scalar(select(db.func.max(User.id))) or 0) + 1
+    usernames = [bench_username(first + i) for i in range(users)]
+    _insert_chunks(User.__table__, [
+        {'username': name, 'email': f'{name}@bench.local', 'password_hash': password_hash, 'is_admin': False}
+        for name in usernames
+    ])
+    user_ids = db.session.scalars(select(User.id).where(User.username.in_(usernames))).all()
+
+    _insert_chunks(Company.__table__, [
+        {'name': f'Firma {user_id}-{i:03d}', 'contact_email': f'firma{i}@bench.local', 'user_id': user_id}
+        for user_id in user_ids for i in range(companies)
+    ])
+    company_ids = db.session.scalars(
+        select(Company.id).where(Company.user_id.in_(user_ids)).order_by(Company.id)
+    ).all()
+
+    number = 0
+    total = 0
+    batch = []
+    for company_id in company_ids:
+        for _ in range(pallets):
+            number += 1
+            batch.append(random_pallet(rng, company_id, number))
+            if len(batch) >= INSERT_CHUNK_SIZE:
+                total += _insert_pallets(batch)
+                batch = []
+    if batch:
+        total += _insert_pallets(batch)
+    # Bulk inserts bypass the stats hooks
+    for start in range(0, len(company_ids), 1000):
+        recompute_company_stats(company_ids[start:start + 1000])
+    employee_count = _insert_employees(rng, user_ids, employees) if employees else 0
+    db.session.commit()
+
+    return {
+        'users': len(user_ids),
+        'companies': len(company_ids),
+        'pallets': total,
+        'employees': employee_count,
+        'usernames': usernames,
+        'seconds': round(time.perf_counter() - started, 2),
+    }
+
+
+def _insert_pallets(rows):
+    from models import Pallet
+    from pallet_specs import assign_specs, pallet_rows
+
+    # The specs get the dimensions and desi, the pallet rows only point to them
+    assign_specs(rows)
+    _insert_chunks(Pallet.__table__, pallet_rows(rows))
+    return len(rows)
+
+
+def _insert_employees(rng, user_ids, employees):
+    """Employees with random daily rates, attendance masks and advances for every user"""
+    from app import db
+    from models import Advance, AttendanceWeek, Employee
+    from personnel import FULL_WEEK, week_start
+    from sqlalchemy import select
+    from datetime import date, timedelta
+
+    _insert_chunks(Employee.__table__, [
+        {'user_id': user_id, 'first_name': f'Personel{i:05d}', 'last_name': f'Bench{user_id}',
+         'start_date': date(2020, 1, 1), 'daily_rate': rng.choice((800, 900, 1000, 1200)), 'active': True}
+        for user_id in user_ids for i in range(employees)
+    ])
+    rows = db.session.execute(select(Employee.id, Employee.user_id).where(Employee.user_id.in_(user_ids))).all()
+    weeks = [week_start(date.today()) - timedelta(days=7 * i) for i in range(EMPLOYEE_WEEKS)]
+    # Mostly full weeks, some with a missing day
+    _insert_chunks(AttendanceWeek.__table__, [
+        {'employee_id': employee_id, 'user_id': user_id, 'week_start': week,
+         'days': FULL_WEEK if rng.random() < 0.7 else FULL_WEEK & ~(1 << rng.randrange(6)),
+         'daily_rate': None}
+        for employee_id, user_id in rows for week in weeks
+    ])
+    _insert_chunks(Advance.__table__, [
+        {'employee_id': employee_id, 'user_id': user_id, 'paid_on': week + timedelta(days=rng.randrange(6)),
+         'amount': rng.choice((250, 500, 1000))}
+        for employee_id, user_id in rows for week in weeks if rng.random() < 0.3
+    ])
+    return len(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--companies', type=int, default=10, help='companies per user')
+    parser.add_argument('--pallets', type=int, default=100, help='pallets per company')
+    parser.add_argument('--employees', type=int, default=0, help='employees per user')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    from app import app, db
+    with app.app_context():
+        db.create_all()
+        result = generate(args.users, args.companies, args.pallets, seed=args.seed, employees=args.employees)
+    print(f"{result['users']} users, {result['companies']} companies, {result['pallets']} pallets, "
+          f"{result['employees']} employees in {result['seconds']} s (password: {BENCH_PASSWORD})")
+
+
+if __name__ == '__main__':
+    main()
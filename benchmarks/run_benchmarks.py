@@ -0,0 +1,308 @@
+"""End-to-end benchmark suite on a local SQLite database.
+
+Creates a fresh database with ``datagen``, then measures the pallet list,
+both exports, the desi calculation, login, the weekly pay list and the JSON
+API under concurrent clients through the Flask test client. No outside services are needed.
+Results are written as JSON so runs on different commits can be compared::
+
+    python benchmarks/run_benchmarks.py --json before.json
+    git checkout my-branch
+    python benchmarks/run_benchmarks.py --json after.json --compare before.json
+
+``--compare`` prints the change of every median and exits with status 1 if
+any scenario got slower than ``--max-regression`` percent. Before timing,
+the listings and exports are checked against ``QUERY_BUDGETS``: a view that
+starts issuing a query per row fails the run with status 1 as well.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+SCENARIOS = ('login', 'pallets_page', 'pallets_search', 'autocomplete', 'similar_pallets', 'export_csv', 'export_pdf',
+             'desi_single', 'desi_batch', 'weekly_payroll', 'api_concurrent')
+
+# Most SQL statements one warm request may execute, whatever the number of rows
+QUERY_BUDGETS = {
+    '/pallets?per_page=50': 4,
+    '/pallets?per_page=50&search=euro': 5,
+    '/export/pallets/csv': 5,
+    '/export/pallets/pdf': 5,
+    '/api/pallets?per_page=50': 4,
+}
+
+
+def configure_environment(database_path):
+    """Point the app at a private SQLite file; must run before ``app`` is imported"""
+    os.environ['DATABASE_URL'] = f'sqlite:///{database_path}'
+    # Exports must be rendered every time, not served from the export cache
+    os.environ['EXPORT_CACHE_ENABLED'] = '0'
+
+
+def percentile(sorted_values, fraction):
+    index = min(int(round(fraction * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+def summarize(durations, errors=0, wall_seconds=None):
+    """Latency statistics in milliseconds for a list of durations in seconds"""
+    values = sorted(durations)
+    result = {
+        'iterations': len(values),
+        'errors': errors,
+        'median_ms': round(statistics.median(values) * 1000, 3),
+        'mean_ms': round(statistics.fmean(values) * 1000, 3),
+        'p95_ms': round(percentile(values, 0.95) * 1000, 3),
+        'max_ms': round(values[-1] * 1000, 3),
+    }
+    if wall_seconds:
+        result['ops_per_second'] = round(len(values) / wall_seconds, 1)
+    return result
+
+
+def timed(function, iterations, warmup=1):
+    for _ in range(warmup):
+        function()
+    durations = []
+    errors = 0
+    started = time.perf_counter()
+    for _ in range(iterations):
+        begin = time.perf_counter()
+        if function() is False:
+            errors += 1
+        durations.append(time.perf_counter() - begin)
+    return summarize(durations, errors, time.perf_counter() - started)
+
+
+def login(client, username, password):
+    response = client.post('/login', data={'username': username, 'password': password})
+    response.close()
+    return response.status_code == 302
+
+
+def fetch(client, url, **kwargs):
+    """Request ``url``, read the whole body and report whether it succeeded"""
+    response = client.open(url, **kwargs)
+    response.get_data()
+    response.close()
+    return response.status_code < 400
+
+
+def check_query_budgets(client, engine):
+    """Request every URL of ``QUERY_BUDGETS`` once warm; return the failures as ``{url: message}``"""
+    from db_metrics import assert_max_queries
+
+    failures = {}
+    for url, limit in QUERY_BUDGETS.items():
+        fetch(client, url)
+        try:
+            with assert_max_queries(limit, engine) as counter:
+                fetch(client, url)
+        except AssertionError as e:
+            failures[url] = str(e)
+            print(f"query budget exceeded: {url}\n{e}")
+        else:
+            print(f"{url:<40}{counter.count:>3} queries (max {limit})")
+    return failures
+
+
+def run_api_clients(app, usernames, password, pallet_ids, threads, requests_per_thread, write_share):
+    """Concurrent clients mixing list, detail and price update calls on the JSON API"""
+    durations = []
+    errors = []
+    lock = threading.Lock()
+    barrier = threading.Barrier(threads)
+
+    def client_thread(index):
+        rng = random.Random(index)
+        username = usernames[index % len(usernames)]
+        client = app.test_client()
+        login(client, username, password)
+        ids = pallet_ids[username]
+        local, failed = [], 0
+        barrier.wait()
+        for _ in range(requests_per_thread):
+            choice = rng.random()
+            begin = time.perf_counter()
+            if choice < write_share:
+                ok = fetch(client, f'/api/pallets/{rng.choice(ids)}', method='PUT',
+                           json={'price': round(rng.uniform(80, 900), 2)})
+            elif choice < 0.5:
+                ok = fetch(client, '/api/pallets?per_page=50')
+            else:
+                ok = fetch(client, f'/api/pallets/{rng.choice(ids)}')
+            local.append(time.perf_counter() - begin)
+            failed += not ok
+        with lock:
+            durations.extend(local)
+            errors.append(failed)
+
+    workers = [threading.Thread(target=client_thread, args=(i,)) for i in range(threads)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    result = summarize(durations, sum(errors), time.perf_counter() - started)
+    result['threads'] = threads
+    return result
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    from app import app, db
+    from datagen import BENCH_PASSWORD, generate
+    from models import Company, Pallet, User
+    from sqlalchemy import select
+    from utils import DIMENSION_FIELDS, calculate_component_volumes, calculate_component_volumes_batch, pallet_columns
+
+    with app.app_context():
+        db.create_all()
+        dataset = generate(args.users, args.companies, args.pallets, seed=args.seed, employees=args.employees)
+        usernames = dataset['usernames']
+        pallet_ids = {}
+        for username in usernames:
+            pallet_ids[username] = db.session.scalars(
+                select(Pallet.id).join(Company).join(User).where(User.username == username)
+            ).all()
+        sample = db.session.scalars(select(Pallet).limit(args.desi_rows)).all()
+        engine = db.engine
+        db.session.remove()
+    print(f"dataset: {dataset['users']} users, {dataset['companies']} companies, "
+          f"{dataset['pallets']} pallets, {dataset['employees']} employees ({dataset['seconds']} s)")
+
+    client = app.test_client()
+    login(client, usernames[0], BENCH_PASSWORD)
+    selected = set(args.only or SCENARIOS)
+    results = {}
+    query_failures = check_query_budgets(client, engine)
+
+    def record(name, result):
+        results[name] = result
+        print(f"{name:<16}{result['median_ms']:>12.2f}{result['p95_ms']:>12.2f}"
+              f"{result.get('ops_per_second', 0):>12.1f}{result['errors']:>8}")
+
+    print(f"{'scenario':<16}{'median ms':>12}{'p95 ms':>12}{'ops/s':>12}{'errors':>8}")
+    if 'login' in selected:
+        record('login', timed(lambda: login(app.test_client(), usernames[0], BENCH_PASSWORD), args.iterations))
+    if 'pallets_page' in selected:
+        record('pallets_page', timed(lambda: fetch(client, '/pallets?per_page=50'), args.iterations))
+    if 'pallets_search' in selected:
+        record('pallets_search', timed(lambda: fetch(client, '/pallets?per_page=50&search=euro'), args.iterations))
+    if 'autocomplete' in selected:
+        record('autocomplete', timed(lambda: fetch(client, '/api/search/autocomplete?q=pa'), args.iterations))
+    if 'similar_pallets' in selected:
+        spec = dict(zip(DIMENSION_FIELDS, (float(getattr(sample[0], field)) for field in DIMENSION_FIELDS)), k=5)
+        record('similar_pallets', timed(lambda: fetch(client, '/api/pallets/similar', method='POST', json=spec),
+                                        args.iterations))
+    if 'export_csv' in selected:
+        record('export_csv', timed(lambda: fetch(client, '/export/pallets/csv'), args.export_iterations))
+    if 'export_pdf' in selected:
+        record('export_pdf', timed(lambda: fetch(client, '/export/pallets/pdf'), args.export_iterations))
+    if 'desi_single' in selected:
+        def desi_single():
+            for pallet in sample:
+                calculate_component_volumes(pallet)
+        result = timed(desi_single, args.iterations)
+        result['rows'] = len(sample)
+        record('desi_single', result)
+    if 'desi_batch' in selected:
+        result = timed(lambda: calculate_component_volumes_batch(pallet_columns(sample)), args.iterations)
+        result['rows'] = len(sample)
+        record('desi_batch', result)
+    if 'weekly_payroll' in selected:
+        result = timed(lambda: fetch(client, '/api/payroll'), args.iterations)
+        result['employees'] = args.employees
+        record('weekly_payroll', result)
+    if 'api_concurrent' in selected:
+        record('api_concurrent', run_api_clients(
+            app, usernames, BENCH_PASSWORD, pallet_ids, args.threads, args.iterations, args.write_share
+        ))
+
+    return {
+        'commit': git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'dataset': {key: dataset[key] for key in ('users', 'companies', 'pallets', 'employees')},
+        'results': results,
+        'query_budget_failures': query_failures,
+    }
+
+
+def compare(current, baseline_path, max_regression):
+    """Print the median change per scenario; return False if any regressed too much"""
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = json.load(f)
+    if baseline.get('dataset') != current['dataset']:
+        print(f"warning: datasets differ ({baseline.get('dataset')} vs {current['dataset']})")
+    print(f"\ncompared with {baseline.get('commit') or baseline_path}:")
+    ok = True
+    for name, result in current['results'].items():
+        before = baseline.get('results', {}).get(name)
+        if not before:
+            continue
+        change = (result['median_ms'] - before['median_ms']) / before['median_ms'] * 100
+        flag = ''
+        if change > max_regression:
+            flag = '  REGRESSION'
+            ok = False
+        print(f"{name:<16}{before['median_ms']:>12.2f} -> {result['median_ms']:>10.2f} ms {change:+7.1f}%{flag}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=4)
+    parser.add_argument('--companies', type=int, default=10, help='companies per user')
+    parser.add_argument('--pallets', type=int, default=250, help='pallets per company')
+    parser.add_argument('--employees', type=int, default=1000, help='employees per user')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--export-iterations', type=int, default=5)
+    parser.add_argument('--desi-rows', type=int, default=1000, help='pallets in the desi scenarios')
+    parser.add_argument('--threads', type=int, default=8, help='concurrent API clients')
+    parser.add_argument('--write-share', type=float, default=0.1, help='share of API calls that update a pallet')
+    parser.add_argument('--only', nargs='+', choices=SCENARIOS)
+    parser.add_argument('--database', help='SQLite file to use (default: a new temporary file)')
+    parser.add_argument('--json', help='write the results to this file')
+    parser.add_argument('--compare', help='earlier results file to compare with')
+    parser.add_argument('--max-regression', type=float, default=20.0, help='allowed median slowdown in percent')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='palet_bench_') as directory:
+        database = args.database or os.path.join(directory, 'bench.db')
+        if os.path.exists(database):
+            os.remove(database)
+        configure_environment(database)
+        results = run(args)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+    ok = not results['query_budget_failures']
+    if args.compare:
+        ok = compare(results, args.compare, args.max_regression) and ok
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+"""In-process TTL/LRU cache for reference data read on every request.
+
+Logged-in users (``load_user``) and per-user company lists are cached per
+worker. Every entry remembers the data version of its user (see
+``data_version``) when it was loaded. The version lives in the database and
+is bumped inside the transaction that changes the user or one of their
+companies, so a lookup whose stored version no longer matches is a miss and
+a change made through any worker, on any host, is seen by all others on
+their next request. The version is read once per request for both caches.
+"""
+from app import db
+from data_version import get_data_version
+from models import Company, User
+from flask import g, has_request_context
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session, make_transient_to_detached
+from collections import OrderedDict
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+CACHE_TTL = float(os.environ.get('CACHE_TTL', '300'))
+CACHE_MAX_ENTRIES = int(os.environ.get('CACHE_MAX_ENTRIES', '1024'))
+
+USER_NAMESPACE = 'user'
+COMPANIES_NAMESPACE = 'companies'
+
+
+def current_generation(user_id):
+    """Return the data version of ``user_id``, read from the database once per request"""
+    if not has_request_context():
+        return get_data_version(user_id)
+    versions = g.setdefault('cache_generations', {})
+    if user_id not in versions:
+        versions[user_id] = get_data_version(user_id)
+    return versions[user_id]
+
+
+def forget_generation(user_id):
+    """Make the next lookup in this request read the version again"""
+    if has_request_context():
+        g.get('cache_generations', {}).pop(user_id, None)
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries expire after ``ttl`` seconds.
+
+    Keys are user ids; entries are tied to the user's data version (see
+    ``current_generation``) and are dropped when it changes.
+    """
+
+    def __init__(self, namespace, ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_load(self, key, loader):
+        """Return the cached value of ``key`` or call ``loader()`` and cache its result"""
+        generation = current_generation(key)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > now and entry[1] == generation:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+            self.misses += 1
+
+        # The version is read before loading, so a write committed while
+        # loading leaves this entry with an outdated version
+        value = loader()
+        with self._lock:
+            self._entries[key] = (now + self.ttl, generation, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return value
+
+    def invalidate(self, key):
+        """Drop ``key`` here; other workers notice the bumped data version themselves"""
+        with self._lock:
+            self._entries.pop(key, None)
+        forget_generation(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                    'entries': len(self._entries)}
+
+
+user_cache = TTLCache(USER_NAMESPACE)
+company_cache = TTLCache(COMPANIES_NAMESPACE)
+
+USER_COLUMNS = ('id', 'username', 'email', 'password_hash', 'is_admin', 'created_at')
+
+
+def cached_user(user_id):
+    """Return the user attached to the current session, loading it only on a cache miss.
+
+    The cache keeps plain column values; they are turned into a persistent
+    instance with ``merge(load=False)``, which issues no SQL.
+    """
+    def load():
+        user = db.session.get(User, user_id)
+        return {column: getattr(user, column) for column in USER_COLUMNS} if user else None
+
+    values = user_cache.get_or_load(user_id, load)
+    if values is None:
+        return None
+    user = User(**values)
+    make_transient_to_detached(user)
+    return db.session.merge(user, load=False)
+
+
+def user_companies(user_id):
+    """Return the companies of a user as read-only rows ordered by name"""
+    def load():
+        return db.session.execute(
+            select(Company.id, Company.name, Company.contact_email, Company.created_at)
+            .where(Company.user_id == user_id)
+            .order_by(Company.name, Company.id)
+        ).all()
+
+    return company_cache.get_or_load(user_id, load)
+
+
+def user_company(user_id, company_id):
+    """Return one cached company row of a user, or None"""
+    return next((company for company in user_companies(user_id) if company.id == company_id), None)
+
+
+def cache_stats():
+    return {USER_NAMESPACE: user_cache.stats(), COMPANIES_NAMESPACE: company_cache.stats()}
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_invalidations(session, flush_context):
+    """Remember which cached users and company lists the flushed changes touch"""
+    pending = session.info.setdefault('cache_invalidations', set())
+    for instance in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(instance, User) and instance.id is not None:
+            pending.add((USER_NAMESPACE, instance.id))
+        elif isinstance(instance, Company):
+            if instance in session.dirty and not session.is_modified(instance):
+                continue
+            pending.add((COMPANIES_NAMESPACE, instance.user_id))
+            for user_id in inspect(instance).attrs.user_id.history.deleted or ():
+                pending.add((COMPANIES_NAMESPACE, user_id))
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_after_commit(session):
+    for namespace, key in session.info.pop('cache_invalidations', ()):
+        if key is not None:
+            (user_cache if namespace == USER_NAMESPACE else company_cache).invalidate(key)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_invalidations(session, previous_transaction):
+    if not session.in_transaction():
+        session.info.pop('cache_invalidations', None)
@@ -0,0 +1,159 @@
+"""Maintenance commands, run with ``flask --app main <command>``.
+
+Web workers no longer create tables or seed data while importing the app;
+deployments run ``init-db`` (and ``seed`` on a fresh database) once instead.
+Command modules are imported inside the commands so they cost nothing at
+worker startup.
+"""
+from app import app, db
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+import click
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+@app.cli.command('init-db')
+@click.option('--wait', default=0.0, show_default=True,
+              help='Seconds to keep retrying while the database is unreachable.')
+def init_db_command(wait):
+    """Create missing database tables."""
+    deadline = time.monotonic() + wait
+    while True:
+        try:
+            db.session.execute(text('SELECT 1'))
+            break
+        except OperationalError as e:
+            db.session.rollback()
+            if time.monotonic() >= deadline:
+                raise click.ClickException(f'Database unreachable: {e.orig}')
+            logger.warning("Database unreachable, retrying in 2 seconds")
+            time.sleep(2)
+    db.create_all()
+    click.echo('Database tables created')
+
+
+@app.cli.command('seed')
+@click.option('--force', is_flag=True, help='Seed even if users already exist.')
+def seed_command(force):
+    """Load the sample admin user, companies and pallets."""
+    from models import User
+    from seed_data import seed_data
+
+    if User.query.first() and not force:
+        click.echo('Database already has users, nothing seeded (use --force)')
+        return
+    seed_data()
+    click.echo('Sample data loaded')
+
+
+@app.cli.command('rebuild-stats')
+def rebuild_stats_command():
+    """Recompute the per-company pallet statistics from the pallet table."""
+    from company_stats import rebuild_all_company_stats
+
+    count = rebuild_all_company_stats()
+    db.session.commit()
+    click.echo(f'Statistics rebuilt for {count} companies')
+
+
+@app.cli.command('recompute-desi')
+@click.option('--chunk-size', default=5000, show_default=True)
+@click.option('--company-id', 'company_ids', type=int, multiple=True,
+              help='Only the specs used by pallets of these companies.')
+@click.option('--dry-run', is_flag=True)
+def recompute_desi_command(chunk_size, company_ids, dry_run):
+    """Recalculate the stored desi values of all pallet specs."""
+    from recompute_desi import recompute_desi
+
+    stats = recompute_desi(chunk_size=chunk_size, company_ids=list(company_ids) or None, dry_run=dry_run)
+    click.echo(f"{stats['specs']} specs processed, {stats['updated']} updated, "
+               f"{stats['pallets']} pallets affected in {stats['seconds']} s")
+
+
+@app.cli.command('migrate-pallet-specs')
+@click.option('--chunk-size', default=5000, show_default=True)
+@click.option('--prune', is_flag=True, help='Delete specs no pallet refers to any more.')
+def migrate_pallet_specs_command(chunk_size, prune):
+    """Move the dimensions and desi of an existing database's pallets into pallet specs."""
+    from pallet_specs import drop_pallet_copies, ensure_spec_schema, fold_pallet_specs, prune_unused_specs
+
+    if ensure_spec_schema():
+        click.echo('Added pallet.spec_id')
+    stats = fold_pallet_specs(chunk_size=chunk_size)
+    click.echo(f"{stats['folded']} pallets folded into specs ({stats['specs_created']} new), "
+               f"{stats['invalid']} invalid in {stats['seconds']} s")
+    if stats['invalid']:
+        raise click.ClickException(
+            f"Pallets with invalid dimensions, fix or delete them and run again: {stats['invalid_ids'][:50]}"
+        )
+    try:
+        dropped = drop_pallet_copies()
+    except ValueError as e:
+        raise click.ClickException(f'Pallet columns not dropped: {e}')
+    if dropped:
+        click.echo(f"Dropped pallet columns: {', '.join(dropped)}")
+    if prune:
+        click.echo(f'{prune_unused_specs()} unused specs deleted')
+
+
+@app.cli.command('build-assets')
+def build_assets_command():
+    """Build fingerprinted, precompressed static files and resized images into static/dist."""
+    from assets import DIST_DIR, build_assets
+
+    stats = build_assets()
+    for name in stats['missing']:
+        click.echo(f'{name}: source image missing, skipped')
+    click.echo(f"{stats['files']} static files and {stats['images']} images built, "
+               f"{stats['written']} new files in {DIST_DIR}")
+
+
+@app.cli.command('import-pallets')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--username', required=True, help='Owner of the companies the pallets belong to.')
+@click.option('--chunk-size', default=2000, show_default=True)
+@click.option('--dry-run', is_flag=True)
+def import_pallets_command(path, username, chunk_size, dry_run):
+    """Import pallets from a CSV catalog."""
+    from models import User
+    from pallet_import import import_pallets_csv
+
+    user = User.query.filter_by(username=username).first()
+    if not user:
+        raise click.ClickException(f'Unknown user {username}')
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        result = import_pallets_csv(f, user.id, chunk_size=chunk_size, dry_run=dry_run)
+    for rejected in result['rejected_rows'][:50]:
+        click.echo(f"line {rejected['line']}: {rejected['errors']}")
+    click.echo(f"{result['imported']} imported, {result['rejected']} rejected in {result['seconds']} s")
+
+
+@app.cli.command('import-attendance')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--username', required=True, help='Owner of the employees.')
+@click.option('--match', type=click.Choice(['card_number', 'national_id', 'id']), default='card_number',
+              show_default=True, help='Employee field the numbers in the log are matched against.')
+@click.option('--chunk-size', default=2000, show_default=True, help='Employee weeks written per commit.')
+@click.option('--dry-run', is_flag=True)
+def import_attendance_command(path, username, match, chunk_size, dry_run):
+    """Import time clock punches into the weekly attendance."""
+    from models import User
+    from attendance_import import import_attendance_log
+
+    user = User.query.filter_by(username=username).first()
+    if not user:
+        raise click.ClickException(f'Unknown user {username}')
+    with open(path, 'rb') as f:
+        result = import_attendance_log(f, user.id, match=match, chunk_size=chunk_size, dry_run=dry_run)
+    for row in result['invalid_rows'][:50]:
+        click.echo(f"line {row['line']}: {row['message']}")
+    for row in result['unknown_employees'][:50]:
+        click.echo(f"unknown employee {row['employee']}: {row['punches']} punches")
+    for row in result['conflict_rows'][:50]:
+        click.echo(f"{row['employee']} {row['date']}: {row['message']}")
+    click.echo(f"{result['days']} days recorded in {result['weeks_created']} new and {result['weeks_updated']} "
+               f"updated weeks, {result['unknown_punches']} unknown punches, {result['conflicts']} conflicts "
+               f"in {result['seconds']} s")
@@ -0,0 +1,276 @@
+"""Per-company pallet aggregates for the dashboard.
+
+``CompanyStats`` holds the pallet count, total price and total desi of every
+company. ORM writes are picked up by a session hook that turns the flushed
+pallets into deltas (``pallet_count = pallet_count + 1`` ...), so the totals
+change in the same transaction as the pallets. Bulk statements bypass the
+flush; code issuing them passes its own deltas to ``apply_stats_changes``.
+Where an old value is not known (unloaded attributes, companies without a
+stats row yet) the company is recomputed with one aggregate query instead.
+Reads never touch the ``pallet`` table.
+"""
+from app import db
+from models import Company, CompanyStats, Pallet, PalletSpec
+from pallet_specs import spec_volumes
+from sqlalchemy import bindparam, delete, event, func, insert, inspect, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from collections import defaultdict
+from datetime import datetime
+from decimal import Decimal
+import logging
+
+logger = logging.getLogger(__name__)
+
+ZERO = Decimal('0')
+_MISSING = object()
+
+
+def _number(value):
+    if value is None:
+        return ZERO
+    return value if isinstance(value, Decimal) else Decimal(str(value))
+
+
+class StatsChanges:
+    """Deltas per company collected from one write, applied with ``apply_stats_changes``"""
+
+    def __init__(self):
+        self.deltas = defaultdict(lambda: [0, ZERO, ZERO])
+        self.recompute = set()
+
+    def add(self, company_id, price, volume, count=1):
+        """Count a pallet in (``count=1``) or out of (``count=-1``) a company"""
+        if company_id is None:
+            return
+        delta = self.deltas[company_id]
+        delta[0] += count
+        delta[1] += _number(price) * count
+        delta[2] += _number(volume) * count
+
+    def shift(self, company_id, price=0, volume=0):
+        """Change the totals of a company without changing its pallet count"""
+        if company_id is None:
+            return
+        delta = self.deltas[company_id]
+        delta[1] += _number(price)
+        delta[2] += _number(volume)
+
+    def add_rows(self, rows, count=1):
+        """Add dicts or row objects with ``company_id``, ``price`` and ``total_volume``"""
+        for row in rows:
+            get = row.get if isinstance(row, dict) else lambda field: getattr(row, field, None)
+            self.add(get('company_id'), get('price'), get('total_volume'), count)
+
+    def __bool__(self):
+        return bool(self.deltas or self.recompute)
+
+
+def recompute_company_stats(company_ids, connection=None):
+    """Rebuild the stats rows of the given companies from the pallet table"""
+    company_ids = sorted({company_id for company_id in company_ids if company_id is not None})
+    if not company_ids:
+        return
+    connection = connection or db.session.connection()
+    totals = {
+        row.company_id: row for row in connection.execute(
+            select(
+                Pallet.company_id,
+                func.count(Pallet.id).label('pallet_count'),
+                func.coalesce(func.sum(Pallet.price), 0).label('total_price'),
+                func.coalesce(func.sum(PalletSpec.total_volume), 0).label('total_volume'),
+            )
+            .join(PalletSpec, Pallet.spec_id == PalletSpec.id)
+            .where(Pallet.company_id.in_(company_ids))
+            .group_by(Pallet.company_id)
+        )
+    }
+    owners = connection.execute(select(Company.id, Company.user_id).where(Company.id.in_(company_ids))).all()
+    existing = set(connection.execute(
+        select(CompanyStats.company_id).where(CompanyStats.company_id.in_(company_ids))
+    ).scalars())
+    now = datetime.utcnow()
+    rows = []
+    for company_id, user_id in owners:
+        total = totals.get(company_id)
+        rows.append({
+            'target_id': company_id,
+            'user_id': user_id,
+            'pallet_count': total.pallet_count if total else 0,
+            'total_price': _number(total.total_price) if total else ZERO,
+            'total_volume': _number(total.total_volume) if total else ZERO,
+            'updated_at': now,
+        })
+    overwrite = update(CompanyStats.__table__).where(CompanyStats.company_id == bindparam('target_id'))
+    updates = [row for row in rows if row['target_id'] in existing]
+    if updates:
+        connection.execute(overwrite, updates)
+    for row in rows:
+        if row['target_id'] in existing:
+            continue
+        values = {key: value for key, value in row.items() if key != 'target_id'}
+        try:
+            with connection.begin_nested():
+                connection.execute(insert(CompanyStats).values(company_id=row['target_id'], **values))
+        except IntegrityError:
+            # Another transaction created the row in the meantime
+            connection.execute(overwrite, [row])
+
+
+def rebuild_all_company_stats(connection=None):
+    """Recompute the stats of every company (backfill after creating the table)"""
+    connection = connection or db.session.connection()
+    company_ids = connection.execute(select(Company.id)).scalars().all()
+    for start in range(0, len(company_ids), 1000):
+        recompute_company_stats(company_ids[start:start + 1000], connection)
+    return len(company_ids)
+
+
+def apply_stats_changes(changes, connection=None):
+    """Apply collected deltas inside the current transaction.
+
+    Increments are relative, so concurrent writers to the same company do not
+    overwrite each other. Companies without a stats row are recomputed.
+    """
+    if not changes:
+        return
+    connection = connection or db.session.connection()
+    deltas = {company_id: delta for company_id, delta in changes.deltas.items()
+              if company_id not in changes.recompute and any(delta)}
+    if deltas:
+        existing = set(connection.execute(
+            select(CompanyStats.company_id).where(CompanyStats.company_id.in_(list(deltas)))
+        ).scalars())
+        params = [
+            {'target_id': company_id, 'd_count': count, 'd_price': price, 'd_volume': volume}
+            for company_id, (count, price, volume) in deltas.items() if company_id in existing
+        ]
+        if params:
+            connection.execute(
+                update(CompanyStats.__table__)
+                .where(CompanyStats.company_id == bindparam('target_id'))
+                .values(
+                    pallet_count=CompanyStats.pallet_count + bindparam('d_count'),
+                    total_price=CompanyStats.total_price + bindparam('d_price'),
+                    total_volume=CompanyStats.total_volume + bindparam('d_volume'),
+                    updated_at=datetime.utcnow(),
+                ),
+                params
+            )
+        changes.recompute.update(company_id for company_id in deltas if company_id not in existing)
+    recompute_company_stats(changes.recompute, connection)
+
+
+def _value(state, field, new):
+    """Flushed value (``new``) or value before the flush of a pallet attribute"""
+    history = state.attrs[field].history
+    if new and history.added:
+        return history.added[0]
+    if not new and history.deleted:
+        return history.deleted[0]
+    if history.unchanged:
+        return history.unchanged[0]
+    if new and not history.deleted and field in state.dict:
+        return state.dict[field]
+    return _MISSING
+
+
+@event.listens_for(Session, 'after_flush')
+def _update_stats_after_flush(session, flush_context):
+    """Turn flushed pallets into deltas of their companies' stats"""
+    changes = StatsChanges()
+    deleted_companies = set()
+    moved_companies = []
+    for instance in session.deleted:
+        if isinstance(instance, Company):
+            deleted_companies.add(instance.id)
+    for instance in session.dirty:
+        if isinstance(instance, Company) and inspect(instance).attrs.user_id.history.has_changes():
+            moved_companies.append(instance)
+
+    # (company_id, price, spec_id) before and after the flush; desi comes from the spec
+    written = []
+    for instance in list(session.new) + list(session.dirty) + list(session.deleted):
+        if not isinstance(instance, Pallet):
+            continue
+        state = inspect(instance)
+        if instance in session.dirty and not session.is_modified(instance):
+            continue
+        old = None
+        if instance not in session.new:
+            old = tuple(_value(state, field, new=False) for field in ('company_id', 'price', 'spec_id'))
+        new = None
+        if instance not in session.deleted:
+            new = tuple(_value(state, field, new=True) for field in ('company_id', 'price', 'spec_id'))
+        for values, count in ((old, -1), (new, 1)):
+            if values is None:
+                continue
+            if _MISSING in values:
+                company_id = values[0] if values[0] is not _MISSING else instance.company_id
+                changes.recompute.add(company_id)
+            else:
+                written.append((values, count))
+
+    for company_id in deleted_companies:
+        changes.deltas.pop(company_id, None)
+        changes.recompute.discard(company_id)
+    if not written and not changes and not deleted_companies and not moved_companies:
+        return
+    try:
+        connection = session.connection()
+        volumes = spec_volumes({values[2] for values, _ in written}, connection)
+        for (company_id, price, spec_id), count in written:
+            if company_id not in deleted_companies:
+                changes.add(company_id, price, volumes.get(spec_id), count=count)
+        if deleted_companies:
+            connection.execute(delete(CompanyStats).where(CompanyStats.company_id.in_(deleted_companies)))
+        for company in moved_companies:
+            connection.execute(
+                update(CompanyStats).where(CompanyStats.company_id == company.id).values(user_id=company.user_id)
+            )
+        apply_stats_changes(changes, connection)
+    except Exception as e:
+        logger.error(f"Error updating company stats: {str(e)}")
+        raise
+
+
+def company_stats(user_id):
+    """Return one dict per company of the user with its pallet aggregates, ordered by name"""
+    rows = db.session.execute(
+        select(
+            Company.id, Company.name,
+            CompanyStats.pallet_count, CompanyStats.total_price, CompanyStats.total_volume
+        )
+        .outerjoin(CompanyStats, CompanyStats.company_id == Company.id)
+        .where(Company.user_id == user_id)
+        .order_by(Company.name)
+    ).all()
+    return [_stats_dict(row.id, row.name, row.pallet_count, row.total_price, row.total_volume) for row in rows]
+
+
+def summarize_stats(stats):
+    """Totals over the per-company dicts of ``company_stats``"""
+    summary = _stats_dict(
+        None, None,
+        sum(item['pallet_count'] for item in stats),
+        sum(item['total_price'] for item in stats),
+        sum(item['total_volume'] for item in stats),
+    )
+    del summary['company_id'], summary['name']
+    summary['company_count'] = len(stats)
+    return summary
+
+
+def _stats_dict(company_id, name, count, total_price, total_volume):
+    count = count or 0
+    total_price = float(total_price or 0)
+    total_volume = float(total_volume or 0)
+    return {
+        'company_id': company_id,
+        'name': name,
+        'pallet_count': count,
+        'total_price': round(total_price, 2),
+        'average_price': round(total_price / count, 2) if count else 0.0,
+        'total_volume': round(total_volume, 2),
+        'price_per_desi': round(total_price / total_volume, 2) if total_volume else 0.0,
+    }
@@ -0,0 +1,250 @@
+"""Gzip and Brotli compression of HTML, CSV, JSON and other text responses.
+
+``CompressionMiddleware`` wraps the WSGI app, so it sees the final headers
+and body of every response: rendered pages, JSON, streamed CSV exports and
+cached files served with ``send_file``. The encoding is negotiated from
+``Accept-Encoding``; Brotli is offered only when the ``brotli`` package is
+installed. Bodies of unknown length are compressed chunk by chunk with a
+flush after every chunk, so streamed exports still arrive progressively.
+Bodies below ``COMPRESSION_MIN_SIZE`` bytes are sent as they are; for
+streams the first chunks are read ahead until the threshold is reached.
+
+Strong ETags become weak ETags on compressed responses, as the bytes differ
+from the identity encoding. Counters of compressed responses and bytes
+before and after compression are shown on ``/metrics``.
+"""
+from werkzeug.datastructures import Headers
+from werkzeug.http import parse_accept_header, parse_options_header
+from app import app
+from collections import Counter
+import logging
+import os
+import threading
+import zlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+COMPRESSION_ENABLED = os.environ.get('COMPRESSION_ENABLED', '1') != '0'
+COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', '1024'))
+# zlib level 1-9 for gzip
+COMPRESSION_LEVEL = int(os.environ.get('COMPRESSION_LEVEL', '6'))
+# Brotli quality 0-11; 4 compresses about as fast as gzip 6 and smaller
+BROTLI_QUALITY = int(os.environ.get('BROTLI_QUALITY', '4'))
+# Bodies of known length up to this size are compressed in one piece with a Content-Length
+MAX_BUFFERED_SIZE = 4 * 1024 * 1024
+
+COMPRESSIBLE_MIMETYPES = {
+    'text/html', 'text/plain', 'text/csv', 'text/css', 'text/javascript', 'text/xml',
+    'application/javascript', 'application/json', 'application/xml', 'image/svg+xml',
+}
+
+_counters = Counter()
+_counters_lock = threading.Lock()
+
+
+class GzipEncoder:
+    """Incremental gzip stream"""
+
+    def __init__(self):
+        # wbits 31: gzip header and trailer
+        self._compressor = zlib.compressobj(COMPRESSION_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, data, flush=False):
+        output = self._compressor.compress(data)
+        return output + self._compressor.flush(zlib.Z_SYNC_FLUSH) if flush else output
+
+    def finish(self):
+        return self._compressor.flush()
+
+
+class BrotliEncoder:
+    """Incremental Brotli stream"""
+
+    def __init__(self):
+        self._compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+
+    def compress(self, data, flush=False):
+        output = self._compressor.process(data)
+        return output + self._compressor.flush() if flush else output
+
+    def finish(self):
+        return self._compressor.finish()
+
+
+ENCODERS = {'gzip': GzipEncoder}
+if brotli is not None:
+    ENCODERS['br'] = BrotliEncoder
+
+
+def negotiate_encoding(accept_encoding):
+    """The preferred supported encoding of an ``Accept-Encoding`` header, or None"""
+    if not accept_encoding:
+        return None
+    accept = parse_accept_header(accept_encoding)
+    best, best_quality = None, 0
+    # Brotli first: on equal quality it wins
+    for name in ('br', 'gzip'):
+        if name not in ENCODERS:
+            continue
+        quality = accept.quality(name)
+        if quality > best_quality:
+            best, best_quality = name, quality
+    return best
+
+
+def compressible(status, headers):
+    """Whether a response with this status line and these headers may be compressed"""
+    if not status.startswith('200'):
+        return False
+    if 'Content-Encoding' in headers or 'Content-Range' in headers:
+        return False
+    if 'no-transform' in headers.get('Cache-Control', ''):
+        return False
+    mimetype, _ = parse_options_header(headers.get('Content-Type', ''))
+    return mimetype in COMPRESSIBLE_MIMETYPES
+
+
+def _add_vary(headers):
+    values = [value.strip() for value in headers.get('Vary', '').split(',') if value.strip()]
+    if not any(value.lower() in ('accept-encoding', '*') for value in values):
+        headers['Vary'] = ', '.join(values + ['Accept-Encoding'])
+
+
+def _count(encoding, responses, input_bytes, output_bytes):
+    with _counters_lock:
+        _counters[encoding, 'responses'] += responses
+        _counters[encoding, 'input_bytes'] += input_bytes
+        _counters[encoding, 'output_bytes'] += output_bytes
+
+
+def compression_stats():
+    """Compressed responses and bytes before and after compression per encoding"""
+    with _counters_lock:
+        counters = dict(_counters)
+    return {
+        name: {
+            'responses': counters.get((name, 'responses'), 0),
+            'input_bytes': counters.get((name, 'input_bytes'), 0),
+            'output_bytes': counters.get((name, 'output_bytes'), 0),
+        }
+        for name in ENCODERS
+    }
+
+
+def _close(iterable):
+    close = getattr(iterable, 'close', None)
+    if close:
+        close()
+
+
+class CompressionMiddleware:
+    """WSGI middleware compressing eligible responses with the negotiated encoding"""
+
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+
+    def __call__(self, environ, start_response):
+        encoding = negotiate_encoding(environ.get('HTTP_ACCEPT_ENCODING'))
+        captured = {}
+
+        def capture(status, headers, exc_info=None):
+            captured.update(status=status, headers=headers, exc_info=exc_info)
+            # Flask never uses the write() callable
+            return lambda data: None
+
+        body = self.wsgi_app(environ, capture)
+        status, headers = captured['status'], Headers(captured['headers'])
+        if environ.get('REQUEST_METHOD') == 'HEAD' or not compressible(status, headers):
+            start_response(status, captured['headers'], captured['exc_info'])
+            return body
+        _add_vary(headers)
+        if encoding is None:
+            start_response(status, headers.to_wsgi_list(), captured['exc_info'])
+            return body
+
+        length = headers.get('Content-Length', type=int)
+        chunks = []
+        iterator = iter(body)
+        if length is None:
+            # Read ahead until the threshold so short streams are not compressed either
+            size = 0
+            try:
+                for chunk in iterator:
+                    chunks.append(chunk)
+                    size += len(chunk)
+                    if size >= COMPRESSION_MIN_SIZE:
+                        break
+                else:
+                    length = size
+            except BaseException:
+                _close(body)
+                raise
+        if length is not None and length < COMPRESSION_MIN_SIZE:
+            start_response(status, headers.to_wsgi_list(), captured['exc_info'])
+            return self._pass_through(chunks, iterator, body)
+
+        etag = headers.get('ETag')
+        if etag and not etag.startswith('W/'):
+            headers['ETag'] = f'W/{etag}'
+        headers['Content-Encoding'] = encoding
+        headers.remove('Accept-Ranges')
+        headers.remove('Content-Length')
+        if length is not None and length <= MAX_BUFFERED_SIZE:
+            data = self._compress_all(encoding, chunks, iterator, body)
+            headers['Content-Length'] = str(len(data))
+            start_response(status, headers.to_wsgi_list(), captured['exc_info'])
+            return [data]
+        start_response(status, headers.to_wsgi_list(), captured['exc_info'])
+        # Bodies of unknown length are streams: flush every chunk so they arrive progressively
+        return self._compress_stream(encoding, chunks, iterator, body, flush=length is None)
+
+    def _pass_through(self, chunks, iterator, body):
+        try:
+            yield from chunks
+            yield from iterator
+        finally:
+            _close(body)
+
+    def _compress_all(self, encoding, chunks, iterator, body):
+        try:
+            data = b''.join(chunks) + b''.join(iterator)
+        finally:
+            _close(body)
+        encoder = ENCODERS[encoding]()
+        output = encoder.compress(data) + encoder.finish()
+        _count(encoding, 1, len(data), len(output))
+        return output
+
+    def _compress_stream(self, encoding, chunks, iterator, body, flush):
+        """Compress the read-ahead ``chunks`` and the rest of ``iterator``"""
+        encoder = ENCODERS[encoding]()
+        input_bytes = output_bytes = 0
+        try:
+            if chunks:
+                data = b''.join(chunks)
+                input_bytes += len(data)
+                output = encoder.compress(data, flush)
+                output_bytes += len(output)
+                if output:
+                    yield output
+            for chunk in iterator:
+                input_bytes += len(chunk)
+                output = encoder.compress(chunk, flush)
+                output_bytes += len(output)
+                if output:
+                    yield output
+            output = encoder.finish()
+            output_bytes += len(output)
+            yield output
+        finally:
+            _count(encoding, 1, input_bytes, output_bytes)
+            _close(body)
+
+
+if COMPRESSION_ENABLED:
+    app.wsgi_app = CompressionMiddleware(app.wsgi_app)
@@ -0,0 +1,366 @@
+"""Cutting plans: which stock boards to buy for an order and how to saw them.
+
+An order (pallets and quantities) is broken into pieces: upper, lower and
+closure boards and the ``BLOCK_COUNT`` blocks of every pallet. Pieces with
+the same cross-section are sawn from the same stock, so every profile
+(width x thickness) is planned on its own as a one-dimensional cutting-stock
+problem over the available stock lengths. Every saw cut costs ``kerf`` cm.
+
+Two modes:
+
+``fast``
+    Best fit decreasing: pieces longest first, each into the open board with
+    the least room left that still fits it. Every board is finally bought in
+    the shortest stock length that holds its cuts.
+``optimal``
+    Also finds the least-waste cutting pattern of every stock length with a
+    bounded knapsack over the board length and repeatedly applies the best
+    one as often as the remaining demand allows (sequential heuristic
+    procedure). Once ``OPTIMAL_TIME_BUDGET`` is used up, the rest of the
+    demand is planned best fit decreasing. Per profile the plan that needs
+    less stock length is kept.
+
+Lengths are handled as integers in 1/100 cm so sums are exact.
+"""
+from utils import BLOCK_COUNT
+from collections import Counter
+from functools import reduce
+import bisect
+import logging
+import math
+import os
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STOCK_LENGTHS = tuple(
+    float(length) for length in os.environ.get('CUTTING_STOCK_LENGTHS', '200,250,300,400').split(',')
+)
+DEFAULT_KERF = float(os.environ.get('CUTTING_KERF', '0.4'))
+MODES = ('fast', 'optimal')
+
+MAX_ORDER_PIECES = 500000
+MAX_ORDER_QUANTITY = 100000
+MAX_ORDER_PALLETS = 500
+MAX_PROFILE_LENGTHS = 500
+# Seconds optimal mode spends on patterns per plan before it falls back to best fit decreasing
+OPTIMAL_TIME_BUDGET = float(os.environ.get('CUTTING_OPTIMAL_SECONDS', '0.5'))
+
+# Lengths in 1/100 cm
+SCALE = 100
+
+# (key, label, length field, width field, thickness field, quantity field)
+COMPONENTS = (
+    ('upper_board', 'Üst tahta', 'upper_board_length', 'upper_board_width', 'board_thickness', 'upper_board_quantity'),
+    ('lower_board', 'Alt tahta', 'lower_board_length', 'lower_board_width', 'board_thickness', 'lower_board_quantity'),
+    ('closure', 'Kapama', 'closure_length', 'closure_width', 'board_thickness', 'closure_quantity'),
+    ('block', 'Takoz', 'block_length', 'block_width', 'block_height', None),
+)
+
+
+class CuttingPlanError(ValueError):
+    """The order can not be planned; the message is shown to the user"""
+
+
+def _units(value):
+    return int(round(float(value) * SCALE))
+
+
+def _cm(units):
+    return round(units / SCALE, 2)
+
+
+def order_pieces(order):
+    """Group the pieces of an order by profile.
+
+    ``order`` is a list of ``(pallet, quantity)`` where ``pallet`` has the
+    dimension fields as attributes. Returns ``{profile: {'pieces': Counter of
+    length -> count, 'components': set of labels}}`` with a profile key of
+    ``(kind, width, thickness)`` in 1/100 cm.
+    """
+    profiles = {}
+    total = 0
+    for pallet, quantity in order:
+        for key, label, length_field, width_field, thickness_field, quantity_field in COMPONENTS:
+            per_pallet = BLOCK_COUNT if quantity_field is None else int(getattr(pallet, quantity_field) or 0)
+            length = _units(getattr(pallet, length_field) or 0)
+            if per_pallet <= 0 or length <= 0:
+                continue
+            kind = 'block' if key == 'block' else 'board'
+            profile = (kind, _units(getattr(pallet, width_field) or 0), _units(getattr(pallet, thickness_field) or 0))
+            entry = profiles.setdefault(profile, {'pieces': Counter(), 'components': set()})
+            entry['pieces'][length] += per_pallet * quantity
+            entry['components'].add(label)
+            total += per_pallet * quantity
+    if total > MAX_ORDER_PIECES:
+        raise CuttingPlanError(f'Sipariş en fazla {MAX_ORDER_PIECES} parça içerebilir')
+    if any(len(entry['pieces']) > MAX_PROFILE_LENGTHS for entry in profiles.values()):
+        raise CuttingPlanError(f'Bir kesitte en fazla {MAX_PROFILE_LENGTHS} farklı parça boyu olabilir')
+    return profiles
+
+
+def parse_order_items(items):
+    """Validate ``[{"pallet_id": 1, "quantity": 500}, ...]``; returns ``{pallet id: quantity}``"""
+    if not isinstance(items, list) or not items:
+        raise CuttingPlanError('En az bir palet ve adet giriniz')
+    quantities = {}
+    for item in items:
+        try:
+            pallet_id = int(item.get('pallet_id'))
+            quantity = int(item.get('quantity'))
+        except (AttributeError, TypeError, ValueError):
+            raise CuttingPlanError('Geçersiz palet veya adet')
+        if not 1 <= quantity <= MAX_ORDER_QUANTITY:
+            raise CuttingPlanError(f'Adet 1-{MAX_ORDER_QUANTITY} arasında olmalıdır')
+        quantities[pallet_id] = quantities.get(pallet_id, 0) + quantity
+    if len(quantities) > MAX_ORDER_PALLETS:
+        raise CuttingPlanError(f'Sipariş en fazla {MAX_ORDER_PALLETS} farklı palet içerebilir')
+    return quantities
+
+
+def parse_stock_lengths(value):
+    """Stock lengths from a list or a comma separated string; None for the defaults"""
+    if value in (None, '', []):
+        return None
+    if isinstance(value, str):
+        value = [part for part in value.replace(';', ',').split(',') if part.strip()]
+    try:
+        lengths = [float(str(length).replace(',', '.')) for length in value]
+    except (TypeError, ValueError):
+        raise CuttingPlanError('Geçersiz stok boyu')
+    if not lengths or len(lengths) > 20 or min(lengths) <= 0:
+        raise CuttingPlanError('Stok boyları pozitif olmalıdır (en fazla 20 boy)')
+    return lengths
+
+
+def parse_kerf(value):
+    if value in (None, ''):
+        return None
+    try:
+        kerf = float(str(value).replace(',', '.'))
+    except ValueError:
+        raise CuttingPlanError('Geçersiz testere payı')
+    if not 0 <= kerf <= 5:
+        raise CuttingPlanError('Testere payı 0-5 cm arasında olmalıdır')
+    return kerf
+
+
+def _needed(cuts, kerf):
+    """Stock length used by the given piece lengths, with a saw cut between pieces"""
+    count = sum(cuts.values())
+    return sum(length * n for length, n in cuts.items()) + kerf * max(count - 1, 0)
+
+
+def _shortest_stock(needed, stock_lengths):
+    return stock_lengths[bisect.bisect_left(stock_lengths, needed)]
+
+
+def best_fit_decreasing(demand, stock_lengths, kerf, open_length=None):
+    """Fast plan: returns ``Counter`` of ``(stock length, cuts)`` -> board count.
+
+    ``cuts`` is a sorted tuple of ``(piece length, count)``.
+    """
+    open_length = open_length or stock_lengths[-1]
+    capacity = open_length + kerf
+    smallest = min(demand) + kerf
+    boards = []
+    free = []  # sorted (room left, board index) of boards that still fit the shortest piece
+    for length in sorted(demand, reverse=True):
+        size = length + kerf
+        left = demand[length]
+        while left:
+            i = bisect.bisect_left(free, (size, -1))
+            if i < len(free):
+                room, index = free.pop(i)
+                placed = 1
+            else:
+                # No open board fits this length any more, so a new board takes as many as fit
+                room, index = capacity, len(boards)
+                boards.append(Counter())
+                placed = min(room // size, left)
+            boards[index][length] += placed
+            room -= placed * size
+            left -= placed
+            if room >= smallest:
+                bisect.insort(free, (room, index))
+
+    plan = Counter()
+    for cuts in boards:
+        plan[(_shortest_stock(_needed(cuts, kerf), stock_lengths), tuple(sorted(cuts.items(), reverse=True)))] += 1
+    return plan
+
+
+def best_patterns(demand, stock_lengths, kerf):
+    """Least-waste cutting pattern of every stock length, bounded by the remaining demand.
+
+    Bounded knapsack over the board length: every piece length is split into
+    bundles of 1, 2, 4, ... pieces and ``reach`` marks the lengths some set of
+    bundles fills exactly. ``first`` keeps the bundle that reached a length
+    first; it was reached from a length filled by earlier bundles only, so a
+    pattern is read back by walking down ``first``. Lengths are divided by the
+    common divisor of all piece sizes and boards. Returns ``{stock length:
+    pattern}`` with patterns as ``{piece length: count}``.
+    """
+    sizes = {length: length + kerf for length in demand}
+    unit = reduce(math.gcd, list(sizes.values()) + [length + kerf for length in stock_lengths])
+    capacity = (stock_lengths[-1] + kerf) // unit
+    bundles = []
+    for length, need in demand.items():
+        size = sizes[length] // unit
+        need = min(need, capacity // size)
+        bundle = 1
+        while need > 0:
+            count = min(bundle, need)
+            bundles.append((length, count, size * count))
+            need -= count
+            bundle *= 2
+
+    reach = np.zeros(capacity + 1, dtype=bool)
+    reach[0] = True
+    first = np.full(capacity + 1, -1, dtype=np.int32)
+    for index, (_, _, size) in enumerate(bundles):
+        added = reach[:-size] & ~reach[size:]
+        first[size:][added] = index
+        reach[size:] |= added
+
+    patterns = {}
+    for stock_length in stock_lengths:
+        filled = int(np.flatnonzero(reach[:(stock_length + kerf) // unit + 1])[-1])
+        pattern = Counter()
+        while filled:
+            length, count, size = bundles[first[filled]]
+            pattern[length] += count
+            filled -= size
+        if pattern:
+            patterns[stock_length] = dict(pattern)
+    return patterns
+
+
+def sequential_patterns(demand, stock_lengths, kerf, deadline=None):
+    """Near-optimal plan: apply the least-waste pattern as often as the demand allows, repeat.
+
+    Demand still left at ``deadline`` (a ``time.perf_counter`` value) is
+    planned best fit decreasing.
+    """
+    remaining = Counter(demand)
+    plan = Counter()
+    while remaining:
+        if deadline is not None and time.perf_counter() > deadline:
+            plan.update(best_fit_decreasing(remaining, stock_lengths, kerf))
+            break
+        best = None
+        for stock_length, pattern in best_patterns(remaining, stock_lengths, kerf).items():
+            waste = (stock_length - _needed(pattern, kerf)) / stock_length
+            repeat = min(remaining[length] // count for length, count in pattern.items())
+            key = (waste, -repeat, stock_length)
+            if best is None or key < best[0]:
+                best = (key, stock_length, pattern, repeat)
+        if best is None:
+            raise CuttingPlanError('Kesim planı oluşturulamadı')
+        _, stock_length, pattern, repeat = best
+        plan[(stock_length, tuple(sorted(pattern.items(), reverse=True)))] += repeat
+        for length, count in pattern.items():
+            remaining[length] -= count * repeat
+            if remaining[length] <= 0:
+                del remaining[length]
+    return plan
+
+
+def _plan_length(plan):
+    return sum(stock_length * count for (stock_length, _), count in plan.items())
+
+
+def plan_profile(demand, stock_lengths, kerf, mode='fast', deadline=None):
+    """Plan one profile; returns ``(plan, algorithm)``"""
+    candidates = [(best_fit_decreasing(demand, stock_lengths, kerf), 'best_fit_decreasing')]
+    if mode == 'optimal':
+        for open_length in stock_lengths[:-1]:
+            if deadline is not None and time.perf_counter() > deadline:
+                break
+            if open_length >= max(demand):
+                candidates.append((best_fit_decreasing(demand, stock_lengths, kerf, open_length),
+                                   'best_fit_decreasing'))
+        candidates.append((sequential_patterns(demand, stock_lengths, kerf, deadline), 'sequential_patterns'))
+    return min(candidates, key=lambda candidate: (_plan_length(candidate[0]), sum(candidate[0].values())))
+
+
+def _profile_label(kind, width, thickness):
+    name = 'takoz kalası' if kind == 'block' else 'tahta'
+    return f'{_cm(width):g} x {_cm(thickness):g} cm {name}'
+
+
+def build_cutting_plan(order, stock_lengths=None, kerf=None, mode='fast'):
+    """Plan the stock boards and cuts for ``order`` (a list of ``(pallet, quantity)``).
+
+    ``stock_lengths`` and ``kerf`` are in cm. Returns a JSON-ready dict with
+    one entry per profile and order totals (pieces, boards, desi, waste).
+    """
+    if mode not in MODES:
+        raise CuttingPlanError('Geçersiz plan modu')
+    stock_lengths = sorted({_units(length) for length in (stock_lengths or DEFAULT_STOCK_LENGTHS)})
+    kerf = _units(DEFAULT_KERF if kerf is None else kerf)
+    if not stock_lengths or stock_lengths[0] <= 0 or kerf < 0:
+        raise CuttingPlanError('Stok boyları ve testere payı pozitif olmalıdır')
+
+    started = time.perf_counter()
+    deadline = started + OPTIMAL_TIME_BUDGET
+    profiles = []
+    totals = {'piece_count': 0, 'board_count': 0, 'piece_desi': 0.0, 'stock_desi': 0.0}
+    for (kind, width, thickness), entry in sorted(order_pieces(order).items()):
+        demand = entry['pieces']
+        if max(demand) > stock_lengths[-1]:
+            raise CuttingPlanError(
+                f'{_cm(max(demand)):g} cm parça en uzun stok boyundan ({_cm(stock_lengths[-1]):g} cm) uzun'
+            )
+        plan, algorithm = plan_profile(demand, stock_lengths, kerf, mode, deadline)
+        section = width * thickness / SCALE ** 2 / 1000  # desi per cm of length
+        piece_length = sum(length * count for length, count in demand.items())
+        stock_length = _plan_length(plan)
+        stock = Counter()
+        for (length, _), count in plan.items():
+            stock[length] += count
+        profile = {
+            'profile': _profile_label(kind, width, thickness),
+            'kind': kind,
+            'width': _cm(width),
+            'thickness': _cm(thickness),
+            'components': sorted(entry['components']),
+            'algorithm': algorithm,
+            'pieces': [{'length': _cm(length), 'count': count} for length, count in sorted(demand.items(), reverse=True)],
+            'stock': [{'length': _cm(length), 'count': count} for length, count in sorted(stock.items())],
+            'patterns': [
+                {
+                    'stock_length': _cm(length),
+                    'cuts': [{'length': _cm(piece), 'count': count} for piece, count in cuts],
+                    'count': repeat,
+                    'waste': _cm(length - _needed(dict(cuts), kerf)),
+                }
+                for (length, cuts), repeat in sorted(plan.items(), key=lambda item: -item[1])
+            ],
+            'piece_count': sum(demand.values()),
+            'board_count': sum(plan.values()),
+            'piece_desi': round(piece_length / SCALE * section, 2),
+            'stock_desi': round(stock_length / SCALE * section, 2),
+            'waste_percent': round((stock_length - piece_length) / stock_length * 100, 2),
+        }
+        profiles.append(profile)
+        for field in totals:
+            totals[field] += profile[field]
+
+    totals['piece_desi'] = round(totals['piece_desi'], 2)
+    totals['stock_desi'] = round(totals['stock_desi'], 2)
+    totals['waste_desi'] = round(totals['stock_desi'] - totals['piece_desi'], 2)
+    totals['waste_percent'] = round(totals['waste_desi'] / totals['stock_desi'] * 100, 2) if totals['stock_desi'] else 0.0
+    seconds = round(time.perf_counter() - started, 4)
+    logger.info(f"Cutting plan ({mode}): {totals['piece_count']} pieces on {totals['board_count']} boards "
+                f"in {seconds} s")
+    return {
+        'mode': mode,
+        'kerf': _cm(kerf),
+        'stock_lengths': [_cm(length) for length in stock_lengths],
+        'profiles': profiles,
+        'totals': totals,
+        'seconds': seconds,
+    }
@@ -0,0 +1,128 @@
+from app import db
+from models import Company, Pallet, User, UserDataVersion
+from sqlalchemy import event, insert, inspect, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from datetime import datetime
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def get_data_version(user_id):
+    """Return the current data version of a user (0 if nothing was written yet)"""
+    version = db.session.execute(
+        select(UserDataVersion.version).where(UserDataVersion.user_id == user_id)
+    ).scalar()
+    return version or 0
+
+
+def bump_data_version(user_ids, connection=None):
+    """Increment the data version of the given users inside the current transaction.
+
+    Bulk statements (``session.execute(update(Pallet), ...)`` and friends) do
+    not go through the ORM flush, so code issuing them must call this itself.
+    """
+    user_ids = sorted({user_id for user_id in user_ids if user_id is not None})
+    if not user_ids:
+        return
+    connection = connection or db.session.connection()
+    now = datetime.utcnow()
+    result = connection.execute(
+        update(UserDataVersion)
+        .where(UserDataVersion.user_id.in_(user_ids))
+        .values(version=UserDataVersion.version + 1, updated_at=now)
+    )
+    if result.rowcount == len(user_ids):
+        return
+
+    existing = set(connection.execute(
+        select(UserDataVersion.user_id).where(UserDataVersion.user_id.in_(user_ids))
+    ).scalars())
+    for user_id in user_ids:
+        if user_id in existing:
+            continue
+        try:
+            with connection.begin_nested():
+                connection.execute(insert(UserDataVersion).values(user_id=user_id, version=1, updated_at=now))
+        except IntegrityError:
+            # Another transaction created the row in the meantime
+            connection.execute(
+                update(UserDataVersion)
+                .where(UserDataVersion.user_id == user_id)
+                .values(version=UserDataVersion.version + 1, updated_at=now)
+            )
+
+
+def bump_data_version_if(user_id, expected_version, connection=None):
+    """Increment the data version of a user only if it still is ``expected_version``.
+
+    The conditional UPDATE takes the row lock, so pallet writes of the user
+    (which all bump the version) wait until the current transaction ends.
+    Returns False if the version has moved on.
+    """
+    connection = connection or db.session.connection()
+    now = datetime.utcnow()
+    result = connection.execute(
+        update(UserDataVersion)
+        .where(UserDataVersion.user_id == user_id, UserDataVersion.version == expected_version)
+        .values(version=UserDataVersion.version + 1, updated_at=now)
+    )
+    if result.rowcount == 1:
+        return True
+    if expected_version != 0:
+        return False
+    # Version 0 means the row does not exist yet
+    try:
+        with connection.begin_nested():
+            connection.execute(insert(UserDataVersion).values(user_id=user_id, version=1, updated_at=now))
+    except IntegrityError:
+        return False
+    return True
+
+
+def bump_data_version_for_companies(company_ids, connection=None):
+    """Increment the data version of the owners of the given companies"""
+    company_ids = {company_id for company_id in company_ids if company_id is not None}
+    if not company_ids:
+        return
+    connection = connection or db.session.connection()
+    user_ids = connection.execute(
+        select(Company.user_id).where(Company.id.in_(company_ids)).distinct()
+    ).scalars().all()
+    bump_data_version(user_ids, connection)
+
+
+@event.listens_for(Session, 'after_flush')
+def _bump_versions_after_flush(session, flush_context):
+    """Bump the data version of every user whose account, companies or pallets were flushed"""
+    user_ids = set()
+    company_ids = set()
+    for instance in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(instance, User):
+            # The version of a new user starts at 0 and a deleted one loses its row
+            if instance in session.dirty and session.is_modified(instance):
+                user_ids.add(instance.id)
+        elif isinstance(instance, Company):
+            user_ids.add(instance.user_id)
+            history = inspect(instance).attrs.user_id.history
+            user_ids.update(history.deleted or ())
+        elif isinstance(instance, Pallet):
+            if instance in session.dirty and not session.is_modified(instance):
+                continue
+            company_ids.add(instance.company_id)
+            history = inspect(instance).attrs.company_id.history
+            company_ids.update(history.deleted or ())
+
+    if not user_ids and not company_ids:
+        return
+    try:
+        connection = session.connection()
+        if company_ids:
+            user_ids.update(connection.execute(
+                select(Company.user_id).where(Company.id.in_(company_ids)).distinct()
+            ).scalars())
+        bump_data_version(user_ids, connection)
+    except Exception as e:
+        logger.error(f"Error updating data versions: {str(e)}")
+        raise
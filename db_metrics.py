@@ -0,0 +1,227 @@
+"""Database instrumentation: query counting, pool state and statement latency.
+
+``InstrumentedQueuePool`` times every connection checkout (including waits
+for a free connection and opening overflow connections) and counts checkout
+timeouts. ``instrument_engine`` adds cursor events that record the latency of
+every statement by kind. ``snapshot`` combines both with the live pool gauges.
+All numbers are per worker process.
+
+This module does not import the app at module level, so ``app.py`` can use
+the pool class while creating the engine.
+"""
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+from contextlib import contextmanager
+import bisect
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Statements slower than this are logged with a warning (0 disables)
+DB_SLOW_QUERY_MS = float(os.environ.get('DB_SLOW_QUERY_MS', '500'))
+
+# Histogram bucket upper bounds in seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+STATEMENT_KINDS = ('select', 'insert', 'update', 'delete')
+
+
+def _default_engine():
+    from app import db
+    return db.engine
+
+
+class Histogram:
+    """Thread-safe cumulative histogram with fixed buckets"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+            self._max = max(self._max, value)
+
+    def snapshot(self):
+        """Return count, sum, max and cumulative bucket counts (``le`` -> count)"""
+        with self._lock:
+            counts = list(self._counts)
+            total, maximum = self._sum, self._max
+        cumulative = {}
+        running = 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            running += count
+            cumulative[bound] = running
+        return {'count': running, 'sum': total, 'max': maximum, 'buckets': cumulative}
+
+
+class PoolMetrics:
+    """Checkout and statement measurements shared by all instrumented engines"""
+
+    def __init__(self):
+        self.checkout_wait = Histogram()
+        self.checkout_timeouts = 0
+        self.statements = {kind: Histogram() for kind in STATEMENT_KINDS + ('other',)}
+        self.slow_statements = 0
+        self._lock = threading.Lock()
+
+    def count_timeout(self):
+        with self._lock:
+            self.checkout_timeouts += 1
+
+    def count_slow_statement(self):
+        with self._lock:
+            self.slow_statements += 1
+
+
+pool_metrics = PoolMetrics()
+
+# Statement count and time of the request running on this thread
+_request_sql = threading.local()
+
+
+def start_request_sql_tracking():
+    _request_sql.count = 0
+    _request_sql.seconds = 0.0
+    _request_sql.active = True
+
+
+def stop_request_sql_tracking():
+    """Stop tracking and return ``(statement count, seconds)`` since the start"""
+    if not getattr(_request_sql, 'active', False):
+        return 0, 0.0
+    _request_sql.active = False
+    return _request_sql.count, _request_sql.seconds
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that records how long every checkout takes"""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            pool_metrics.count_timeout()
+            logger.warning(
+                f"Connection pool exhausted: {self.checkedout()} checked out, overflow {self.overflow()}"
+            )
+            raise
+        finally:
+            pool_metrics.checkout_wait.observe(time.perf_counter() - started)
+
+
+def _statement_kind(statement):
+    kind = statement.lstrip()[:6].lower()
+    return kind if kind in STATEMENT_KINDS else 'other'
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._db_metrics_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, '_db_metrics_started', None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+    pool_metrics.statements[_statement_kind(statement)].observe(elapsed)
+    if getattr(_request_sql, 'active', False):
+        _request_sql.count += 1
+        _request_sql.seconds += elapsed
+    if DB_SLOW_QUERY_MS and elapsed * 1000 >= DB_SLOW_QUERY_MS:
+        pool_metrics.count_slow_statement()
+        logger.warning(f"Slow SQL ({elapsed * 1000:.0f} ms): {' '.join(statement.split())[:300]}")
+
+
+def instrument_engine(engine):
+    """Record the latency of every statement executed through ``engine``"""
+    if not event.contains(engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+
+def pool_status(engine=None):
+    """Return the live gauges of the engine's pool (None where the pool has no such value)"""
+    pool = (engine or _default_engine()).pool
+    status = {'pool_class': type(pool).__name__}
+    for name, method in (('size', 'size'), ('checked_out', 'checkedout'),
+                         ('checked_in', 'checkedin'), ('overflow', 'overflow')):
+        status[name] = getattr(pool, method)() if hasattr(pool, method) else None
+    if status['overflow'] is not None:
+        # QueuePool reports negative overflow while connections are still unopened
+        status['overflow'] = max(status['overflow'], 0)
+    status['max_overflow'] = getattr(pool, '_max_overflow', None)
+    status['timeout'] = pool.timeout() if hasattr(pool, 'timeout') else None
+    return status
+
+
+def snapshot(engine=None):
+    """Pool gauges, checkout wait and statement latency of this worker as a dict"""
+    return {
+        'pool': pool_status(engine),
+        'checkout_wait': pool_metrics.checkout_wait.snapshot(),
+        'checkout_timeouts': pool_metrics.checkout_timeouts,
+        'statements': {kind: histogram.snapshot() for kind, histogram in pool_metrics.statements.items()},
+        'slow_statements': pool_metrics.slow_statements,
+    }
+
+
+class QueryCounter:
+    """Collects the SQL statements executed by the current thread"""
+
+    def __init__(self):
+        self.statements = []
+        self._thread_id = threading.get_ident()
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if threading.get_ident() == self._thread_id:
+            self.statements.append(statement)
+
+
+@contextmanager
+def count_queries(engine=None):
+    """Count the SQL statements executed inside the ``with`` block.
+
+    Usage::
+
+        with count_queries() as counter:
+            client.get('/pallets')
+        print(counter.count, counter.statements)
+    """
+    engine = engine or _default_engine()
+    counter = QueryCounter()
+    event.listen(engine, 'before_cursor_execute', counter._before_cursor_execute)
+    try:
+        yield counter
+    finally:
+        event.remove(engine, 'before_cursor_execute', counter._before_cursor_execute)
+
+
+@contextmanager
+def assert_max_queries(limit, engine=None):
+    """Fail with an AssertionError if the block executes more than ``limit`` statements.
+
+    The benchmark suite uses it to guard the listings and exports against
+    N+1 query regressions (``QUERY_BUDGETS`` in ``benchmarks/run_benchmarks.py``).
+    """
+    with count_queries(engine) as counter:
+        yield counter
+    if counter.count > limit:
+        statements = '\n'.join(f'  {statement}' for statement in counter.statements)
+        raise AssertionError(f"Expected at most {limit} queries, got {counter.count}:\n{statements}")
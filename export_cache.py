@@ -0,0 +1,141 @@
+"""Size-limited LRU disk cache for rendered PDF and CSV exports.
+
+Entries are keyed by the user, the export kind, the normalized filter set and
+the user's data version, so any write to the user's companies or pallets
+makes old entries unreachable; they age out through LRU eviction. The ETag of
+an entry is the SHA-256 of its content. The cache directory can be shared by
+all web workers on the host.
+"""
+from contextlib import contextmanager
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+EXPORT_CACHE_ENABLED = os.environ.get('EXPORT_CACHE_ENABLED', '1') != '0'
+EXPORT_CACHE_DIR = os.environ.get('EXPORT_CACHE_DIR') or os.path.join(tempfile.gettempdir(), 'palet_export_cache')
+EXPORT_CACHE_MAX_BYTES = int(os.environ.get('EXPORT_CACHE_MAX_BYTES', str(256 * 1024 * 1024)))
+
+_evict_lock = threading.Lock()
+
+
+def cache_key(user_id, kind, filter_args, version):
+    """Build the cache key of an export from its inputs"""
+    normalized = {name: str(value) for name, value in sorted(filter_args.items())}
+    payload = json.dumps([user_id, kind, normalized, version], sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _data_path(key):
+    return os.path.join(EXPORT_CACHE_DIR, f'{key}.bin')
+
+
+def _meta_path(key):
+    return os.path.join(EXPORT_CACHE_DIR, f'{key}.json')
+
+
+def get(key):
+    """Return the entry dict for ``key`` (with ``path`` and ``etag``) or None.
+
+    A hit refreshes the entry's position in the LRU order.
+    """
+    if not EXPORT_CACHE_ENABLED:
+        return None
+    try:
+        with open(_meta_path(key), encoding='utf-8') as f:
+            entry = json.load(f)
+        path = _data_path(key)
+        now = time.time()
+        os.utime(path, (now, now))
+        entry['path'] = path
+        return entry
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning(f"Unreadable export cache entry {key}: {str(e)}")
+        return None
+
+
+@contextmanager
+def writer(key, mimetype, download_name):
+    """Write an entry incrementally; it becomes visible only if the block completes.
+
+    Yields a ``write(bytes)`` callable. The content hash (the ETag) is
+    computed while writing, so streamed exports can be cached as they go.
+    """
+    if not EXPORT_CACHE_ENABLED:
+        yield lambda data: None
+        return
+
+    os.makedirs(EXPORT_CACHE_DIR, exist_ok=True)
+    digest = hashlib.sha256()
+    fd, tmp_path = tempfile.mkstemp(dir=EXPORT_CACHE_DIR, suffix='.tmp')
+    size = 0
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            def write(data):
+                nonlocal size
+                f.write(data)
+                digest.update(data)
+                size += len(data)
+            yield write
+        entry = {'etag': digest.hexdigest(), 'mimetype': mimetype, 'download_name': download_name,
+                 'size': size, 'created_at': time.time()}
+        os.replace(tmp_path, _data_path(key))
+        # A unique name per write: threads of one worker may store the same key at once
+        fd, tmp_path = tempfile.mkstemp(dir=EXPORT_CACHE_DIR, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, _meta_path(key))
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    evict()
+
+
+def put(key, data, mimetype, download_name):
+    """Store ``data`` (bytes) as the entry for ``key`` and return its ETag"""
+    with writer(key, mimetype, download_name) as write:
+        write(data)
+    return hashlib.sha256(data).hexdigest()
+
+
+def evict(max_bytes=None):
+    """Remove least recently used entries until the cache fits in ``max_bytes``"""
+    max_bytes = EXPORT_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    if not os.path.isdir(EXPORT_CACHE_DIR):
+        return 0
+    with _evict_lock:
+        entries = []
+        total = 0
+        for entry in os.scandir(EXPORT_CACHE_DIR):
+            if not entry.name.endswith('.bin'):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.name[:-4]))
+            total += stat.st_size
+        if total <= max_bytes:
+            return 0
+
+        removed = 0
+        for _, size, key in sorted(entries):
+            if total <= max_bytes:
+                break
+            for path in (_meta_path(key), _data_path(key)):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            total -= size
+            removed += 1
+        logger.info(f"Evicted {removed} export cache entries")
+        return removed
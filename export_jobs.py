@@ -0,0 +1,200 @@
+"""Background export jobs rendered in a local process pool.
+
+Job state lives in small JSON files next to the rendered output, so every web
+worker on the host can report the status of a job and serve its file no
+matter which worker submitted it. This module does not import the Flask app;
+worker processes only need it and ``pdf_export``.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import json
+import logging
+import multiprocessing
+import os
+import re
+import tempfile
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+EXPORT_JOB_WORKERS = int(os.environ.get('EXPORT_JOB_WORKERS', '2'))
+EXPORT_JOB_DIR = os.environ.get('EXPORT_JOB_DIR') or os.path.join(tempfile.gettempdir(), 'palet_export_jobs')
+# Seconds a finished (or failed) job and its file are kept on disk
+EXPORT_JOB_TTL = int(os.environ.get('EXPORT_JOB_TTL', '3600'))
+
+# Minimum seconds between two progress writes of a running job
+PROGRESS_WRITE_INTERVAL = 0.5
+
+STATUS_QUEUED = 'queued'
+STATUS_RUNNING = 'running'
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+
+_JOB_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _meta_path(job_id):
+    return os.path.join(EXPORT_JOB_DIR, f'{job_id}.json')
+
+
+def job_file_path(job_id):
+    """Return the path of the rendered file of a job"""
+    return os.path.join(EXPORT_JOB_DIR, f'{job_id}.pdf')
+
+
+def _write_meta(job_id, **changes):
+    """Merge ``changes`` into the job state file; the file is replaced atomically"""
+    meta = read_job(job_id) or {}
+    meta.update(changes)
+    meta['updated_at'] = time.time()
+    # A unique name per write: the submitting thread and the done callback may write at once
+    fd, tmp_path = tempfile.mkstemp(dir=EXPORT_JOB_DIR, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, _meta_path(job_id))
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return meta
+
+
+def read_job(job_id):
+    """Return the state dict of a job, or None if it does not exist"""
+    if not job_id or not _JOB_ID_PATTERN.match(job_id):
+        return None
+    try:
+        with open(_meta_path(job_id), encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.error(f"Error reading export job {job_id}: {str(e)}")
+        return None
+
+
+def _get_executor():
+    """Create the process pool on first use"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            os.makedirs(EXPORT_JOB_DIR, exist_ok=True)
+            # Forked workers do not re-import the web entry point (and its app setup)
+            context = None
+            if 'fork' in multiprocessing.get_all_start_methods():
+                context = multiprocessing.get_context('fork')
+            _executor = ProcessPoolExecutor(max_workers=max(EXPORT_JOB_WORKERS, 1), mp_context=context)
+            logger.info(f"Export job pool started with {max(EXPORT_JOB_WORKERS, 1)} workers")
+        return _executor
+
+
+def _reset_executor(executor):
+    """Drop a broken pool so the next ``_get_executor`` starts a new one.
+
+    A worker that dies (e.g. killed for memory) breaks the whole pool and
+    every later ``submit`` on it fails.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is not executor:
+            return
+        _executor = None
+    executor.shutdown(wait=False, cancel_futures=True)
+    logger.warning("Export job pool is broken and will be restarted")
+
+
+def render_pdf_job(job_id, pallets, filter_text, company):
+    """Worker process entry point: render the pallet PDF of a job to disk"""
+    from pdf_export import build_pallets_pdf
+
+    last_write = [0.0]
+
+    def progress(fraction):
+        now = time.monotonic()
+        if now - last_write[0] >= PROGRESS_WRITE_INTERVAL:
+            last_write[0] = now
+            _write_meta(job_id, progress=round(fraction, 3))
+
+    _write_meta(job_id, status=STATUS_RUNNING, started_at=time.time())
+    output_path = job_file_path(job_id)
+    tmp_path = f'{output_path}.tmp'
+    try:
+        summary = build_pallets_pdf(tmp_path, pallets, filter_text=filter_text, company=company, progress=progress)
+        os.replace(tmp_path, output_path)
+    except Exception as e:
+        logger.error(f"Export job {job_id} failed: {str(e)}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        _write_meta(job_id, status=STATUS_FAILED, error=str(e), finished_at=time.time())
+        raise
+    _write_meta(
+        job_id, status=STATUS_DONE, progress=1.0, finished_at=time.time(),
+        size=os.path.getsize(output_path), summary=summary
+    )
+    return summary
+
+
+def _on_job_finished(job_id, executor, future):
+    """Mark jobs failed whose worker died without writing a final state"""
+    error = future.exception()
+    if error is None:
+        return
+    if isinstance(error, BrokenProcessPool):
+        _reset_executor(executor)
+    meta = read_job(job_id)
+    if meta and meta.get('status') not in (STATUS_DONE, STATUS_FAILED):
+        _write_meta(job_id, status=STATUS_FAILED, error=str(error), finished_at=time.time())
+
+
+def submit_pdf_job(user_id, pallets, filter_text=None, company=None, download_name='paletler.pdf'):
+    """Queue a pallet PDF for rendering and return the job state dict.
+
+    ``pallets`` must be plain dicts (they are pickled to the worker process).
+    """
+    cleanup_expired_jobs()
+    job_id = uuid.uuid4().hex
+    os.makedirs(EXPORT_JOB_DIR, exist_ok=True)
+    meta = _write_meta(
+        job_id, id=job_id, user_id=user_id, kind='pdf', status=STATUS_QUEUED, progress=0.0,
+        rows=len(pallets), download_name=download_name, created_at=time.time()
+    )
+    for attempt in range(2):
+        executor = _get_executor()
+        try:
+            future = executor.submit(render_pdf_job, job_id, pallets, filter_text, company)
+            break
+        except BrokenProcessPool as e:
+            _reset_executor(executor)
+            if attempt:
+                _write_meta(job_id, status=STATUS_FAILED, error=str(e), finished_at=time.time())
+                raise
+    future.add_done_callback(lambda f: _on_job_finished(job_id, executor, f))
+    logger.info(f"Export job {job_id} queued with {len(pallets)} rows")
+    return meta
+
+
+def cleanup_expired_jobs(ttl=None):
+    """Delete job states and files older than ``ttl`` seconds; returns the number removed"""
+    ttl = EXPORT_JOB_TTL if ttl is None else ttl
+    if not os.path.isdir(EXPORT_JOB_DIR):
+        return 0
+    cutoff = time.time() - ttl
+    removed = 0
+    for entry in os.scandir(EXPORT_JOB_DIR):
+        try:
+            if entry.is_file() and entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+                removed += 1
+        except FileNotFoundError:
+            continue
+        except OSError as e:
+            logger.warning(f"Could not remove expired export file {entry.path}: {str(e)}")
+    if removed:
+        logger.info(f"Removed {removed} expired export job files")
+    return removed
@@ -1,7 +1,8 @@
 from app import db
 from datetime import datetime
+from operator import attrgetter
 from flask_login import UserMixin
-from werkzeug.security import generate_password_hash, check_password_hash
+from passwords import hash_password, verify_password
 
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -13,10 +14,10 @@ class User(UserMixin, db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hash_password(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return verify_password(self.password_hash, password)
 
 class Company(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -28,10 +29,28 @@ class Company(db.Model):
 
 class Pallet(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(100), nullable=False)
+    name = db.Column(db.String(100), nullable=False, index=True)
     company_id = db.Column(db.Integer, db.ForeignKey('company.id', ondelete='CASCADE'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    price = db.Column(db.Numeric(10, 2), nullable=False, default=0.0)
+    price = db.Column(db.Numeric(10, 2), nullable=False, default=0.0, index=True)
+
+    # Dimensions and desi of the pallet, shared with every pallet of the same size
+    spec_id = db.Column(db.Integer, db.ForeignKey('pallet_spec.id'), nullable=False, index=True)
+    spec = db.relationship('PalletSpec', lazy='joined')
+
+    def __repr__(self):
+        return f'<Palet {self.name}>'
+
+class PalletSpec(db.Model):
+    """One distinct set of dimension and quantity values and its desi.
+
+    Pallets that differ only in name, price and company reference the same
+    spec. ``spec_hash`` is the SHA-256 of the canonical dimension values (see
+    ``pallet_specs.spec_hash``). Queries join it through ``Pallet.spec_id``.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    spec_hash = db.Column(db.String(64), unique=True, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     # Board dimensions (all measurements in cm)
     board_thickness = db.Column(db.Numeric(10, 2), nullable=False)
@@ -53,7 +72,126 @@ class Pallet(db.Model):
     lower_board_desi = db.Column(db.Numeric(10, 2))
     closure_desi = db.Column(db.Numeric(10, 2))
     block_desi = db.Column(db.Numeric(10, 2))
-    total_volume = db.Column(db.Numeric(10, 2))
+    total_volume = db.Column(db.Numeric(10, 2), index=True)
 
-    def __repr__(self):
-        return f'<Palet {self.name}>'
+# Read-only ``pallet.board_thickness`` ... for loaded pallets; queries select
+# the ``PalletSpec`` columns and writes set ``spec_id`` (see ``pallet_specs``)
+for _field in PalletSpec.__table__.columns.keys():
+    if _field not in ('id', 'spec_hash', 'created_at'):
+        setattr(Pallet, _field, property(attrgetter(f'spec.{_field}')))
+
+class UserDataVersion(db.Model):
+    """Counter that changes on every write to a user's account, companies or pallets.
+
+    Caches of derived data (exports, listings) include it in their keys and
+    the per-worker user and company caches use it as their generation.
+    """
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), primary_key=True)
+    version = db.Column(db.BigInteger, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class CompanyStats(db.Model):
+    """Pallet aggregates of one company, kept up to date on every pallet write.
+
+    See ``company_stats`` for the hooks that maintain the row; average price
+    and price per desi are derived from the totals when read.
+    """
+    company_id = db.Column(db.Integer, db.ForeignKey('company.id', ondelete='CASCADE'), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False, index=True)
+    pallet_count = db.Column(db.Integer, nullable=False, default=0)
+    total_price = db.Column(db.Numeric(16, 2), nullable=False, default=0)
+    total_volume = db.Column(db.Numeric(16, 2), nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class PalletChange(db.Model):
+    """Pallets written at a data version of their owner.
+
+    In-process indexes (see ``similar_pallets`` and ``search_index``) read
+    the changes newer than the version they were built at and reload only
+    those pallets. Bulk writes that do not know the pallet ids log the
+    company instead (``pallet_id`` empty), and the whole company is reloaded.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
+    version = db.Column(db.BigInteger, nullable=False)
+    pallet_id = db.Column(db.Integer)
+    company_id = db.Column(db.Integer)
+
+    __table_args__ = (db.Index('ix_pallet_change_user_version', 'user_id', 'version'),)
+
+class Employee(db.Model):
+    """A member of staff of a user, paid per day worked (see ``personnel``)"""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False, index=True)
+    first_name = db.Column(db.String(50), nullable=False)
+    last_name = db.Column(db.String(50), nullable=False)
+    national_id = db.Column(db.String(11))
+    # Number of the employee on the time clock and turnstile logs
+    card_number = db.Column(db.String(32))
+    phone = db.Column(db.String(20))
+    email = db.Column(db.String(120))
+    address = db.Column(db.String(255))
+    start_date = db.Column(db.Date, nullable=False)
+    daily_rate = db.Column(db.Numeric(10, 2), nullable=False, default=0)
+    active = db.Column(db.Boolean, nullable=False, default=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'national_id', name='uq_employee_user_national_id'),
+        db.UniqueConstraint('user_id', 'card_number', name='uq_employee_user_card_number'),
+    )
+
+    @property
+    def full_name(self):
+        return f'{self.first_name} {self.last_name}'
+
+class AttendanceWeek(db.Model):
+    """Days an employee worked in one week as a bit mask, bit 0 Monday to bit 5 Saturday.
+
+    One row per employee and week instead of one per day; notes on single
+    days are kept in ``AttendanceNote`` only where there is one.
+    """
+    employee_id = db.Column(db.Integer, db.ForeignKey('employee.id', ondelete='CASCADE'), primary_key=True)
+    week_start = db.Column(db.Date, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
+    days = db.Column(db.SmallInteger, nullable=False, default=0)
+    # Daily rate of this week only; the employee's rate when empty
+    daily_rate = db.Column(db.Numeric(10, 2))
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (db.Index('ix_attendance_week_user_week', 'user_id', 'week_start'),)
+
+class AttendanceNote(db.Model):
+    employee_id = db.Column(db.Integer, db.ForeignKey('employee.id', ondelete='CASCADE'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    note = db.Column(db.String(255), nullable=False)
+
+class Advance(db.Model):
+    """Money paid to an employee during a week, deducted from that week's pay"""
+    id = db.Column(db.Integer, primary_key=True)
+    employee_id = db.Column(db.Integer, db.ForeignKey('employee.id', ondelete='CASCADE'), nullable=False, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
+    paid_on = db.Column(db.Date, nullable=False)
+    amount = db.Column(db.Numeric(10, 2), nullable=False)
+    note = db.Column(db.String(255))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (db.Index('ix_advance_user_paid_on', 'user_id', 'paid_on'),)
+
+class SalaryPayment(db.Model):
+    """Pay of one week paid to an employee, with the figures it was computed from"""
+    id = db.Column(db.Integer, primary_key=True)
+    employee_id = db.Column(db.Integer, db.ForeignKey('employee.id', ondelete='CASCADE'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
+    week_start = db.Column(db.Date, nullable=False)
+    days_worked = db.Column(db.SmallInteger, nullable=False)
+    daily_rate = db.Column(db.Numeric(10, 2), nullable=False)
+    gross = db.Column(db.Numeric(12, 2), nullable=False)
+    advances = db.Column(db.Numeric(12, 2), nullable=False)
+    net = db.Column(db.Numeric(12, 2), nullable=False)
+    paid_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('employee_id', 'week_start', name='uq_salary_payment_employee_week'),
+        db.Index('ix_salary_payment_user_week', 'user_id', 'week_start'),
+    )
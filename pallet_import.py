@@ -0,0 +1,291 @@
+"""Streaming bulk import of pallet catalogs from CSV.
+
+Two layouts are accepted:
+
+* the layout written by ``export_pallets_csv`` (``Palet Adı``, ``Firma``,
+  ``Fiyat (TL)``, ... with ``LxWxT (N adet)`` measurement cells), and
+* a flat layout with one column per field: ``name``, ``company`` (or
+  ``company_id``), ``price`` and every name in ``DIMENSION_FIELDS``.
+
+The file is read row by row; every chunk is validated, its desi values are
+calculated in one vectorized call and the valid rows are written with one
+executemany INSERT and committed, so memory stays bounded by the chunk size.
+"""
+from app import db
+from models import Pallet
+from utils import DIMENSION_FIELDS, calculate_component_volumes_batch
+from api import MAX_NUMERIC, QUANTITY_FIELDS, validate_pallet_data
+from data_version import bump_data_version
+from similar_pallets import log_pallet_changes
+from pallet_specs import DESI_COLUMNS, assign_specs, pallet_rows
+from company_stats import StatsChanges, apply_stats_changes
+from cache import user_companies
+from sqlalchemy import insert
+import csv
+import io
+import logging
+import re
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 2000
+# Rejected rows beyond this are counted but not listed in the report
+MAX_REPORTED_REJECTS = 1000
+
+EXPORT_LAYOUT_COLUMNS = {
+    'Palet Adı': 'name',
+    'Firma': 'company',
+    'Fiyat (TL)': 'price',
+    'Üst Tahta Ölçüleri': 'upper_board',
+    'Alt Tahta Ölçüleri': 'lower_board',
+    'Kapama Ölçüleri': 'closure',
+    'Takoz Ölçüleri': 'block',
+}
+NUMERIC_FIELDS = ('price',) + DIMENSION_FIELDS
+# Float bound for the vectorized checks: comparing a float array with a Decimal raises on NaN cells
+MAX_NUMERIC_FLOAT = float(MAX_NUMERIC)
+FLAT_LAYOUT_COLUMNS = ('name',) + NUMERIC_FIELDS
+
+# "120.00x10.00x2.20 (5 adet)"
+MEASUREMENT_PATTERN = re.compile(
+    r'^\s*([\d.,]+)\s*[xX×]\s*([\d.,]+)\s*[xX×]\s*([\d.,]+)\s*(?:\(\s*(\d+)\s*adet\s*\))?\s*$'
+)
+
+
+class CatalogImportError(ValueError):
+    """Raised when a file cannot be imported at all (as opposed to single rows)"""
+
+
+def normalize_number(value):
+    """Accept both ``12.5`` and the Turkish spreadsheet style ``12,5``"""
+    value = (value or '').strip()
+    if ',' in value and '.' not in value:
+        value = value.replace(',', '.')
+    return value
+
+
+def detect_layout(header):
+    names = [name.strip() for name in header]
+    if 'Palet Adı' in names and 'Üst Tahta Ölçüleri' in names:
+        missing = [name for name in EXPORT_LAYOUT_COLUMNS if name not in names]
+        layout = 'export'
+    else:
+        missing = [name for name in FLAT_LAYOUT_COLUMNS if name not in names]
+        if 'company' not in names and 'company_id' not in names:
+            missing.append('company')
+        layout = 'flat'
+    if missing:
+        raise CatalogImportError(f"Eksik sütunlar: {', '.join(missing)}")
+    known = EXPORT_LAYOUT_COLUMNS if layout == 'export' else FLAT_LAYOUT_COLUMNS + ('company', 'company_id')
+    return layout, {name: index for index, name in enumerate(names) if name in known}
+
+
+def parse_export_row(cells, columns):
+    """Map a row of the export layout to raw pallet fields"""
+    def cell(name):
+        index = columns[name]
+        return cells[index] if index < len(cells) else ''
+
+    data = {'name': cell('Palet Adı'), 'company': cell('Firma'), 'price': cell('Fiyat (TL)')}
+    errors = {}
+    thickness = None
+    for column, prefix in (('Üst Tahta Ölçüleri', 'upper_board'), ('Alt Tahta Ölçüleri', 'lower_board'),
+                           ('Kapama Ölçüleri', 'closure'), ('Takoz Ölçüleri', 'block')):
+        match = MEASUREMENT_PATTERN.match(cell(column))
+        if not match:
+            errors[prefix] = 'Ölçüler "UxGxK (N adet)" biçiminde olmalıdır'
+            continue
+        length, width, third, quantity = match.groups()
+        data[f'{prefix}_length'] = length
+        data[f'{prefix}_width'] = width
+        if prefix == 'block':
+            data['block_height'] = third
+        else:
+            data[f'{prefix}_quantity'] = quantity if quantity is not None else ''
+            thickness = thickness or third
+    if thickness is not None:
+        data['board_thickness'] = thickness
+    return data, errors
+
+
+def parse_flat_row(cells, columns):
+    """Map a row of the flat layout to raw pallet fields"""
+    return {name: cells[index] if index < len(cells) else '' for name, index in columns.items()}, {}
+
+
+def row_errors(data, company_ids, partial=False):
+    """Per-field error messages of one parsed row, from the API validation"""
+    normalized = {name: normalize_number(value) if name in NUMERIC_FIELDS else value for name, value in data.items()}
+    return validate_pallet_data(normalized, company_ids, partial=partial)[1]
+
+
+def _number_column(values):
+    """Parse a column of CSV cells to float64; unparsable cells become NaN"""
+    if any(',' in value for value in values):
+        values = [normalize_number(value) for value in values]
+    try:
+        return np.array(values, dtype=np.float64)
+    except ValueError:
+        column = np.empty(len(values), dtype=np.float64)
+        for i, value in enumerate(values):
+            try:
+                column[i] = float(value)
+            except ValueError:
+                column[i] = np.nan
+        return column
+
+
+def build_chunk(raw_rows, company_ids):
+    """Validate a chunk of parsed rows column by column and calculate their desi.
+
+    Returns ``(rows, indexes, rejected)``: insert-ready dicts, their positions
+    in ``raw_rows`` and ``(position, errors)`` pairs for the rejected rows.
+    Error messages come from the per-row API validation, which only runs for
+    rows the vectorized checks already rejected.
+    """
+    count = len(raw_rows)
+    numbers = {}
+    valid = np.ones(count, dtype=bool)
+    with np.errstate(invalid='ignore'):
+        for field in NUMERIC_FIELDS:
+            column = _number_column([row.get(field, '') for row in raw_rows])
+            ok = np.isfinite(column) & (column >= 0) & (column <= MAX_NUMERIC_FLOAT)
+            if field in QUANTITY_FIELDS:
+                ok &= column == np.floor(column)
+            else:
+                column = np.round(column, 2)
+                if field != 'price':
+                    ok &= column > 0
+            numbers[field] = column
+            valid &= ok
+    names = [(row.get('name') or '').strip() for row in raw_rows]
+    for i, name in enumerate(names):
+        if not 1 <= len(name) <= 100:
+            valid[i] = False
+
+    volumes = calculate_component_volumes_batch({field: numbers[field] for field in DIMENSION_FIELDS})
+    desi_failed = volumes['error'] & valid
+    valid &= ~volumes['error']
+
+    rejected = []
+    for i in np.flatnonzero(~valid).tolist():
+        errors = row_errors(raw_rows[i], company_ids)
+        if not errors:
+            errors = {'_': 'Desi hesaplanamadı' if desi_failed[i] else 'Geçersiz değer'}
+        rejected.append((i, errors))
+
+    indexes = np.flatnonzero(valid)
+    columns = {
+        'name': [names[i] for i in indexes.tolist()],
+        'company_id': [raw_rows[i]['company_id'] for i in indexes.tolist()],
+    }
+    for field in NUMERIC_FIELDS:
+        column = numbers[field][indexes]
+        columns[field] = (column.astype(np.int64) if field in QUANTITY_FIELDS else column).tolist()
+    for field, stored in DESI_COLUMNS.items():
+        columns[stored] = np.round(volumes[field][indexes], 2).tolist()
+    keys = list(columns)
+    rows = [dict(zip(keys, values)) for values in zip(*columns.values())]
+    return rows, indexes.tolist(), rejected
+
+
+def _open_text(stream):
+    if isinstance(stream, io.TextIOBase):
+        return stream
+    return io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+
+
+def import_pallets_csv(stream, user_id, chunk_size=DEFAULT_CHUNK_SIZE, progress=None, dry_run=False):
+    """Import pallets for ``user_id`` from a CSV file object.
+
+    ``progress`` is called with the running stats after every chunk. Rows
+    whose company does not belong to the user or whose values are invalid
+    are rejected and reported with their line number; valid rows of the same
+    chunk are still imported. Returns the stats dict.
+    """
+    text = _open_text(stream)
+    sample = text.readline()
+    if not sample.strip():
+        raise CatalogImportError('Dosya boş')
+    # Spreadsheets saved with a Turkish locale use ';' as the separator
+    delimiter = max(',;\t', key=sample.count)
+    layout, columns = detect_layout(next(csv.reader([sample], delimiter=delimiter)))
+    reader = csv.reader(text, delimiter=delimiter)
+
+    companies = {company.name.strip().casefold(): company.id for company in user_companies(user_id)}
+    company_ids = set(companies.values())
+    parse_row = parse_export_row if layout == 'export' else parse_flat_row
+
+    stats = {'layout': layout, 'processed': 0, 'imported': 0, 'rejected': 0, 'rejected_rows': [], 'chunks': 0}
+    started = time.perf_counter()
+
+    def reject(line, errors):
+        stats['rejected'] += 1
+        if len(stats['rejected_rows']) < MAX_REPORTED_REJECTS:
+            stats['rejected_rows'].append({'line': line, 'errors': errors})
+
+    def flush(raw_rows, lines):
+        rows, _, rejected = build_chunk(raw_rows, company_ids)
+        for i, errors in rejected:
+            reject(lines[i], errors)
+        try:
+            if rows and not dry_run:
+                assign_specs(rows)
+                # Core insert on the table: the rows are already validated plain dicts
+                db.session.execute(insert(Pallet.__table__), pallet_rows(rows))
+                bump_data_version([user_id])
+                changes = StatsChanges()
+                changes.add_rows(rows)
+                apply_stats_changes(changes)
+                log_pallet_changes(user_id, company_ids={row['company_id'] for row in rows})
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error importing pallet chunk ending at line {lines[-1]}: {str(e)}")
+            raise
+        stats['imported'] += len(rows)
+        stats['chunks'] += 1
+        logger.info(f"Pallet import: {stats['processed']} rows read, {stats['imported']} imported, "
+                    f"{stats['rejected']} rejected")
+        if progress:
+            progress(stats)
+
+    raw_rows = []
+    lines = []
+    for cells in reader:
+        # Physical line in the file, so quoted multi-line cells are counted right
+        line = reader.line_num + 1
+        if not any(cell.strip() for cell in cells):
+            continue
+        stats['processed'] += 1
+        data, errors = parse_row(cells, columns)
+        company = (data.pop('company', '') or '').strip()
+        if company:
+            company_id = companies.get(company.casefold())
+        else:
+            try:
+                company_id = int(data.get('company_id', ''))
+            except ValueError:
+                company_id = None
+        if company_id not in company_ids:
+            errors['company'] = 'Firma bulunamadı'
+        if errors:
+            data.pop('company_id', None)
+            reject(line, {**row_errors(data, company_ids, partial=True), **errors})
+            continue
+        data['company_id'] = company_id
+        raw_rows.append(data)
+        lines.append(line)
+        if len(raw_rows) >= chunk_size:
+            flush(raw_rows, lines)
+            raw_rows, lines = [], []
+    if raw_rows:
+        flush(raw_rows, lines)
+
+    stats['seconds'] = round(time.perf_counter() - started, 3)
+    logger.info(f"Pallet import finished in {stats['seconds']} s: {stats['imported']} imported, "
+                f"{stats['rejected']} rejected")
+    return stats
@@ -0,0 +1,241 @@
+from app import db
+from models import Company, Pallet, PalletSpec
+from utils import DIMENSION_FIELDS
+from cache import user_company
+from search_index import pallet_search_filter
+from sqlalchemy import and_, func, or_
+from sqlalchemy.orm import contains_eager
+from dataclasses import dataclass, field
+from decimal import Decimal, InvalidOperation
+import base64
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SORT = 'name_asc'
+DEFAULT_PAGE_SIZE = 25
+PAGE_SIZE_OPTIONS = (10, 25, 50, 100)
+MAX_PAGE_SIZE = 200
+
+# Sort key column for every sort option; the pallet id is always the tie-breaker
+SORT_COLUMNS = {
+    'name': Pallet.name,
+    'price': Pallet.price,
+    'volume': func.coalesce(PalletSpec.total_volume, 0),
+}
+
+_DIMENSION_COLUMNS = tuple(getattr(PalletSpec, name) for name in DIMENSION_FIELDS)
+
+# Projections for the read-only views. Rows are named tuples, the company name
+# and the dimensions come from single joins instead of lazy loads per row.
+LISTING_COLUMNS = (
+    Pallet.id, Pallet.name, Pallet.company_id, Company.name.label('company_name'),
+    Pallet.price, PalletSpec.total_volume,
+    PalletSpec.upper_board_desi, PalletSpec.lower_board_desi, PalletSpec.closure_desi, PalletSpec.block_desi,
+) + _DIMENSION_COLUMNS
+
+EXPORT_COLUMNS = (
+    Pallet.id, Pallet.name, Company.name.label('company_name'),
+    Pallet.price, PalletSpec.total_volume,
+) + _DIMENSION_COLUMNS
+
+
+class FilterError(ValueError):
+    """Raised when a filter parameter is present but not acceptable"""
+
+
+@dataclass
+class PalletFilters:
+    search: str = ''
+    company_id: int = None
+    min_price: float = None
+    max_price: float = None
+    sort: str = DEFAULT_SORT
+    # Cached company row (see cache.user_companies) when company_id is set
+    company: object = field(default=None, repr=False, compare=False)
+
+    @property
+    def is_filtered(self):
+        return any([self.search, self.company_id, self.min_price, self.max_price])
+
+    def as_args(self, include_sort=True):
+        """Return the filters as query string arguments, e.g. for ``url_for``"""
+        args = {}
+        if self.search:
+            args['search'] = self.search
+        if self.company_id is not None:
+            args['company_id'] = self.company_id
+        if self.min_price is not None:
+            args['min_price'] = self.min_price
+        if self.max_price is not None:
+            args['max_price'] = self.max_price
+        if include_sort and self.sort != DEFAULT_SORT:
+            args['sort'] = self.sort
+        return args
+
+
+def _parse_price(value, name, label):
+    try:
+        price = float(value) if value else None
+    except (ValueError, TypeError):
+        logger.warning(f"Invalid {name} parameter: {value}")
+        return None
+    if price is not None and price < 0:
+        raise FilterError(f'{label} fiyat 0\'dan küçük olamaz.')
+    return price
+
+
+def parse_pallet_filters(args, user_id):
+    """Parse search, company_id, min_price, max_price and sort from request arguments.
+
+    Unparseable values are ignored, values that parse but can not be used raise
+    ``FilterError`` with a message suitable for ``flash``.
+    """
+    filters = PalletFilters(search=(args.get('search') or '').strip())
+
+    company_id = args.get('company_id')
+    try:
+        filters.company_id = int(company_id) if company_id else None
+    except (ValueError, TypeError):
+        logger.warning(f"Invalid company_id parameter: {company_id}")
+    if filters.company_id is not None:
+        filters.company = user_company(user_id, filters.company_id)
+        if not filters.company:
+            raise FilterError('Belirtilen firma bulunamadı.')
+
+    filters.min_price = _parse_price(args.get('min_price'), 'min_price', 'Minimum')
+    filters.max_price = _parse_price(args.get('max_price'), 'max_price', 'Maksimum')
+
+    sort = args.get('sort') or DEFAULT_SORT
+    if sort.rsplit('_', 1)[0] not in SORT_COLUMNS or not sort.endswith(('_asc', '_desc')):
+        logger.warning(f"Invalid sort parameter: {sort}")
+        sort = DEFAULT_SORT
+    filters.sort = sort
+    return filters
+
+
+def parse_page_size(value):
+    """Return the requested page size clamped to 1..MAX_PAGE_SIZE"""
+    try:
+        page_size = int(value) if value else DEFAULT_PAGE_SIZE
+    except (ValueError, TypeError):
+        return DEFAULT_PAGE_SIZE
+    return max(1, min(page_size, MAX_PAGE_SIZE))
+
+
+def filtered_pallet_query(filters, user_id, columns=None):
+    """Build the pallet query of a user with the given filters applied in the database.
+
+    Without ``columns`` the query returns ``Pallet`` instances. With a column
+    tuple such as ``LISTING_COLUMNS`` it returns lightweight rows holding only
+    those columns. Either way ``Company`` and ``PalletSpec`` are joined once.
+    """
+    if columns is None:
+        query = Pallet.query.options(contains_eager(Pallet.spec))
+    else:
+        query = db.session.query(*columns).select_from(Pallet)
+    query = query.join(Company, Pallet.company_id == Company.id).join(PalletSpec, Pallet.spec_id == PalletSpec.id)
+    query = query.filter(Company.user_id == user_id)
+    if filters.search:
+        # Matching ids come from the in-process search index (see search_index)
+        query = query.filter(pallet_search_filter(user_id, filters.search, filters.company_id))
+    if filters.company_id is not None:
+        query = query.filter(Pallet.company_id == filters.company_id)
+    if filters.min_price is not None:
+        query = query.filter(Pallet.price >= filters.min_price)
+    if filters.max_price is not None:
+        query = query.filter(Pallet.price <= filters.max_price)
+    return query
+
+
+def _sort_value(item, sort_key):
+    if sort_key == 'name':
+        return item.name
+    if sort_key == 'price':
+        return item.price
+    return item.total_volume if item.total_volume is not None else 0
+
+
+def encode_cursor(item, sort):
+    """Encode the sort key and id of a row as an opaque, URL safe cursor"""
+    value = _sort_value(item, sort.rsplit('_', 1)[0])
+    payload = json.dumps([str(value), item.id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, sort):
+    """Decode a cursor created by ``encode_cursor``; returns None if it is invalid"""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        value, item_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        if sort.rsplit('_', 1)[0] != 'name':
+            value = Decimal(value)
+        return value, int(item_id)
+    except (ValueError, TypeError, InvalidOperation) as e:
+        logger.warning(f"Invalid pagination cursor {cursor}: {str(e)}")
+        return None
+
+
+@dataclass
+class Page:
+    items: list
+    page_size: int
+    next_cursor: str = None
+    prev_cursor: str = None
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+
+def paginate_pallets(query, sort=DEFAULT_SORT, after=None, before=None, page_size=DEFAULT_PAGE_SIZE):
+    """Return one page of ``query`` using keyset (cursor) pagination.
+
+    Instead of OFFSET the query continues after (or before) the sort key and id
+    of the row in the cursor, so every page costs the same as the first one.
+    """
+    sort_key, direction = sort.rsplit('_', 1)
+    column = SORT_COLUMNS[sort_key]
+    descending = direction == 'desc'
+
+    after_key = decode_cursor(after, sort)
+    before_key = decode_cursor(before, sort) if after_key is None else None
+    backwards = before_key is not None
+    # Walking backwards reverses the order, the rows are flipped back below
+    reverse = descending != backwards
+
+    key = after_key or before_key
+    if key is not None:
+        value, last_id = key
+        if reverse:
+            query = query.filter(or_(column < value, and_(column == value, Pallet.id < last_id)))
+        else:
+            query = query.filter(or_(column > value, and_(column == value, Pallet.id > last_id)))
+
+    if reverse:
+        query = query.order_by(column.desc(), Pallet.id.desc())
+    else:
+        query = query.order_by(column.asc(), Pallet.id.asc())
+
+    rows = query.limit(page_size + 1).all()
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if backwards:
+        rows.reverse()
+
+    page = Page(items=rows, page_size=page_size)
+    if rows:
+        has_next = True if backwards else has_more
+        has_prev = has_more if backwards else key is not None
+        if has_next:
+            page.next_cursor = encode_cursor(rows[-1], sort)
+        if has_prev:
+            page.prev_cursor = encode_cursor(rows[0], sort)
+    return page
@@ -0,0 +1,316 @@
+"""Deduplicated pallet specs keyed by a hash of the dimensions.
+
+Many pallets share the same 13 dimension and quantity values and differ
+only in name, price and company. ``PalletSpec`` stores every distinct set
+once with its desi, and ``Pallet.spec_id`` points to it; the pallet table
+has no dimension or desi columns of its own, so listing, export and search
+queries join the spec. ``recompute-desi`` calculates desi once per spec and
+``spec_usage`` shows which specs are used most.
+
+The hash is the SHA-256 of the values rounded to hundredths (the column
+scale) as whole numbers of hundredths, 8-byte little-endian integers in
+``DIMENSION_FIELDS`` order, so ``2.2`` and ``Decimal('2.20')`` give the
+same spec. Writers call ``assign_specs`` on their value dicts and store
+``pallet_rows`` of them. Databases created before the specs are migrated
+with ``flask migrate-pallet-specs``, which adds the column, folds the
+pallets' own dimension columns into specs and then drops those columns.
+"""
+from app import db
+from models import Company, Pallet, PalletSpec
+from utils import DIMENSION_FIELDS, _to_float_column, calculate_component_volumes_batch, pallet_columns
+from sqlalchemy import (
+    Float, MetaData, Table, bindparam, delete, exists, func, insert, inspect, select, text, type_coerce, update
+)
+from sqlalchemy.exc import IntegrityError
+from operator import attrgetter, itemgetter
+import hashlib
+import logging
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+QUANTITY_FIELDS = ('upper_board_quantity', 'lower_board_quantity', 'closure_quantity')
+# Stored column for every calculated desi field
+DESI_COLUMNS = {
+    'upper_board_desi': 'upper_board_desi',
+    'lower_board_desi': 'lower_board_desi',
+    'closure_desi': 'closure_desi',
+    'block_desi': 'block_desi',
+    'total_desi': 'total_volume',
+}
+# Columns of a spec copied to the pallet table by databases older than the specs
+SPEC_FIELDS = DIMENSION_FIELDS + tuple(DESI_COLUMNS.values())
+HASH_CHUNK_SIZE = 1000
+DEFAULT_CHUNK_SIZE = 5000
+DEFAULT_USAGE_LIMIT = 20
+MAX_USAGE_LIMIT = 200
+
+_QUANTITY_POSITIONS = [DIMENSION_FIELDS.index(field) for field in QUANTITY_FIELDS]
+
+
+def _hashes(hundredths):
+    """Hex SHA-256 of every row of an int64 matrix of hundredths"""
+    data = np.ascontiguousarray(hundredths, dtype='<i8')
+    return [hashlib.sha256(row.tobytes()).hexdigest() for row in data]
+
+
+def spec_hash(values):
+    """Canonical hash of 13 dimension values in ``DIMENSION_FIELDS`` order"""
+    return _hashes(np.rint(np.array([values], dtype=np.float64) * 100).astype(np.int64))[0]
+
+
+def _dimension_matrix(rows):
+    """Float matrix with one row of dimension values per dict, row object or model instance"""
+    getter = itemgetter(*DIMENSION_FIELDS) if isinstance(rows[0], dict) else attrgetter(*DIMENSION_FIELDS)
+    try:
+        return np.array([getter(row) for row in rows], dtype=np.float64)
+    except (KeyError, AttributeError, TypeError, ValueError, ArithmeticError):
+        # Missing or non-numeric values become NaN
+        columns = pallet_columns(rows)
+        return np.column_stack([_to_float_column(columns[field]) for field in DIMENSION_FIELDS])
+
+
+def _hundredths(rows):
+    """``(hundredths, valid)``: an int64 matrix with one row of dimensions per input row"""
+    values = _dimension_matrix(rows)
+    with np.errstate(invalid='ignore'):
+        valid = (np.isfinite(values) & (values >= 0) & (values < 1e12)).all(axis=1)
+        hundredths = np.rint(np.where(valid[:, None], values, 0) * 100).astype(np.int64)
+    valid &= (hundredths[:, _QUANTITY_POSITIONS] % 100 == 0).all(axis=1)
+    return hundredths, valid
+
+
+def _spec_rows(hundredths, hashes):
+    """Insert-ready spec dicts with desi for distinct rows of hundredths"""
+    values = hundredths / 100
+    columns = {'spec_hash': hashes}
+    for i, field in enumerate(DIMENSION_FIELDS):
+        column = hundredths[:, i] // 100 if field in QUANTITY_FIELDS else values[:, i]
+        columns[field] = column.tolist()
+    volumes = calculate_component_volumes_batch({field: values[:, i] for i, field in enumerate(DIMENSION_FIELDS)})
+    for field, column in DESI_COLUMNS.items():
+        columns[column] = np.round(volumes[field], 2).tolist()
+    keys = list(columns)
+    return [dict(zip(keys, row)) for row in zip(*columns.values())]
+
+
+def _find_specs(hashes, connection):
+    found = {}
+    hashes = sorted(hashes)
+    for start in range(0, len(hashes), HASH_CHUNK_SIZE):
+        found.update(connection.execute(
+            select(PalletSpec.spec_hash, PalletSpec.id)
+            .where(PalletSpec.spec_hash.in_(hashes[start:start + HASH_CHUNK_SIZE]))
+        ).all())
+    return found
+
+
+def _create_specs(rows, connection):
+    try:
+        with connection.begin_nested():
+            connection.execute(insert(PalletSpec), rows)
+    except IntegrityError:
+        # Another transaction created some of them in the meantime
+        for row in rows:
+            try:
+                with connection.begin_nested():
+                    connection.execute(insert(PalletSpec), [row])
+            except IntegrityError:
+                pass
+
+
+def resolve_specs(rows, connection=None):
+    """Spec ids for dicts or row objects with the dimension fields, creating missing specs.
+
+    Rows with missing or invalid dimensions get ``None``.
+    """
+    if not rows:
+        return []
+    connection = connection or db.session.connection()
+    hundredths, valid = _hundredths(rows)
+    indexes = np.flatnonzero(valid)
+    hashes = [None] * len(rows)
+    first_rows = {}
+    for i, key in zip(indexes.tolist(), _hashes(hundredths[indexes])):
+        hashes[i] = key
+        first_rows.setdefault(key, i)
+    found = _find_specs(first_rows, connection)
+    missing = [i for key, i in first_rows.items() if key not in found]
+    if missing:
+        missing_hashes = [hashes[i] for i in missing]
+        _create_specs(_spec_rows(hundredths[missing], missing_hashes), connection)
+        found.update(_find_specs(missing_hashes, connection))
+    return [found.get(key) for key in hashes]
+
+
+def assign_specs(rows, connection=None):
+    """Set ``spec_id`` on insert or update dicts of pallets, in place"""
+    for row, spec_id in zip(rows, resolve_specs(rows, connection)):
+        row['spec_id'] = spec_id
+
+
+def pallet_rows(rows):
+    """Copies of value dicts holding only the columns of the pallet table (with ``spec_id``)"""
+    columns = Pallet.__table__.columns.keys()
+    return [{column: row[column] for column in columns if column in row} for row in rows]
+
+
+def spec_volumes(spec_ids, connection=None):
+    """``{spec id: total desi}`` of the given specs"""
+    spec_ids = sorted({spec_id for spec_id in spec_ids if spec_id is not None})
+    connection = connection or db.session.connection()
+    volumes = {}
+    for start in range(0, len(spec_ids), HASH_CHUNK_SIZE):
+        volumes.update(connection.execute(
+            select(PalletSpec.id, PalletSpec.total_volume)
+            .where(PalletSpec.id.in_(spec_ids[start:start + HASH_CHUNK_SIZE]))
+        ).all())
+    return volumes
+
+
+def spec_to_dict(row):
+    data = {'id': row.id}
+    for field in SPEC_FIELDS:
+        value = getattr(row, field)
+        data[field] = value if field in QUANTITY_FIELDS or value is None else float(value)
+    return data
+
+
+def spec_usage(user_id, limit=DEFAULT_USAGE_LIMIT):
+    """The user's most used specs with their pallet and company counts, most used first"""
+    pallet_count = func.count(Pallet.id).label('pallet_count')
+    rows = db.session.execute(
+        select(PalletSpec, pallet_count, func.count(func.distinct(Pallet.company_id)).label('company_count'))
+        .join(Pallet, Pallet.spec_id == PalletSpec.id)
+        .join(Company, Pallet.company_id == Company.id)
+        .where(Company.user_id == user_id)
+        .group_by(PalletSpec.id)
+        .order_by(pallet_count.desc(), PalletSpec.id)
+        .limit(limit)
+    ).all()
+    totals = db.session.execute(
+        select(func.count(Pallet.id), func.count(func.distinct(Pallet.spec_id)))
+        .join(Company, Pallet.company_id == Company.id)
+        .where(Company.user_id == user_id)
+    ).one()
+    return {
+        'pallets': totals[0],
+        'specs': totals[1],
+        'items': [
+            {**spec_to_dict(spec), 'pallet_count': count, 'company_count': companies}
+            for spec, count, companies in rows
+        ],
+    }
+
+
+def _pallet_columns(engine):
+    return {column['name'] for column in inspect(engine).get_columns(Pallet.__tablename__)}
+
+
+def ensure_spec_schema():
+    """Create the spec table and add ``pallet.spec_id`` to databases created before it"""
+    engine = db.engine
+    PalletSpec.__table__.create(engine, checkfirst=True)
+    if 'spec_id' in _pallet_columns(engine):
+        return False
+    with engine.begin() as connection:
+        connection.execute(text('ALTER TABLE pallet ADD COLUMN spec_id INTEGER REFERENCES pallet_spec (id)'))
+    for index in Pallet.__table__.indexes:
+        if index.name == 'ix_pallet_spec_id':
+            index.create(engine, checkfirst=True)
+    return True
+
+
+def fold_pallet_specs(chunk_size=DEFAULT_CHUNK_SIZE):
+    """Point every pallet without a spec to the spec of its own dimension columns.
+
+    Only databases created before the specs still have these columns; the
+    table is reflected because the model no longer maps them. Pallets are
+    read in primary key order with keyset pagination and every chunk is
+    committed on its own, so an interrupted run can be restarted.
+    """
+    stats = {'processed': 0, 'folded': 0, 'invalid': 0, 'invalid_ids': [], 'chunks': 0, 'specs_created': 0}
+    started = time.perf_counter()
+    if not set(DIMENSION_FIELDS) <= _pallet_columns(db.engine):
+        stats['seconds'] = round(time.perf_counter() - started, 3)
+        return stats
+    legacy = Table(Pallet.__tablename__, MetaData(), autoload_with=db.engine)
+    specs_before = db.session.scalar(select(func.count(PalletSpec.id)))
+    last_id = 0
+    while True:
+        # Core statement with float results: no ORM rows and no Decimal per value
+        rows = db.session.connection().execute(
+            select(legacy.c.id, *[type_coerce(legacy.c[field], Float).label(field) for field in DIMENSION_FIELDS])
+            .where(legacy.c.id > last_id, legacy.c.spec_id.is_(None))
+            .order_by(legacy.c.id)
+            .limit(chunk_size)
+        ).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+        try:
+            spec_ids = resolve_specs(rows)
+            updates = [{'pallet_id': row.id, 'new_spec_id': spec_id}
+                       for row, spec_id in zip(rows, spec_ids) if spec_id is not None]
+            if updates:
+                db.session.execute(
+                    update(legacy)
+                    .where(legacy.c.id == bindparam('pallet_id'))
+                    .values(spec_id=bindparam('new_spec_id')),
+                    updates
+                )
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error folding pallet specs for chunk ending at pallet {last_id}: {str(e)}")
+            raise
+        stats['chunks'] += 1
+        stats['processed'] += len(rows)
+        stats['folded'] += len(updates)
+        stats['invalid'] += len(rows) - len(updates)
+        stats['invalid_ids'].extend(row.id for row, spec_id in zip(rows, spec_ids) if spec_id is None)
+        logger.info(f"Pallet specs: {stats['processed']} processed, {stats['folded']} folded "
+                    f"(last id {last_id})")
+    stats['specs_created'] = db.session.scalar(select(func.count(PalletSpec.id))) - specs_before
+    stats['seconds'] = round(time.perf_counter() - started, 3)
+    return stats
+
+
+def drop_pallet_copies():
+    """Drop the dimension and desi columns of the pallet table once every pallet has a spec.
+
+    Returns the dropped column names; raises ``ValueError`` while pallets
+    without a spec are left. On SQLite ``spec_id`` stays nullable because
+    the column can not be altered in place.
+    """
+    engine = db.engine
+    copies = [field for field in SPEC_FIELDS if field in _pallet_columns(engine)]
+    if not copies:
+        return []
+    missing = db.session.scalar(select(func.count(Pallet.id)).where(Pallet.spec_id.is_(None)))
+    db.session.commit()
+    if missing:
+        raise ValueError(f'{missing} pallets have no spec')
+    with engine.begin() as connection:
+        legacy = Table(Pallet.__tablename__, MetaData(), autoload_with=connection)
+        for index in legacy.indexes:
+            if set(index.columns.keys()) & set(copies):
+                index.drop(connection)
+        for field in copies:
+            connection.execute(text(f'ALTER TABLE pallet DROP COLUMN {field}'))
+        if engine.dialect.name == 'postgresql':
+            connection.execute(text('ALTER TABLE pallet ALTER COLUMN spec_id SET NOT NULL'))
+        elif engine.dialect.name == 'mysql':
+            connection.execute(text('ALTER TABLE pallet MODIFY spec_id INTEGER NOT NULL'))
+    return copies
+
+
+def prune_unused_specs():
+    """Delete specs no pallet refers to any more; returns how many"""
+    result = db.session.execute(
+        delete(PalletSpec).where(~exists().where(Pallet.spec_id == PalletSpec.id))
+    )
+    db.session.commit()
+    return result.rowcount
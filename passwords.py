@@ -0,0 +1,97 @@
+"""Password hashing with a configurable method on a bounded executor.
+
+Hashing is deliberately slow and CPU heavy. Running it on a small dedicated
+thread pool (``hashlib`` releases the GIL while hashing) caps how many cores a
+burst of logins can take, so the worker keeps serving other requests. When the
+pool and its queue are full, ``PasswordHasherBusy`` is raised instead of
+queueing without limit.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.security import check_password_hash, generate_password_hash
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Any method accepted by werkzeug.security.generate_password_hash, e.g.
+# "scrypt", "scrypt:16384:8:1" or "pbkdf2:sha256:600000"
+PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt')
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS') or max(1, (os.cpu_count() or 2) // 2))
+# Hashes allowed to wait for a free worker before new ones are turned away
+PASSWORD_HASH_QUEUE = int(os.environ.get('PASSWORD_HASH_QUEUE', '32'))
+# Seconds a request waits for a place in the queue
+PASSWORD_HASH_TIMEOUT = float(os.environ.get('PASSWORD_HASH_TIMEOUT', '10'))
+
+_executor = None
+_executor_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(PASSWORD_HASH_WORKERS + PASSWORD_HASH_QUEUE)
+_method_prefixes = {}
+_dummy_hash = None
+
+
+class PasswordHasherBusy(RuntimeError):
+    """Raised when too many password hashes are already running or queued"""
+
+
+def hash_password(password, method=None):
+    return generate_password_hash(password, method=method or PASSWORD_HASH_METHOD)
+
+
+def verify_password(pwhash, password):
+    return bool(pwhash) and check_password_hash(pwhash, password)
+
+
+def method_prefix(method=None):
+    """Return the normalized parameter prefix werkzeug writes for ``method``"""
+    method = method or PASSWORD_HASH_METHOD
+    if method not in _method_prefixes:
+        # Werkzeug fills in default parameters, so hash once to learn the full prefix
+        _method_prefixes[method] = generate_password_hash('', method=method).split('$', 1)[0]
+    return _method_prefixes[method]
+
+
+def needs_rehash(pwhash, method=None):
+    """Tell whether ``pwhash`` was made with other parameters than the configured ones"""
+    return not pwhash or pwhash.split('$', 1)[0] != method_prefix(method)
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix='password-hash')
+        return _executor
+
+
+def run_bounded(function, *args):
+    """Run ``function(*args)`` on the hashing pool and wait for the result"""
+    if not _slots.acquire(timeout=PASSWORD_HASH_TIMEOUT):
+        logger.warning("Password hashing queue is full")
+        raise PasswordHasherBusy()
+    try:
+        future = _get_executor().submit(function, *args)
+    except Exception:
+        _slots.release()
+        raise
+    future.add_done_callback(lambda _: _slots.release())
+    return future.result()
+
+
+def hash_password_bounded(password):
+    return run_bounded(hash_password, password)
+
+
+def verify_password_bounded(pwhash, password):
+    """Check a password on the hashing pool.
+
+    Without a stored hash a dummy hash is checked instead, so unknown user
+    names cost the same time as wrong passwords.
+    """
+    global _dummy_hash
+    if not pwhash:
+        if _dummy_hash is None:
+            _dummy_hash = hash_password(os.urandom(16).hex())
+        run_bounded(verify_password, _dummy_hash, '')
+        return False
+    return run_bounded(verify_password, pwhash, password)
@@ -0,0 +1,352 @@
+"""PDF rendering of pallet lists.
+
+This module only depends on ReportLab and the standard library, so it can be
+imported by export worker processes without initializing the Flask app or
+opening database connections.
+"""
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4, landscape
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.units import mm
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.pdfgen import canvas
+from utils import format_float
+import logging
+import os
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# Rough number of pallet rows that fit on one landscape page, used for progress estimates
+ROWS_PER_PAGE_ESTIMATE = 7
+
+# How "Sayfa X / N" is produced: 'placeholder' (constant memory) or 'deferred'
+PDF_PAGE_NUMBERING = os.environ.get('PDF_PAGE_NUMBERING', 'placeholder')
+
+def clean_text(text):
+    """Clean and encode text for PDF generation with Turkish character support"""
+    try:
+        if text is None:
+            return ""
+        return str(text).encode('utf-8').decode('utf-8')
+    except Exception as e:
+        logger.error(f"Error cleaning text: {str(e)}")
+        return str(text) if text is not None else ""
+
+class NumberedCanvas(canvas.Canvas):
+    def __init__(self, *args, **kwargs):
+        canvas.Canvas.__init__(self, *args, **kwargs)
+        self._saved_page_states = []
+
+    def showPage(self):
+        self._saved_page_states.append(dict(self.__dict__))
+        self._startPage()
+
+    def save(self):
+        """Add page numbers to each page"""
+        num_pages = len(self._saved_page_states)
+        for state in self._saved_page_states:
+            self.__dict__.update(state)
+            self.setFont("Helvetica", 9)
+            self.drawRightString(
+                270*mm, 10*mm,
+                f"Sayfa {self._pageNumber} / {num_pages}"
+            )
+            canvas.Canvas.showPage(self)
+        canvas.Canvas.save(self)
+
+class PlaceholderNumberedCanvas(canvas.Canvas):
+    """Canvas that prints "Sayfa X / N" without keeping pages in memory.
+
+    ``NumberedCanvas`` holds the uncompressed content of every page until
+    ``save()`` because the page count is only known at the end. Here every page
+    is written out immediately and refers to a shared form XObject for N; the
+    form is defined once in ``save()`` when the total is known, so page
+    numbering no longer needs memory per page.
+    """
+    PAGE_COUNT_FORM = 'pageCount'
+    FONT_NAME = 'Helvetica'
+    FONT_SIZE = 9
+    # Width reserved for the total page count (four digits)
+    TOTAL_WIDTH = stringWidth('0000', FONT_NAME, FONT_SIZE)
+    RIGHT_EDGE = 270*mm
+    BASELINE = 10*mm
+
+    def showPage(self):
+        self._draw_page_number()
+        canvas.Canvas.showPage(self)
+
+    def _draw_page_number(self):
+        self.saveState()
+        self.setFont(self.FONT_NAME, self.FONT_SIZE)
+        self.drawRightString(
+            self.RIGHT_EDGE - self.TOTAL_WIDTH, self.BASELINE,
+            f"Sayfa {self._pageNumber} / "
+        )
+        self.doForm(self.PAGE_COUNT_FORM)
+        self.restoreState()
+
+    def save(self):
+        """Fill in the total page count and write the document"""
+        if len(self._code):
+            self.showPage()
+        num_pages = self._pageNumber - 1
+        self.beginForm(self.PAGE_COUNT_FORM)
+        self.setFont(self.FONT_NAME, self.FONT_SIZE)
+        self.drawString(self.RIGHT_EDGE - self.TOTAL_WIDTH, self.BASELINE, str(num_pages))
+        self.endForm()
+        canvas.Canvas.save(self)
+
+PAGE_NUMBERING_CANVASES = {
+    'placeholder': PlaceholderNumberedCanvas,
+    'deferred': NumberedCanvas,
+}
+
+def page_numbering_canvas(mode=None):
+    """Return the canvas class for a page numbering mode"""
+    mode = mode or PDF_PAGE_NUMBERING
+    if mode not in PAGE_NUMBERING_CANVASES:
+        logger.warning(f"Unknown PDF page numbering mode {mode}, using placeholder")
+        mode = 'placeholder'
+    return PAGE_NUMBERING_CANVASES[mode]
+
+def add_letterhead(canvas, doc, company=None):
+    """Add letterhead with company information to each page.
+
+    ``company`` is a dict with ``name`` and ``contact_email`` keys.
+    """
+    try:
+        canvas.saveState()
+
+        # Add company logo or system logo
+        canvas.setFont('Helvetica-Bold', 16)
+        canvas.drawString(30*mm, 190*mm, 'Palet Yönetim Sistemi')
+
+        if company:
+            canvas.setFont('Helvetica', 12)
+            canvas.drawString(30*mm, 180*mm, f'Firma: {clean_text(company.get("name"))}')
+            canvas.drawString(30*mm, 175*mm, f'İletişim: {clean_text(company.get("contact_email"))}')
+
+        # Add date and time
+        canvas.setFont('Helvetica', 10)
+        current_date = datetime.now().strftime('%d.%m.%Y %H:%M')
+        canvas.drawString(250*mm, 190*mm, f'Tarih: {current_date}')
+
+        canvas.restoreState()
+    except Exception as e:
+        logger.error(f"Error adding letterhead: {str(e)}")
+
+def build_pallets_pdf(output, pallets, filter_text=None, company=None, progress=None, page_numbering=None):
+    """Render the pallet list PDF into ``output`` (a path or a binary file object).
+
+    ``pallets`` is a sequence of dicts with the ``EXPORT_COLUMNS`` keys,
+    ``filter_text`` describes the applied filters and ``company`` is the
+    letterhead company as a dict. ``progress`` is called with a fraction
+    between 0 and 1 while the document is prepared and laid out.
+    ``page_numbering`` selects the canvas from ``PAGE_NUMBERING_CANVASES``.
+
+    Returns a summary dict with the row, error and total counts.
+    """
+    def report(fraction):
+        if progress:
+            try:
+                progress(min(max(fraction, 0.0), 1.0))
+            except Exception as e:
+                logger.warning(f"PDF progress callback failed: {str(e)}")
+
+    # Set up the document with landscape orientation and margins
+    doc = SimpleDocTemplate(
+        output,
+        pagesize=landscape(A4),
+        rightMargin=20*mm,
+        leftMargin=20*mm,
+        topMargin=40*mm,
+        bottomMargin=20*mm,
+        title='Palet Listesi',
+        author='Palet Yönetim Sistemi'
+    )
+
+    # Create styles
+    styles = getSampleStyleSheet()
+
+    # Header style
+    header_style = ParagraphStyle(
+        'CustomHeader',
+        parent=styles['Normal'],
+        fontName='Helvetica-Bold',
+        fontSize=14,
+        leading=16,
+        alignment=1,
+        spaceAfter=20,
+        textColor=colors.HexColor('#2a2e35')
+    )
+
+    # Title style
+    title_style = ParagraphStyle(
+        'CustomTitle',
+        parent=styles['Title'],
+        fontName='Helvetica-Bold',
+        fontSize=12,
+        leading=14,
+        alignment=1,
+        spaceAfter=10,
+        textColor=colors.HexColor('#2a2e35')
+    )
+
+    # Normal text style
+    normal_style = ParagraphStyle(
+        'CustomNormal',
+        parent=styles['Normal'],
+        fontName='Helvetica',
+        fontSize=10,
+        leading=12,
+        alignment=1
+    )
+
+    # Prepare document elements
+    elements = []
+
+    # Add header with current date
+    current_date = datetime.now().strftime('%d.%m.%Y %H:%M')
+    header_text = f'Palet Listesi - {current_date}'
+    elements.append(Paragraph(clean_text(header_text), header_style))
+    elements.append(Spacer(1, 20))
+
+    # Add filter information if any filters are applied
+    if filter_text:
+        elements.append(Paragraph(clean_text(filter_text), title_style))
+        elements.append(Spacer(1, 20))
+
+    # Create table data
+    headers = [
+        'Palet Adı',
+        'Firma',
+        'Fiyat (TL)',
+        'Toplam Hacim (desi)',
+        'Ölçüler (cm)',
+        'Adet'
+    ]
+
+    data = [[Paragraph(clean_text(header), title_style) for header in headers]]
+
+    # Add pallet data
+    total_price = 0
+    total_volume = 0
+    invalid_records = 0
+    row_count = len(pallets)
+    report_every = max(row_count // 20, 1)
+
+    for index, pallet in enumerate(pallets, 1):
+        try:
+            measurements = (
+                f"Üst Tahta: {format_float(pallet['upper_board_length'])}x{format_float(pallet['upper_board_width'])}x{format_float(pallet['board_thickness'])}\n"
+                f"Alt Tahta: {format_float(pallet['lower_board_length'])}x{format_float(pallet['lower_board_width'])}x{format_float(pallet['board_thickness'])}\n"
+                f"Kapama: {format_float(pallet['closure_length'])}x{format_float(pallet['closure_width'])}x{format_float(pallet['board_thickness'])}\n"
+                f"Takoz: {format_float(pallet['block_length'])}x{format_float(pallet['block_width'])}x{format_float(pallet['block_height'])}"
+            )
+
+            quantities = (
+                f"Üst: {pallet['upper_board_quantity']}\n"
+                f"Alt: {pallet['lower_board_quantity']}\n"
+                f"Kapama: {pallet['closure_quantity']}\n"
+                f"Takoz: 9"
+            )
+
+            row = [
+                Paragraph(clean_text(pallet['name']), normal_style),
+                Paragraph(clean_text(pallet['company_name']), normal_style),
+                Paragraph(format_float(pallet['price']), normal_style),
+                Paragraph(format_float(pallet['total_volume']), normal_style),
+                Paragraph(clean_text(measurements), normal_style),
+                Paragraph(clean_text(quantities), normal_style)
+            ]
+            data.append(row)
+
+            total_price += float(pallet['price']) if pallet['price'] is not None else 0
+            total_volume += float(pallet['total_volume']) if pallet['total_volume'] is not None else 0
+
+        except Exception as row_error:
+            logger.error(f"Error processing pallet row {pallet.get('id')}: {str(row_error)}")
+            invalid_records += 1
+            continue
+
+        # Preparing the rows is roughly the first 30% of the work
+        if index % report_every == 0:
+            report(0.3 * index / row_count)
+
+    if invalid_records > 0:
+        logger.warning(f"{invalid_records} records were skipped due to data errors")
+
+    # Create table with column widths
+    col_widths = [100*mm, 80*mm, 60*mm, 60*mm, 180*mm, 60*mm]
+    table = Table(data, colWidths=col_widths, repeatRows=1)
+
+    # Apply table styling
+    table.setStyle(TableStyle([
+        # Header styling
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#2a2e35')),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), 11),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+
+        # Content styling
+        ('BACKGROUND', (0, 1), (-1, -1), colors.white),
+        ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+        ('FONTSIZE', (0, 1), (-1, -1), 10),
+        ('TOPPADDING', (0, 1), (-1, -1), 6),
+        ('BOTTOMPADDING', (0, 1), (-1, -1), 6),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black),
+
+        # Alternate row colors
+        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f8f9fa')]),
+
+        # Grid styling
+        ('LINEBEFORE', (0, 0), (-1, -1), 1, colors.black),
+        ('LINEAFTER', (0, 0), (-1, -1), 1, colors.black),
+        ('LINEBELOW', (0, 0), (-1, -1), 1, colors.black),
+        ('LINEABOVE', (0, 0), (-1, -1), 1, colors.black),
+    ]))
+
+    elements.append(table)
+    elements.append(Spacer(1, 20))
+
+    # Add summary section
+    summary_text = (
+        f"Özet:\n"
+        f"Toplam Palet Sayısı: {row_count}\n"
+        f"Başarıyla İşlenen Kayıt: {row_count - invalid_records}\n"
+        f"Hatalı Kayıt: {invalid_records}\n"
+        f"Toplam Fiyat: {format_float(total_price)} TL\n"
+        f"Toplam Hacim: {format_float(total_volume)} desi"
+    )
+    elements.append(Paragraph(clean_text(summary_text), title_style))
+
+    # Layout is the remaining 70%, estimated from the number of finished pages
+    estimated_pages = max(row_count // ROWS_PER_PAGE_ESTIMATE, 1)
+
+    def on_layout_progress(kind, value):
+        if kind == 'PAGE':
+            report(0.3 + 0.7 * min(value / estimated_pages, 0.99))
+
+    doc.setProgressCallBack(on_layout_progress)
+
+    # Build PDF with custom canvas for page numbers and header
+    doc.build(
+        elements,
+        onFirstPage=lambda canvas, doc: add_letterhead(canvas, doc, company),
+        onLaterPages=lambda canvas, doc: add_letterhead(canvas, doc, company),
+        canvasmaker=page_numbering_canvas(page_numbering)
+    )
+    report(1.0)
+
+    return {
+        'rows': row_count,
+        'invalid_records': invalid_records,
+        'total_price': total_price,
+        'total_volume': total_volume,
+    }
@@ -0,0 +1,695 @@
+"""Personnel, weekly attendance, advances and the weekly pay list.
+
+The work week is Monday to Saturday. Attendance is stored as one
+``AttendanceWeek`` row per employee and week holding the six days as a bit
+mask (bit 0 Monday ... bit 5 Saturday); notes on single days are kept in
+``AttendanceNote`` only where there is one. Weeks are written in bulk: the
+existing rows are looked up once and the rest is one executemany INSERT and
+one executemany UPDATE.
+
+The pay list of a week is computed for all employees of a user in one pass:
+three queries (employees, the week's attendance rows, the week's advances)
+and NumPy arrays for days worked (a popcount table of the masks), rate,
+gross and net pay. The daily rate of a week is the rate stored on its
+attendance row, or the employee's rate when none is stored, so a single
+week can be paid at another rate without touching the others. Paying a
+week stores a ``SalaryPayment`` with the computed figures per employee;
+paid employees are listed with these stored figures from then on.
+Together with the advances they make up the payment history.
+"""
+from app import db
+from models import Advance, AttendanceNote, AttendanceWeek, Employee, SalaryPayment
+from sqlalchemy import and_, bindparam, delete, insert, or_, select, tuple_, update
+from sqlalchemy.exc import IntegrityError
+from datetime import date, datetime, timedelta
+from decimal import Decimal, InvalidOperation
+import logging
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+WORK_DAYS = 6
+FULL_WEEK = (1 << WORK_DAYS) - 1
+DAY_NAMES = ('Pazartesi', 'Salı', 'Çarşamba', 'Perşembe', 'Cuma', 'Cumartesi')
+# Largest value that fits in a Numeric(10, 2) column
+MAX_AMOUNT = Decimal('99999999.99')
+MAX_NOTE_LENGTH = 255
+# Upper limit of attendance rows or notes in one request
+MAX_ATTENDANCE_ITEMS = 10000
+ID_CHUNK_SIZE = 1000
+DEFAULT_HISTORY_LIMIT = 100
+
+# Days worked for every mask
+_DAY_COUNTS = np.array([bin(mask).count('1') for mask in range(FULL_WEEK + 1)], dtype=np.int64)
+
+
+class PersonnelError(ValueError):
+    """Invalid personnel input; the message is shown to the user"""
+
+
+class PersonnelConflict(PersonnelError):
+    """The week was changed or paid by another request"""
+
+
+def _chunks(items, size=ID_CHUNK_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+# Dates and weeks
+
+def week_start(day):
+    """Monday of the week of ``day``"""
+    return day - timedelta(days=day.weekday())
+
+
+def week_days(start):
+    return [start + timedelta(days=i) for i in range(WORK_DAYS)]
+
+
+def parse_date(value, message='Geçersiz tarih'):
+    if isinstance(value, date) and not isinstance(value, datetime):
+        return value
+    try:
+        return date.fromisoformat(str(value or '').strip())
+    except ValueError:
+        raise PersonnelError(message)
+
+
+def parse_week(value):
+    """Monday of the week containing an ISO date; the current week when empty"""
+    if value in (None, ''):
+        return week_start(date.today())
+    return week_start(parse_date(value, 'Geçersiz hafta'))
+
+
+def days_to_mask(days):
+    """Bit mask of a list of six booleans (Monday first) or of a mask"""
+    if isinstance(days, bool):
+        raise PersonnelError('Geçersiz gün listesi')
+    if isinstance(days, int):
+        if not 0 <= days <= FULL_WEEK:
+            raise PersonnelError('Geçersiz gün listesi')
+        return days
+    if not isinstance(days, (list, tuple)) or len(days) != WORK_DAYS:
+        raise PersonnelError('Gün listesi 6 gün içermelidir')
+    return sum(1 << i for i, worked in enumerate(days) if worked)
+
+
+def mask_to_days(mask):
+    return [bool(mask >> i & 1) for i in range(WORK_DAYS)]
+
+
+def parse_amount(value, allow_zero=False):
+    """Money amount as a Decimal with two places"""
+    try:
+        amount = Decimal(str(value).replace(',', '.')).quantize(Decimal('0.01'))
+    except (InvalidOperation, ValueError, TypeError):
+        raise PersonnelError('Geçersiz tutar')
+    if not amount.is_finite() or amount < 0 or (amount == 0 and not allow_zero) or amount > MAX_AMOUNT:
+        raise PersonnelError('Geçersiz tutar')
+    return amount
+
+
+def _float(value):
+    return float(value) if value is not None else None
+
+
+def _kurus(value):
+    """Money amount as an integer number of kuruş"""
+    return int((Decimal(str(value)) * 100).to_integral_value()) if value is not None else 0
+
+
+def _money(kurus):
+    """Integer kuruş back to an amount with two places"""
+    return Decimal(int(kurus)).scaleb(-2)
+
+
+# Employees
+
+def valid_national_id(value):
+    """Format and check digits of a Turkish identity number"""
+    if len(value) != 11 or not value.isdigit() or value[0] == '0':
+        return False
+    digits = [int(c) for c in value]
+    tenth = (sum(digits[0:9:2]) * 7 - sum(digits[1:8:2])) % 10
+    return digits[9] == tenth and digits[10] == sum(digits[:10]) % 10
+
+
+def employee_to_dict(employee):
+    return {
+        'id': employee.id,
+        'first_name': employee.first_name,
+        'last_name': employee.last_name,
+        'national_id': employee.national_id,
+        'card_number': employee.card_number,
+        'phone': employee.phone,
+        'email': employee.email,
+        'address': employee.address,
+        'start_date': employee.start_date.isoformat() if employee.start_date else None,
+        'daily_rate': _float(employee.daily_rate),
+        'active': employee.active,
+    }
+
+
+def validate_employee_data(data, partial=False):
+    """Validate employee fields from a JSON payload.
+
+    Returns ``(values, errors)`` like ``api.validate_company_data``.
+    """
+    values = {}
+    errors = {}
+    if not isinstance(data, dict):
+        return values, {'_': 'Geçersiz personel verisi'}
+    for field, label in (('first_name', 'Ad'), ('last_name', 'Soyad')):
+        if field in data or not partial:
+            value = str(data.get(field) or '').strip()
+            if not 1 <= len(value) <= 50:
+                errors[field] = f'{label} 1-50 karakter olmalıdır'
+            values[field] = value
+    if 'national_id' in data or not partial:
+        value = str(data.get('national_id') or '').strip()
+        if value and not valid_national_id(value):
+            errors['national_id'] = 'Geçerli bir TC kimlik numarası giriniz'
+        values['national_id'] = value or None
+    for field, length in (('card_number', 32), ('phone', 20), ('address', 255)):
+        if field in data or not partial:
+            value = str(data.get(field) or '').strip()
+            if len(value) > length:
+                errors[field] = f'En fazla {length} karakter girilebilir'
+            values[field] = value or None
+    if 'email' in data or not partial:
+        value = str(data.get('email') or '').strip()
+        if value and ('@' not in value or len(value) > 120):
+            errors['email'] = 'Geçerli bir e-posta adresi giriniz'
+        values['email'] = value or None
+    if 'start_date' in data or not partial:
+        try:
+            values['start_date'] = parse_date(data.get('start_date'), 'Geçersiz işe başlama tarihi')
+        except PersonnelError as e:
+            errors['start_date'] = str(e)
+    if 'daily_rate' in data or not partial:
+        try:
+            values['daily_rate'] = parse_amount(data.get('daily_rate', 0), allow_zero=True)
+        except PersonnelError:
+            errors['daily_rate'] = 'Geçersiz günlük ücret'
+    if 'active' in data:
+        values['active'] = data['active'] is not False
+    return values, errors
+
+
+def user_employees(user_id, include_inactive=True):
+    query = Employee.query.filter_by(user_id=user_id)
+    if not include_inactive:
+        query = query.filter_by(active=True)
+    return query.order_by(Employee.last_name, Employee.first_name, Employee.id).all()
+
+
+def get_user_employee(user_id, employee_id):
+    return Employee.query.filter_by(id=employee_id, user_id=user_id).first()
+
+
+def owned_employee_ids(user_id, employee_ids, connection=None):
+    """The subset of ``employee_ids`` belonging to the user"""
+    connection = connection or db.session.connection()
+    owned = set()
+    for chunk in _chunks(sorted(set(employee_ids))):
+        owned.update(connection.execute(
+            select(Employee.id).where(Employee.user_id == user_id, Employee.id.in_(chunk))
+        ).scalars())
+    return owned
+
+
+def has_payment_history(employee_id):
+    return db.session.execute(
+        select(Employee.id).where(
+            Employee.id == employee_id,
+            or_(select(Advance.id).where(Advance.employee_id == employee_id).exists(),
+                select(SalaryPayment.id).where(SalaryPayment.employee_id == employee_id).exists())
+        )
+    ).first() is not None
+
+
+def delete_employee(employee):
+    """Delete an employee without payment history and their attendance"""
+    try:
+        for model in (AttendanceWeek, AttendanceNote):
+            db.session.execute(delete(model).where(model.employee_id == employee.id))
+        db.session.delete(employee)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error deleting employee {employee.id}: {str(e)}")
+        raise
+
+
+# Attendance
+
+def attendance_masks(user_id, keys, connection=None):
+    """``{(employee_id, week_start): days}`` of the stored rows among ``keys``"""
+    connection = connection or db.session.connection()
+    masks = {}
+    for chunk in _chunks(sorted(set(keys))):
+        masks.update(((employee_id, week), days) for employee_id, week, days in connection.execute(
+            select(AttendanceWeek.employee_id, AttendanceWeek.week_start, AttendanceWeek.days)
+            .where(AttendanceWeek.user_id == user_id,
+                   tuple_(AttendanceWeek.employee_id, AttendanceWeek.week_start).in_(chunk))
+        ))
+    return masks
+
+
+def paid_weeks(user_id, keys, connection=None):
+    """The ``(employee_id, week_start)`` keys among ``keys`` whose pay is recorded"""
+    connection = connection or db.session.connection()
+    paid = set()
+    for chunk in _chunks(sorted(set(keys))):
+        paid.update(tuple(key) for key in connection.execute(
+            select(SalaryPayment.employee_id, SalaryPayment.week_start)
+            .where(SalaryPayment.user_id == user_id,
+                   tuple_(SalaryPayment.employee_id, SalaryPayment.week_start).in_(chunk))
+        ))
+    return paid
+
+
+def upsert_attendance_weeks(user_id, rows, connection=None, existing=None):
+    """Insert or overwrite attendance rows in bulk.
+
+    ``rows`` are dicts with ``employee_id``, ``week_start`` and ``days``
+    and optionally ``daily_rate`` (kept as it is when absent). The employees
+    must belong to the user. ``existing``, the keys already stored, is
+    looked up when not given. Returns ``(created, updated)``.
+    """
+    if not rows:
+        return 0, 0
+    connection = connection or db.session.connection()
+    keys = [(row['employee_id'], row['week_start']) for row in rows]
+    if existing is None:
+        existing = set(attendance_masks(user_id, keys, connection))
+    now = datetime.utcnow()
+    inserts = []
+    # executemany needs the same parameters in every row: one statement per set of columns
+    updates = {}
+    for row, key in zip(rows, keys):
+        if key in existing:
+            updates.setdefault('daily_rate' in row, []).append(
+                {**{f'new_{name}': value for name, value in row.items()},
+                 'key_employee_id': key[0], 'key_week_start': key[1], 'new_updated_at': now}
+            )
+        else:
+            inserts.append({'daily_rate': None, **row, 'user_id': user_id, 'updated_at': now})
+    if inserts:
+        connection.execute(insert(AttendanceWeek), inserts)
+    for with_rate, params in updates.items():
+        values = {'days': bindparam('new_days'), 'updated_at': bindparam('new_updated_at')}
+        if with_rate:
+            values['daily_rate'] = bindparam('new_daily_rate')
+        connection.execute(
+            update(AttendanceWeek.__table__)
+            .where(AttendanceWeek.employee_id == bindparam('key_employee_id'),
+                   AttendanceWeek.week_start == bindparam('key_week_start'))
+            .values(**values),
+            params
+        )
+    return len(inserts), sum(len(params) for params in updates.values())
+
+
+def save_attendance_notes(notes, connection=None):
+    """Set or, with an empty text, remove notes: dicts with ``employee_id``, ``day`` and ``note``"""
+    if not notes:
+        return 0
+    connection = connection or db.session.connection()
+    keys = [(note['employee_id'], note['day']) for note in notes]
+    existing = set()
+    for chunk in _chunks(sorted(set(keys))):
+        existing.update(tuple(key) for key in connection.execute(
+            select(AttendanceNote.employee_id, AttendanceNote.day)
+            .where(tuple_(AttendanceNote.employee_id, AttendanceNote.day).in_(chunk))
+        ))
+    inserts, updates, deletes = [], [], []
+    for note, key in zip(notes, keys):
+        params = {'key_employee_id': key[0], 'key_day': key[1]}
+        if not note['note']:
+            if key in existing:
+                deletes.append(params)
+        elif key in existing:
+            updates.append({**params, 'new_note': note['note']})
+        else:
+            inserts.append(note)
+    condition = and_(AttendanceNote.employee_id == bindparam('key_employee_id'),
+                     AttendanceNote.day == bindparam('key_day'))
+    if inserts:
+        connection.execute(insert(AttendanceNote), inserts)
+    if updates:
+        connection.execute(update(AttendanceNote.__table__).where(condition)
+                           .values(note=bindparam('new_note')), updates)
+    if deletes:
+        connection.execute(delete(AttendanceNote.__table__).where(condition), deletes)
+    return len(inserts) + len(updates) + len(deletes)
+
+
+def save_attendance(user_id, start, items, notes=()):
+    """Store the attendance of a week from a JSON payload and commit.
+
+    ``items``: ``[{"employee_id": 1, "days": [true, true, false, true, true, true],
+    "daily_rate": null}]``, where a missing ``daily_rate`` keeps the stored
+    one and ``null`` pays the employee's rate. ``notes``:
+    ``[{"employee_id": 1, "date": "2024-11-05", "note": "..."}]``, an empty
+    note removes it. Employees whose pay of the week is recorded cannot be
+    changed.
+    """
+    if not isinstance(items, list) or not isinstance(notes, (list, tuple)):
+        raise PersonnelError('Geçersiz puantaj verisi')
+    if len(items) + len(notes) > MAX_ATTENDANCE_ITEMS:
+        raise PersonnelError(f'Tek istekte en fazla {MAX_ATTENDANCE_ITEMS} kayıt gönderilebilir')
+    days = set(week_days(start))
+    rows = {}
+    note_rows = {}
+    try:
+        for item in items:
+            employee_id = int(item['employee_id'])
+            row = {'employee_id': employee_id, 'week_start': start, 'days': days_to_mask(item['days'])}
+            if 'daily_rate' in item:
+                rate = item['daily_rate']
+                row['daily_rate'] = None if rate in (None, '') else parse_amount(rate, allow_zero=True)
+            rows[employee_id] = row
+        for note in notes:
+            day = parse_date(note['date'])
+            if day not in days:
+                raise PersonnelError('Not tarihi seçilen haftanın çalışma günlerinden biri olmalıdır')
+            text = str(note.get('note') or '').strip()
+            if len(text) > MAX_NOTE_LENGTH:
+                raise PersonnelError(f'Not en fazla {MAX_NOTE_LENGTH} karakter olabilir')
+            employee_id = int(note['employee_id'])
+            note_rows[employee_id, day] = {'employee_id': employee_id, 'day': day, 'note': text}
+    except PersonnelError:
+        raise
+    except (KeyError, TypeError, ValueError, AttributeError):
+        raise PersonnelError('Geçersiz puantaj verisi')
+
+    requested = set(rows) | {employee_id for employee_id, _ in note_rows}
+    unknown = requested - owned_employee_ids(user_id, requested)
+    if unknown:
+        raise PersonnelError(f'Personel bulunamadı: {", ".join(map(str, sorted(unknown)))}')
+    paid = paid_weeks(user_id, [(employee_id, start) for employee_id in requested])
+    if paid:
+        raise PersonnelConflict(f'Bu haftanın ödemesi yapılmış personelin puantajı değiştirilemez: '
+                                f'{", ".join(str(employee_id) for employee_id, _ in sorted(paid))}')
+    try:
+        created, updated = upsert_attendance_weeks(user_id, list(rows.values()))
+        noted = save_attendance_notes(list(note_rows.values()))
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error saving attendance of week {start} for user {user_id}: {str(e)}")
+        raise
+    return {'week_start': start.isoformat(), 'created': created, 'updated': updated, 'notes': noted}
+
+
+def weekly_attendance(user_id, start):
+    """Attendance grid of a week: active employees and everyone with a record that week"""
+    days = week_days(start)
+    weeks = {
+        row.employee_id: row for row in db.session.execute(
+            select(AttendanceWeek.employee_id, AttendanceWeek.days, AttendanceWeek.daily_rate)
+            .where(AttendanceWeek.user_id == user_id, AttendanceWeek.week_start == start)
+        )
+    }
+    notes = {}
+    for row in db.session.execute(
+        select(AttendanceNote.employee_id, AttendanceNote.day, AttendanceNote.note)
+        .join(Employee, AttendanceNote.employee_id == Employee.id)
+        .where(Employee.user_id == user_id, AttendanceNote.day.between(days[0], days[-1]))
+    ):
+        notes.setdefault(row.employee_id, {})[row.day.isoformat()] = row.note
+    employees = []
+    for employee in user_employees(user_id):
+        week = weeks.get(employee.id)
+        if not employee.active and week is None and employee.id not in notes:
+            continue
+        employees.append({
+            'id': employee.id,
+            'name': employee.full_name,
+            'active': employee.active,
+            'daily_rate': _float(employee.daily_rate),
+            'week_rate': _float(week.daily_rate) if week else None,
+            'days': mask_to_days(week.days if week else 0),
+            'notes': notes.get(employee.id, {}),
+        })
+    return {
+        'week_start': start.isoformat(),
+        'days': [{'date': day.isoformat(), 'name': name} for day, name in zip(days, DAY_NAMES)],
+        'employees': employees,
+    }
+
+
+# Advances
+
+def advance_to_dict(advance):
+    return {
+        'id': advance.id,
+        'employee_id': advance.employee_id,
+        'date': advance.paid_on.isoformat(),
+        'amount': _float(advance.amount),
+        'note': advance.note,
+    }
+
+
+def add_advance(user_id, data):
+    """Record an advance from a JSON payload and commit"""
+    if not isinstance(data, dict):
+        raise PersonnelError('Geçersiz avans verisi')
+    try:
+        employee_id = int(data.get('employee_id'))
+    except (TypeError, ValueError):
+        raise PersonnelError('Personel bulunamadı')
+    if not get_user_employee(user_id, employee_id):
+        raise PersonnelError('Personel bulunamadı')
+    note = str(data.get('note') or '').strip()
+    if len(note) > MAX_NOTE_LENGTH:
+        raise PersonnelError(f'Not en fazla {MAX_NOTE_LENGTH} karakter olabilir')
+    advance = Advance(
+        employee_id=employee_id,
+        user_id=user_id,
+        paid_on=parse_date(data.get('date') or date.today().isoformat()),
+        amount=parse_amount(data.get('amount')),
+        note=note or None,
+    )
+    paid = db.session.execute(
+        select(SalaryPayment.id).where(SalaryPayment.employee_id == employee_id,
+                                       SalaryPayment.week_start == week_start(advance.paid_on))
+    ).first()
+    if paid:
+        raise PersonnelConflict('Bu haftanın ödemesi yapıldı, avans başka bir haftaya girilmelidir')
+    try:
+        db.session.add(advance)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error adding advance for employee {employee_id}: {str(e)}")
+        raise
+    return advance
+
+
+def week_advances(user_id, start):
+    """Advances of all the user's employees paid in the week starting ``start`` (Monday to Sunday)"""
+    return db.session.execute(
+        select(Advance)
+        .where(Advance.user_id == user_id, Advance.paid_on >= start, Advance.paid_on < start + timedelta(days=7))
+        .order_by(Advance.paid_on, Advance.id)
+    ).scalars().all()
+
+
+def delete_advance(user_id, advance_id):
+    """Delete an advance of a week that is not paid yet; False if there is no such advance"""
+    advance = Advance.query.filter_by(id=advance_id, user_id=user_id).first()
+    if not advance:
+        return False
+    paid = db.session.execute(
+        select(SalaryPayment.id).where(SalaryPayment.employee_id == advance.employee_id,
+                                       SalaryPayment.week_start == week_start(advance.paid_on))
+    ).first()
+    if paid:
+        raise PersonnelConflict('Ödemesi yapılmış haftanın avansı silinemez')
+    try:
+        db.session.delete(advance)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error deleting advance {advance_id}: {str(e)}")
+        raise
+    return True
+
+
+# Pay list
+
+def _payroll_figures(user_id, start):
+    """Employees of the pay list of a week and their figures as int64 arrays of kuruş.
+
+    Money stays in integer kuruş from the Numeric columns to the stored
+    payment, so no amount goes through a binary float.
+    """
+    connection = db.session.connection()
+    employees = connection.execute(
+        select(Employee.id, Employee.first_name, Employee.last_name, Employee.active, Employee.daily_rate)
+        .where(Employee.user_id == user_id)
+        .order_by(Employee.last_name, Employee.first_name, Employee.id)
+    ).all()
+    weeks = {
+        employee_id: (days, rate) for employee_id, days, rate in connection.execute(
+            select(AttendanceWeek.employee_id, AttendanceWeek.days, AttendanceWeek.daily_rate)
+            .where(AttendanceWeek.user_id == user_id, AttendanceWeek.week_start == start)
+        )
+    }
+    advance_items = {}
+    for employee_id, paid_on, amount in connection.execute(
+        select(Advance.employee_id, Advance.paid_on, Advance.amount)
+        .where(Advance.user_id == user_id, Advance.paid_on >= start, Advance.paid_on < start + timedelta(days=7))
+        .order_by(Advance.paid_on, Advance.id)
+    ):
+        advance_items.setdefault(employee_id, []).append((paid_on, _kurus(amount)))
+    payments = {
+        row.employee_id: row for row in connection.execute(
+            select(SalaryPayment.employee_id, SalaryPayment.days_worked, SalaryPayment.paid_at,
+                   SalaryPayment.daily_rate, SalaryPayment.gross, SalaryPayment.advances, SalaryPayment.net)
+            .where(SalaryPayment.user_id == user_id, SalaryPayment.week_start == start)
+        )
+    }
+    employees = [
+        row for row in employees
+        if row.active or row.id in weeks or row.id in advance_items or row.id in payments
+    ]
+
+    count = len(employees)
+    ids = [row.id for row in employees]
+    masks = np.fromiter((weeks.get(i, (0, None))[0] for i in ids), dtype=np.int64, count=count)
+    # -1: no rate for this week, the employee's rate applies
+    week_rates = np.fromiter((-1 if weeks.get(i, (0, None))[1] is None else _kurus(weeks[i][1]) for i in ids),
+                             dtype=np.int64, count=count)
+    employee_rates = np.fromiter((_kurus(row.daily_rate) for row in employees), dtype=np.int64, count=count)
+    advances = np.fromiter((sum(amount for _, amount in advance_items.get(i, ())) for i in ids),
+                           dtype=np.int64, count=count)
+    days = _DAY_COUNTS[masks & FULL_WEEK]
+    rates = np.where(week_rates < 0, employee_rates, week_rates)
+    gross = days * rates
+    net = gross - advances
+    for position, employee_id in enumerate(ids):
+        payment = payments.get(employee_id)
+        if payment is not None:
+            days[position] = payment.days_worked
+            rates[position] = _kurus(payment.daily_rate)
+            gross[position] = _kurus(payment.gross)
+            advances[position] = _kurus(payment.advances)
+            net[position] = _kurus(payment.net)
+    return {
+        'employees': employees, 'masks': masks, 'days': days, 'rates': rates, 'gross': gross,
+        'advances': advances, 'net': net, 'advance_items': advance_items, 'payments': payments,
+    }
+
+
+def weekly_payroll(user_id, start):
+    """Pay list of a week: days worked, rate, gross pay, advances and net pay per employee.
+
+    Lists active employees and everyone with attendance, advances or a
+    payment that week; paid employees with the stored payment figures.
+    """
+    started = time.perf_counter()
+    figures = _payroll_figures(user_id, start)
+    masks, days, rates, gross, advances, net = (
+        figures[name] for name in ('masks', 'days', 'rates', 'gross', 'advances', 'net'))
+    payments = figures['payments']
+    items = [
+        {
+            'employee_id': row.id,
+            'name': f'{row.first_name} {row.last_name}',
+            'days': mask_to_days(int(masks[position])),
+            'days_worked': int(days[position]),
+            'daily_rate': int(rates[position]) / 100,
+            'gross': int(gross[position]) / 100,
+            'advances': int(advances[position]) / 100,
+            'advance_items': [{'date': paid_on.isoformat(), 'amount': amount / 100}
+                              for paid_on, amount in figures['advance_items'].get(row.id, ())],
+            'net': int(net[position]) / 100,
+            'paid_at': payments[row.id].paid_at.isoformat() if row.id in payments else None,
+        }
+        for position, row in enumerate(figures['employees'])
+    ]
+    return {
+        'week_start': start.isoformat(),
+        'week_end': (start + timedelta(days=WORK_DAYS - 1)).isoformat(),
+        'items': items,
+        'summary': {
+            'employees': len(items),
+            'days_worked': int(days.sum()),
+            'gross': int(gross.sum()) / 100,
+            'advances': int(advances.sum()) / 100,
+            'net': int(net.sum()) / 100,
+            'paid': len(payments),
+            # Advances above the pay of the week, carried as a debt
+            'negative': int((net < 0).sum()),
+        },
+        'seconds': round(time.perf_counter() - started, 3),
+    }
+
+
+def pay_week(user_id, start):
+    """Store the pay list of a week as paid for every unpaid employee with pay or advances"""
+    figures = _payroll_figures(user_id, start)
+    paid_at = datetime.utcnow()
+    rows = [
+        {
+            'employee_id': row.id,
+            'user_id': user_id,
+            'week_start': start,
+            'days_worked': int(figures['days'][position]),
+            'daily_rate': _money(figures['rates'][position]),
+            'gross': _money(figures['gross'][position]),
+            'advances': _money(figures['advances'][position]),
+            'net': _money(figures['net'][position]),
+            'paid_at': paid_at,
+        }
+        for position, row in enumerate(figures['employees'])
+        if row.id not in figures['payments'] and (figures['days'][position] or figures['advances'][position])
+    ]
+    try:
+        if rows:
+            db.session.execute(insert(SalaryPayment), rows)
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        raise PersonnelConflict('Bu haftanın ödemesi başka bir işlemle kaydedildi, listeyi yenileyin')
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error paying week {start} for user {user_id}: {str(e)}")
+        raise
+    logger.info(f"Paid week {start} for user {user_id}: {len(rows)} employees")
+    return {
+        'week_start': start.isoformat(),
+        'paid': len(rows),
+        'net': float(sum((row['net'] for row in rows), Decimal(0))),
+    }
+
+
+def payment_history(employee_id, limit=DEFAULT_HISTORY_LIMIT):
+    """Advances and salary payments of an employee, newest first"""
+    entries = [
+        {'type': 'advance', 'date': advance.paid_on.isoformat(), 'amount': _float(advance.amount),
+         'note': advance.note}
+        for advance in db.session.execute(
+            select(Advance).where(Advance.employee_id == employee_id)
+            .order_by(Advance.paid_on.desc(), Advance.id.desc()).limit(limit)
+        ).scalars()
+    ]
+    entries += [
+        {'type': 'salary', 'date': payment.paid_at.date().isoformat(), 'amount': _float(payment.net),
+         'week_start': payment.week_start.isoformat(), 'days_worked': payment.days_worked,
+         'daily_rate': _float(payment.daily_rate), 'gross': _float(payment.gross),
+         'advances': _float(payment.advances)}
+        for payment in db.session.execute(
+            select(SalaryPayment).where(SalaryPayment.employee_id == employee_id)
+            .order_by(SalaryPayment.week_start.desc()).limit(limit)
+        ).scalars()
+    ]
+    entries.sort(key=lambda entry: entry['date'], reverse=True)
+    return entries[:limit]
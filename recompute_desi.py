@@ -0,0 +1,104 @@
+from app import app, db
+from models import Pallet, PalletSpec
+from data_version import bump_data_version_for_companies
+from company_stats import recompute_company_stats
+from pallet_specs import DESI_COLUMNS
+from utils import DIMENSION_FIELDS, calculate_component_volumes_batch, desi_to_decimal
+from sqlalchemy import func, select, update
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 5000
+
+
+def recompute_desi_chunk(rows):
+    """Recalculate desi for one chunk of spec rows.
+
+    Returns ``(updates, error_ids)`` where ``updates`` holds parameter dicts for
+    an executemany UPDATE of the rows whose stored values changed.
+    """
+    columns = {field: [getattr(row, field) for row in rows] for field in DIMENSION_FIELDS}
+    volumes = calculate_component_volumes_batch(columns)
+
+    updates = []
+    error_ids = []
+    for i, row in enumerate(rows):
+        if volumes['error'][i]:
+            error_ids.append(row.id)
+            continue
+        values = {
+            column: desi_to_decimal(volumes[field][i])
+            for field, column in DESI_COLUMNS.items()
+        }
+        if any(getattr(row, column) != value for column, value in values.items()):
+            values['id'] = row.id
+            updates.append(values)
+    return updates, error_ids
+
+
+def recompute_desi(chunk_size=DEFAULT_CHUNK_SIZE, company_ids=None, dry_run=False):
+    """Recalculate the stored desi columns of every pallet spec in chunks.
+
+    With ``company_ids`` only the specs used by pallets of those companies
+    are recalculated. Specs are read in primary key order with keyset
+    pagination so each chunk costs the same, only the needed columns are
+    selected and changed rows are written with one executemany UPDATE per
+    chunk. The companies whose pallets use a changed spec get their stats
+    recomputed and their owners' data version bumped. Every chunk is
+    committed on its own, so an interrupted run can simply be started again.
+    """
+    stats = {'specs': 0, 'updated': 0, 'pallets': 0, 'errors': 0, 'error_ids': [], 'chunks': 0}
+    selected = [PalletSpec.id] + [getattr(PalletSpec, field) for field in DIMENSION_FIELDS] + \
+        [getattr(PalletSpec, column) for column in DESI_COLUMNS.values()]
+    started = time.perf_counter()
+
+    with app.app_context():
+        last_id = 0
+        while True:
+            query = select(*selected).where(PalletSpec.id > last_id).order_by(PalletSpec.id).limit(chunk_size)
+            if company_ids:
+                query = query.where(
+                    PalletSpec.id.in_(select(Pallet.spec_id).where(Pallet.company_id.in_(company_ids)))
+                )
+            rows = db.session.execute(query).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+
+            # Specs are only created from valid dimensions, errors mean the formula changed
+            updates, error_ids = recompute_desi_chunk(rows)
+            try:
+                if updates:
+                    counts = dict(db.session.execute(
+                        select(Pallet.company_id, func.count())
+                        .where(Pallet.spec_id.in_([values['id'] for values in updates]))
+                        .group_by(Pallet.company_id)
+                    ).all())
+                    stats['pallets'] += sum(counts.values())
+                    if not dry_run:
+                        db.session.execute(update(PalletSpec), updates)
+                        bump_data_version_for_companies(counts)
+                        recompute_company_stats(counts)
+                db.session.commit()
+            except Exception as e:
+                logger.error(f"Error updating desi of spec chunk ending at spec {last_id}: {str(e)}")
+                db.session.rollback()
+                raise
+
+            stats['chunks'] += 1
+            stats['specs'] += len(rows)
+            stats['updated'] += len(updates)
+            stats['errors'] += len(error_ids)
+            stats['error_ids'].extend(error_ids)
+            logger.info(
+                f"Desi recompute: {stats['specs']} specs processed, {stats['updated']} updated, "
+                f"{stats['pallets']} pallets affected (last spec {last_id})"
+            )
+
+    stats['seconds'] = round(time.perf_counter() - started, 3)
+    if stats['errors']:
+        logger.warning(f"{stats['errors']} specs have invalid dimensions: {stats['error_ids'][:20]}")
+    logger.info(f"Desi recompute finished in {stats['seconds']} s")
+    return stats
@@ -0,0 +1,201 @@
+"""Bulk repricing of pallets from their stored desi values.
+
+The new price of every pallet is::
+
+    (board desi x board rate + block desi x block rate + pieces x labor per piece)
+        x (1 + margin / 100)
+
+rounded to ``round_to`` TL. Desi and quantities come from the pallet's
+spec (see ``pallet_specs``); board desi is the sum of the upper, lower
+and closure board desi and pieces counts every board plus the
+``BLOCK_COUNT`` blocks. Prices of a whole company or of all the user's
+companies are computed in one NumPy pass over the selected columns; the
+changed rows are then written with one executemany UPDATE of the table.
+
+Pallets without stored desi (run ``flask recompute-desi``) or whose new
+price does not fit the column are skipped and reported.
+"""
+from app import db
+from models import Company, Pallet, PalletSpec
+from data_version import bump_data_version, bump_data_version_if, get_data_version
+from company_stats import StatsChanges, apply_stats_changes
+from utils import BLOCK_COUNT
+from sqlalchemy import Float, bindparam, select, type_coerce, update
+from decimal import Decimal
+import logging
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Rows listed in the preview, largest changes first
+MAX_PREVIEW_ROWS = 200
+MAX_PRICE = 99999999.99
+
+BOARD_DESI_FIELDS = ('upper_board_desi', 'lower_board_desi', 'closure_desi')
+PIECE_FIELDS = ('upper_board_quantity', 'lower_board_quantity', 'closure_quantity')
+RATE_FIELDS = ('board_rate', 'block_rate', 'labor_per_piece', 'margin')
+
+
+class RepricingError(ValueError):
+    """Invalid repricing parameters; the message is shown to the user"""
+
+
+class RepricingConflict(RepricingError):
+    """The catalog changed after the preview"""
+
+
+def parse_repricing_params(data):
+    """Validate the rates; returns a dict of floats"""
+    if not isinstance(data, dict):
+        raise RepricingError('Geçersiz fiyatlandırma verisi')
+    params = {}
+    for field in RATE_FIELDS + ('round_to',):
+        value = data.get(field)
+        if value in (None, ''):
+            if field in ('board_rate', 'block_rate'):
+                raise RepricingError('Tahta ve takoz desi fiyatı zorunludur')
+            value = 0.01 if field == 'round_to' else 0
+        try:
+            params[field] = float(str(value).replace(',', '.'))
+        except ValueError:
+            raise RepricingError('Geçersiz sayı')
+        if not np.isfinite(params[field]):
+            raise RepricingError('Geçersiz sayı')
+    if min(params['board_rate'], params['block_rate'], params['labor_per_piece']) < 0:
+        raise RepricingError('Fiyatlar negatif olamaz')
+    if not -100 < params['margin'] <= 1000:
+        raise RepricingError('Kâr marjı -100 ile 1000 arasında olmalıdır')
+    if not 0.01 <= params['round_to'] <= 1000:
+        raise RepricingError('Yuvarlama 0.01 ile 1000 arasında olmalıdır')
+    return params
+
+
+def compute_prices(columns, params):
+    """New prices for column arrays of desi values and quantities; NaN where desi is missing"""
+    board_desi = sum(columns[field] for field in BOARD_DESI_FIELDS)
+    pieces = sum(columns[field] for field in PIECE_FIELDS) + BLOCK_COUNT
+    cost = (board_desi * params['board_rate'] + columns['block_desi'] * params['block_rate'] +
+            pieces * params['labor_per_piece'])
+    price = cost * (1 + params['margin'] / 100)
+    # Round in cents first so 0.01 steps do not pick up binary noise
+    step = round(params['round_to'] * 100)
+    return np.round(np.round(price * 100) / step) * step / 100
+
+
+def _column(values):
+    # float64 conversion turns NULL (None) into NaN
+    return np.array(values, dtype=np.float64)
+
+
+def _company_price_changes(company_ids, delta):
+    """Sum the price changes per company in cents and return them as StatsChanges"""
+    companies, inverse = np.unique(company_ids, return_inverse=True)
+    cents = np.zeros(len(companies), dtype=np.int64)
+    np.add.at(cents, inverse, np.round(delta * 100).astype(np.int64))
+    changes = StatsChanges()
+    for company_id, total in zip(companies.tolist(), cents.tolist()):
+        changes.shift(company_id, price=Decimal(total) / 100)
+    return changes
+
+
+def reprice(user_id, params, company_id=None, dry_run=True, expected_version=None):
+    """Compute (and unless ``dry_run`` apply) new prices for the user's pallets.
+
+    Returns a summary with the data version the preview was based on; pass
+    it back as ``expected_version`` to apply only if nothing changed since.
+    Applying bumps the version first, which locks out other writes of the
+    user until the new prices are committed.
+    """
+    started = time.perf_counter()
+    company_ids = db.session.execute(select(Company.id).where(Company.user_id == user_id)).scalars().all()
+    if company_id is not None:
+        if company_id not in company_ids:
+            raise RepricingError('Firma bulunamadı')
+        company_ids = [company_id]
+    version = get_data_version(user_id)
+    if dry_run:
+        if expected_version is not None and int(expected_version) != version:
+            raise RepricingConflict('Paletler önizlemeden sonra değişti, lütfen yeniden önizleyin')
+        return _reprice(user_id, params, company_ids, version, dry_run, started)
+    try:
+        if expected_version is None:
+            bump_data_version([user_id])
+        elif not bump_data_version_if(user_id, int(expected_version)):
+            raise RepricingConflict('Paletler önizlemeden sonra değişti, lütfen yeniden önizleyin')
+        return _reprice(user_id, params, company_ids, version, dry_run, started)
+    except Exception as e:
+        db.session.rollback()
+        if not isinstance(e, RepricingConflict):
+            logger.error(f"Error applying repricing for user {user_id}: {str(e)}")
+        raise
+
+
+def _reprice(user_id, params, company_ids, version, dry_run, started):
+    """Compute the new prices and, unless ``dry_run``, write them and commit"""
+
+    fields = ('price',) + BOARD_DESI_FIELDS + ('block_desi',) + PIECE_FIELDS
+    rows = []
+    if company_ids:
+        # Core statement with float results: no ORM rows and no Decimal per value
+        rows = db.session.connection().execute(
+            select(Pallet.id, Pallet.name, Pallet.company_id, type_coerce(Pallet.price, Float),
+                   *[type_coerce(getattr(PalletSpec, field), Float) for field in fields[1:]])
+            .join(PalletSpec, Pallet.spec_id == PalletSpec.id)
+            .where(Pallet.company_id.in_(company_ids))
+            .order_by(Pallet.id)
+        ).all()
+    values = list(zip(*rows)) if rows else [()] * (3 + len(fields))
+    ids = np.array(values[0], dtype=np.int64)
+    pallet_companies = np.array(values[2], dtype=np.int64)
+    columns = {field: _column(values[3 + i]) for i, field in enumerate(fields)}
+    old = columns['price']
+    new = compute_prices(columns, params)
+    skipped = ~np.isfinite(new) | (new < 0) | (new > MAX_PRICE)
+    changed = ~skipped & (np.abs(new - np.nan_to_num(old)) >= 0.005)
+    delta = np.where(changed, new - np.nan_to_num(old), 0.0)
+
+    changed_indexes = np.flatnonzero(changed)
+    preview = changed_indexes[np.argsort(-np.abs(delta[changed_indexes]), kind='stable')][:MAX_PREVIEW_ROWS]
+    result = {
+        'dry_run': dry_run,
+        'data_version': version,
+        'pallets': len(rows),
+        'changed': int(changed.sum()),
+        'unchanged': int((~changed & ~skipped).sum()),
+        'skipped': int(skipped.sum()),
+        'skipped_ids': ids[skipped][:50].tolist(),
+        'old_total': round(float(np.nansum(old)), 2),
+        'new_total': round(float(np.nansum(np.where(skipped, old, new))), 2),
+        'rows': [
+            {
+                'id': int(ids[i]),
+                'name': values[1][i],
+                'old_price': round(float(old[i]), 2),
+                'new_price': round(float(new[i]), 2),
+                'change_percent': round(float(delta[i] / old[i] * 100), 2) if old[i] else None,
+            }
+            for i in preview
+        ],
+    }
+
+    if not dry_run and len(changed_indexes):
+        updates = [{'pallet_id': int(ids[i]), 'new_price': Decimal(f'{new[i]:.2f}')} for i in changed_indexes]
+        db.session.execute(
+            update(Pallet.__table__)
+            .where(Pallet.id == bindparam('pallet_id'))
+            .values(price=bindparam('new_price')),
+            updates
+        )
+        apply_stats_changes(_company_price_changes(pallet_companies[changed], delta[changed]))
+        db.session.commit()
+        result['data_version'] = get_data_version(user_id)
+    elif not dry_run:
+        # Nothing to write: give back the version bump
+        db.session.rollback()
+
+    result['seconds'] = round(time.perf_counter() - started, 3)
+    logger.info(f"Repricing for user {user_id} ({'dry run' if dry_run else 'applied'}): "
+                f"{result['changed']} of {result['pallets']} changed, {result['skipped']} skipped")
+    return result
@@ -0,0 +1,310 @@
+"""Per-endpoint request metrics, the /metrics endpoint and a sampling profiler.
+
+Every request records its latency, SQL statement count, SQL time and response
+size in per-endpoint histograms. Measurements end when the response is
+closed, so streamed exports include the time spent streaming. ``/metrics``
+renders these, the database pool metrics and the cache counters in the
+Prometheus text format. Numbers are per worker process; scrape every worker
+or aggregate in Prometheus.
+
+The profiler is off by default. With ``PROFILE_SAMPLE_RATE`` above zero a
+share of requests is profiled (cProfile or a stack sampler) and profiles of
+requests slower than ``PROFILE_THRESHOLD_MS`` are written to ``PROFILE_DIR``.
+"""
+from flask import Response, abort, g, request
+from flask_login import current_user
+from werkzeug.wsgi import ClosingIterator
+from app import app
+import db_metrics
+from db_metrics import Histogram, LATENCY_BUCKETS
+from cache import cache_stats
+from compression import compression_stats
+from collections import Counter
+import cProfile
+import hmac
+import logging
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', '0'))
+PROFILE_THRESHOLD_MS = float(os.environ.get('PROFILE_THRESHOLD_MS', '500'))
+# "cprofile" writes .prof files (snakeviz, pstats); "stack" writes folded stacks for flame graphs
+PROFILE_MODE = os.environ.get('PROFILE_MODE', 'cprofile')
+PROFILE_DIR = os.environ.get('PROFILE_DIR') or os.path.join(tempfile.gettempdir(), 'palet_profiles')
+PROFILE_MAX_FILES = int(os.environ.get('PROFILE_MAX_FILES', '200'))
+STACK_SAMPLE_INTERVAL = 0.005
+
+SQL_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200, 500)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216, 67108864)
+
+
+class LabeledHistograms:
+    """Histograms keyed by endpoint"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label, value):
+        histogram = self._histograms.get(label)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(label, Histogram(self.buckets))
+        histogram.observe(value)
+
+    def snapshots(self):
+        with self._lock:
+            items = list(self._histograms.items())
+        return [(label, histogram.snapshot()) for label, histogram in sorted(items)]
+
+
+request_duration = LabeledHistograms(LATENCY_BUCKETS)
+request_sql_statements = LabeledHistograms(SQL_COUNT_BUCKETS)
+request_sql_seconds = LabeledHistograms(LATENCY_BUCKETS)
+response_size = LabeledHistograms(SIZE_BUCKETS)
+request_counts = Counter()
+_counts_lock = threading.Lock()
+# Only one profile at a time: cProfile can not nest across threads on every Python version
+_profile_lock = threading.Lock()
+
+
+class StackSampler:
+    """Samples the stack of one thread at a fixed interval and counts folded stacks"""
+
+    def __init__(self, thread_id, interval=STACK_SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})')
+                frame = frame.f_back
+            if names:
+                self.stacks[';'.join(reversed(names))] += 1
+
+    def write(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f'{stack} {count}\n')
+
+
+def _start_profiler():
+    if PROFILE_SAMPLE_RATE <= 0 or random.random() >= PROFILE_SAMPLE_RATE:
+        return None
+    if not _profile_lock.acquire(blocking=False):
+        return None
+    if PROFILE_MODE == 'stack':
+        profiler = StackSampler(threading.get_ident())
+        profiler.start()
+    else:
+        profiler = cProfile.Profile()
+        profiler.enable()
+    return profiler
+
+
+def _finish_profiler(profiler, endpoint, seconds):
+    try:
+        if isinstance(profiler, StackSampler):
+            profiler.stop()
+        else:
+            profiler.disable()
+        if seconds * 1000 < PROFILE_THRESHOLD_MS:
+            return
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        extension = 'folded' if isinstance(profiler, StackSampler) else 'prof'
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{re.sub(r'[^A-Za-z0-9_.-]', '_', endpoint)}-{seconds * 1000:.0f}ms"
+        path = os.path.join(PROFILE_DIR, f'{name}-{os.getpid()}.{extension}')
+        if isinstance(profiler, StackSampler):
+            profiler.write(path)
+        else:
+            profiler.dump_stats(path)
+        logger.info(f"Wrote profile of slow request {endpoint} ({seconds * 1000:.0f} ms) to {path}")
+        _prune_profiles()
+    except Exception as e:
+        logger.error(f"Error writing request profile: {str(e)}")
+    finally:
+        _profile_lock.release()
+
+
+def _prune_profiles():
+    entries = sorted(os.scandir(PROFILE_DIR), key=lambda entry: entry.stat().st_mtime)
+    for entry in entries[:max(len(entries) - PROFILE_MAX_FILES, 0)]:
+        os.remove(entry.path)
+
+
+def _counting_iterable(iterable, state):
+    """Pass a streamed body through while counting its bytes"""
+    try:
+        for chunk in iterable:
+            state['size'] += len(chunk)
+            yield chunk
+    finally:
+        close = getattr(iterable, 'close', None)
+        if close:
+            close()
+
+
+@app.before_request
+def _start_request_metrics():
+    g.request_metrics_started = time.perf_counter()
+    db_metrics.start_request_sql_tracking()
+    g.request_profiler = _start_profiler()
+
+
+@app.after_request
+def _finish_request_metrics(response):
+    started = g.pop('request_metrics_started', None)
+    if started is None:
+        return response
+    endpoint = request.endpoint or 'unmatched'
+    # The request context is gone by the time a streamed response is closed
+    count_key = (endpoint, request.method, response.status_code)
+    profiler = g.pop('request_profiler', None)
+    state = {'size': response.content_length}
+    if state['size'] is None and response.is_streamed and not response.direct_passthrough:
+        state['size'] = 0
+        response.response = _counting_iterable(response.response, state)
+
+    def finish():
+        seconds = time.perf_counter() - started
+        statements, sql_seconds = db_metrics.stop_request_sql_tracking()
+        request_duration.observe(endpoint, seconds)
+        request_sql_statements.observe(endpoint, statements)
+        request_sql_seconds.observe(endpoint, sql_seconds)
+        if state['size'] is not None:
+            response_size.observe(endpoint, state['size'])
+        with _counts_lock:
+            request_counts[count_key] += 1
+        if profiler is not None:
+            _finish_profiler(profiler, endpoint, seconds)
+
+    if response.direct_passthrough:
+        # Werkzeug hands passthrough bodies (send_file) to the server as they are
+        # and never closes the response itself, so close callbacks would not run
+        response.response = ClosingIterator(response.response, finish)
+    else:
+        response.call_on_close(finish)
+    return response
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_bound(bound):
+    return '+Inf' if bound == float('inf') else repr(float(bound))
+
+
+def _histogram_lines(name, help_text, entries):
+    """Prometheus lines for ``(labels dict, snapshot)`` entries of one histogram family"""
+    lines = [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+    for labels, snapshot in entries:
+        label_text = ','.join(f'{key}="{_escape(value)}"' for key, value in labels.items())
+        prefix = f'{label_text},' if label_text else ''
+        for bound, count in snapshot['buckets'].items():
+            lines.append(f'{name}_bucket{{{prefix}le="{_format_bound(bound)}"}} {count}')
+        suffix = f'{{{label_text}}}' if label_text else ''
+        lines.append(f'{name}_sum{suffix} {snapshot["sum"]}')
+        lines.append(f'{name}_count{suffix} {snapshot["count"]}')
+    return lines
+
+
+def _gauge_lines(name, help_text, kind, samples):
+    lines = [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+    for labels, value in samples:
+        label_text = ','.join(f'{key}="{_escape(label)}"' for key, label in labels.items())
+        lines.append(f'{name}{{{label_text}}} {value}' if label_text else f'{name} {value}')
+    return lines
+
+
+def render_metrics():
+    """All metrics of this worker in the Prometheus text exposition format"""
+    lines = []
+    with _counts_lock:
+        counts = sorted(request_counts.items())
+    lines += _gauge_lines('http_requests_total', 'Requests by endpoint, method and status.', 'counter', [
+        ({'endpoint': endpoint, 'method': method, 'status': status}, count)
+        for (endpoint, method, status), count in counts
+    ])
+    for name, help_text, histograms in (
+        ('http_request_duration_seconds', 'Request latency until the response is closed.', request_duration),
+        ('http_request_sql_statements', 'SQL statements executed per request.', request_sql_statements),
+        ('http_request_sql_seconds', 'Time spent in SQL statements per request.', request_sql_seconds),
+        ('http_response_size_bytes', 'Response body size.', response_size),
+    ):
+        lines += _histogram_lines(name, help_text, [
+            ({'endpoint': endpoint}, snapshot) for endpoint, snapshot in histograms.snapshots()
+        ])
+
+    database = db_metrics.snapshot()
+    pool = database['pool']
+    lines += _gauge_lines('db_pool_size', 'Configured pool size.', 'gauge', [({}, pool['size'] or 0)])
+    lines += _gauge_lines('db_pool_checked_out', 'Connections checked out of the pool.', 'gauge',
+                          [({}, pool['checked_out'] or 0)])
+    lines += _gauge_lines('db_pool_overflow', 'Overflow connections in use.', 'gauge', [({}, pool['overflow'] or 0)])
+    lines += _gauge_lines('db_pool_checkout_timeouts_total', 'Checkouts that timed out.', 'counter',
+                          [({}, database['checkout_timeouts'])])
+    lines += _histogram_lines('db_pool_checkout_wait_seconds', 'Time to check out a connection.',
+                              [({}, database['checkout_wait'])])
+    lines += _histogram_lines('db_statement_duration_seconds', 'SQL statement latency by kind.', [
+        ({'kind': kind}, snapshot) for kind, snapshot in database['statements'].items()
+    ])
+    lines += _gauge_lines('db_slow_statements_total', 'Statements slower than DB_SLOW_QUERY_MS.', 'counter',
+                          [({}, database['slow_statements'])])
+
+    caches = cache_stats()
+    for field in ('hits', 'misses', 'evictions'):
+        lines += _gauge_lines(f'cache_{field}_total', f'Reference data cache {field}.', 'counter', [
+            ({'cache': name}, stats[field]) for name, stats in caches.items()
+        ])
+
+    compression = compression_stats()
+    for name, help_text, value in (
+        ('http_compressed_responses_total', 'Responses compressed, by encoding.',
+         lambda stats: stats['responses']),
+        ('http_compression_input_bytes_total', 'Body bytes of compressed responses before compression.',
+         lambda stats: stats['input_bytes']),
+        ('http_compression_output_bytes_total', 'Body bytes of compressed responses after compression.',
+         lambda stats: stats['output_bytes']),
+        ('http_compression_saved_bytes_total', 'Bytes saved by response compression.',
+         lambda stats: stats['input_bytes'] - stats['output_bytes']),
+    ):
+        lines += _gauge_lines(name, help_text, 'counter', [
+            ({'encoding': encoding}, value(stats)) for encoding, stats in compression.items()
+        ])
+    return '\n'.join(lines) + '\n'
+
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus metrics; needs ``Authorization: Bearer $METRICS_TOKEN`` or an admin session"""
+    header = request.headers.get('Authorization', '')
+    if METRICS_TOKEN and hmac.compare_digest(header, f'Bearer {METRICS_TOKEN}'):
+        pass
+    elif not (current_user.is_authenticated and current_user.is_admin):
+        abort(403)
+    return Response(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
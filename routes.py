@@ -1,84 +1,46 @@
-from flask import render_template, redirect, url_for, flash, request, jsonify, send_file, make_response
+from flask import (
+    render_template, redirect, url_for, flash, request, jsonify, send_file, make_response,
+    Response, stream_with_context, abort
+)
 from flask_login import login_user, logout_user, login_required, current_user
 from app import app, db
 from models import User, Company, Pallet
-from utils import calculate_component_volumes
+from utils import format_float
+from pallet_queries import (
+    EXPORT_COLUMNS, LISTING_COLUMNS, PAGE_SIZE_OPTIONS, FilterError, PalletFilters,
+    filtered_pallet_query, paginate_pallets, parse_page_size,
+    parse_pallet_filters
+)
 from werkzeug.security import generate_password_hash
+import export_jobs
+import export_cache
+import db_metrics
+from data_version import get_data_version
+from cache import user_companies
+from company_stats import company_stats, summarize_stats
+from cutting_plan import DEFAULT_KERF, DEFAULT_STOCK_LENGTHS, CuttingPlanError
+from api import plan_user_order
+from personnel import (
+    DAY_NAMES, PersonnelError, parse_week, user_employees, week_advances, weekly_attendance, weekly_payroll
+)
 import csv
 import io
-from reportlab.lib import colors
-from reportlab.lib.pagesizes import A4, landscape
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import mm
-from reportlab.pdfgen import canvas
+import os
 import logging
-from datetime import datetime
+from datetime import datetime, timedelta
 
 logger = logging.getLogger(__name__)
 
-def clean_text(text):
-    """Clean and encode text for PDF generation with Turkish character support"""
-    try:
-        if text is None:
-            return ""
-        return str(text).encode('utf-8').decode('utf-8')
-    except Exception as e:
-        logger.error(f"Error cleaning text: {str(e)}")
-        return str(text) if text is not None else ""
+# Pallets offered in the cutting plan form, by name
+CUTTING_PLAN_PALLET_OPTIONS = 1000
 
-def format_float(value, precision=2):
-    """Format float values with proper error handling"""
-    try:
-        return f"{float(value):.{precision}f}" if value is not None else "0.00"
-    except (ValueError, TypeError) as e:
-        logger.error(f"Error formatting float value {value}: {str(e)}")
-        return "0.00"
-
-class NumberedCanvas(canvas.Canvas):
-    def __init__(self, *args, **kwargs):
-        canvas.Canvas.__init__(self, *args, **kwargs)
-        self._saved_page_states = []
-
-    def showPage(self):
-        self._saved_page_states.append(dict(self.__dict__))
-        self._startPage()
-
-    def save(self):
-        """Add page numbers to each page"""
-        num_pages = len(self._saved_page_states)
-        for state in self._saved_page_states:
-            self.__dict__.update(state)
-            self.setFont("Helvetica", 9)
-            self.drawRightString(
-                270*mm, 10*mm,
-                f"Sayfa {self._pageNumber} / {num_pages}"
-            )
-            canvas.Canvas.showPage(self)
-        canvas.Canvas.save(self)
-
-def add_letterhead(canvas, doc, company=None):
-    """Add letterhead with company information to each page"""
-    try:
-        canvas.saveState()
-        
-        # Add company logo or system logo
-        canvas.setFont('Helvetica-Bold', 16)
-        canvas.drawString(30*mm, 190*mm, 'Palet Yönetim Sistemi')
-        
-        if company:
-            canvas.setFont('Helvetica', 12)
-            canvas.drawString(30*mm, 180*mm, f'Firma: {clean_text(company.name)}')
-            canvas.drawString(30*mm, 175*mm, f'İletişim: {clean_text(company.contact_email)}')
-        
-        # Add date and time
-        canvas.setFont('Helvetica', 10)
-        current_date = datetime.now().strftime('%d.%m.%Y %H:%M')
-        canvas.drawString(250*mm, 190*mm, f'Tarih: {current_date}')
-        
-        canvas.restoreState()
-    except Exception as e:
-        logger.error(f"Error adding letterhead: {str(e)}")
+# Rows fetched from the database and encoded per streamed CSV chunk
+CSV_EXPORT_BATCH_SIZE = 1000
+
+CSV_EXPORT_HEADERS = [
+    'Palet Adı', 'Firma', 'Fiyat (TL)', 'Toplam Hacim (desi)',
+    'Üst Tahta Ölçüleri', 'Alt Tahta Ölçüleri', 'Kapama Ölçüleri', 'Takoz Ölçüleri'
+]
 
 @app.route('/')
 def index():
@@ -89,74 +51,102 @@ def index():
 @app.route('/dashboard')
 @login_required
 def dashboard():
-    return render_template('dashboard.html')
+    stats = company_stats(current_user.id)
+    return render_template('dashboard.html', stats=stats, summary=summarize_stats(stats))
 
 @app.route('/companies')
 @login_required
 def companies():
-    companies = Company.query.filter_by(user_id=current_user.id).all()
-    return render_template('companies.html', companies=companies)
+    companies = user_companies(current_user.id)
+    pallet_counts = {item['company_id']: item['pallet_count'] for item in company_stats(current_user.id)}
+    return render_template('companies.html', companies=companies, pallet_counts=pallet_counts)
 
 @app.route('/pallets')
 @login_required
 def pallets():
-    companies = Company.query.filter_by(user_id=current_user.id).all()
-    pallets = Pallet.query.join(Company).filter(Company.user_id == current_user.id).all()
-    return render_template('pallets.html', pallets=pallets, companies=companies)
+    companies = user_companies(current_user.id)
+    try:
+        filters = parse_pallet_filters(request.args, current_user.id)
+    except FilterError as e:
+        flash(str(e), 'warning')
+        return redirect(url_for('pallets'))
+
+    page = paginate_pallets(
+        filtered_pallet_query(filters, current_user.id, columns=LISTING_COLUMNS),
+        sort=filters.sort,
+        after=request.args.get('after'),
+        before=request.args.get('before'),
+        page_size=parse_page_size(request.args.get('per_page'))
+    )
+    return render_template(
+        'pallets.html',
+        pallets=page.items,
+        page=page,
+        filters=filters,
+        companies=companies,
+        page_size_options=PAGE_SIZE_OPTIONS
+    )
+
+def cached_export_response(entry):
+    """Serve a cached export, or 304 if the client already has this version"""
+    # Weak comparison: compressed responses carry the ETag as a weak one
+    if request.if_none_match.contains_weak(entry['etag']):
+        response = Response(status=304)
+    else:
+        response = send_file(
+            entry['path'],
+            mimetype=entry['mimetype'],
+            as_attachment=True,
+            download_name=entry['download_name'],
+            etag=False
+        )
+    response.set_etag(entry['etag'])
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+def pdf_export_options(filters):
+    """Return the filter description and letterhead company of a PDF export"""
+    filter_text = None
+    if filters.is_filtered:
+        filter_text = 'Uygulanan Filtreler:'
+        if filters.search:
+            filter_text += f' Arama: {filters.search},'
+        if filters.company:
+            filter_text += f' Firma: {filters.company.name},'
+        if filters.min_price:
+            filter_text += f' Min Fiyat: {filters.min_price} TL,'
+        if filters.max_price:
+            filter_text += f' Max Fiyat: {filters.max_price} TL,'
+        filter_text = filter_text.rstrip(',')
+
+    company = None
+    if filters.company:
+        company = {'name': filters.company.name, 'contact_email': filters.company.contact_email}
+    return filter_text, company
 
 @app.route('/export/pallets/pdf')
 @login_required
 def export_pallets_pdf():
     try:
         # Get and validate filter parameters
-        search = request.args.get('search', '').strip()
-        company_id = request.args.get('company_id')
-        min_price = request.args.get('min_price')
-        max_price = request.args.get('max_price')
-
-        # Parameter validation with detailed error handling
         try:
-            company_id = int(company_id) if company_id else None
-            company = Company.query.get(company_id) if company_id else None
-            if company_id and not company:
-                flash('Belirtilen firma bulunamadı.', 'warning')
-                return redirect(url_for('pallets'))
-        except (ValueError, TypeError):
-            logger.warning(f"Invalid company_id parameter: {company_id}")
-            company_id = None
-            company = None
+            filters = parse_pallet_filters(request.args, current_user.id)
+        except FilterError as e:
+            flash(str(e), 'warning')
+            return redirect(url_for('pallets'))
 
-        try:
-            min_price = float(min_price) if min_price else None
-            if min_price is not None and min_price < 0:
-                flash('Minimum fiyat 0\'dan küçük olamaz.', 'warning')
-                return redirect(url_for('pallets'))
-        except (ValueError, TypeError):
-            logger.warning(f"Invalid min_price parameter: {min_price}")
-            min_price = None
+        # Serve an unchanged export from the cache (or answer 304) without rendering
+        cache_key = export_cache.cache_key(
+            current_user.id, 'pdf', filters.as_args(include_sort=False), get_data_version(current_user.id)
+        )
+        cached = export_cache.get(cache_key)
+        if cached:
+            return cached_export_response(cached)
 
-        try:
-            max_price = float(max_price) if max_price else None
-            if max_price is not None and max_price < 0:
-                flash('Maksimum fiyat 0\'dan küçük olamaz.', 'warning')
-                return redirect(url_for('pallets'))
-        except (ValueError, TypeError):
-            logger.warning(f"Invalid max_price parameter: {max_price}")
-            max_price = None
-        
         # Build query with filters
-        query = Pallet.query.join(Company).filter(Company.user_id == current_user.id)
+        query = filtered_pallet_query(filters, current_user.id, columns=EXPORT_COLUMNS)
         
-        if search:
-            query = query.filter(Pallet.name.ilike(f'%{search}%'))
-        if company_id is not None:
-            query = query.filter(Pallet.company_id == company_id)
-        if min_price is not None:
-            query = query.filter(Pallet.price >= min_price)
-        if max_price is not None:
-            query = query.filter(Pallet.price <= max_price)
-        
-        pallets = query.all()
+        pallets = [row._asdict() for row in query.all()]
         
         if not pallets:
             flash('Dışa aktarılacak palet bulunamadı.', 'warning')
@@ -164,204 +154,29 @@ def export_pallets_pdf():
 
         # Create PDF buffer
         buffer = io.BytesIO()
-        
-        # Set up the document with landscape orientation and margins
-        doc = SimpleDocTemplate(
-            buffer,
-            pagesize=landscape(A4),
-            rightMargin=20*mm,
-            leftMargin=20*mm,
-            topMargin=40*mm,
-            bottomMargin=20*mm,
-            title='Palet Listesi',
-            author='Palet Yönetim Sistemi'
-        )
-        
-        # Create styles
-        styles = getSampleStyleSheet()
-        
-        # Header style
-        header_style = ParagraphStyle(
-            'CustomHeader',
-            parent=styles['Normal'],
-            fontName='Helvetica-Bold',
-            fontSize=14,
-            leading=16,
-            alignment=1,
-            spaceAfter=20,
-            textColor=colors.HexColor('#2a2e35')
-        )
-        
-        # Title style
-        title_style = ParagraphStyle(
-            'CustomTitle',
-            parent=styles['Title'],
-            fontName='Helvetica-Bold',
-            fontSize=12,
-            leading=14,
-            alignment=1,
-            spaceAfter=10,
-            textColor=colors.HexColor('#2a2e35')
-        )
-        
-        # Normal text style
-        normal_style = ParagraphStyle(
-            'CustomNormal',
-            parent=styles['Normal'],
-            fontName='Helvetica',
-            fontSize=10,
-            leading=12,
-            alignment=1
-        )
-        
-        # Prepare document elements
-        elements = []
-        
-        # Add header with current date
-        current_date = datetime.now().strftime('%d.%m.%Y %H:%M')
-        header_text = f'Palet Listesi - {current_date}'
-        elements.append(Paragraph(clean_text(header_text), header_style))
-        elements.append(Spacer(1, 20))
-        
-        # Add filter information if any filters are applied
-        if any([search, company_id, min_price, max_price]):
-            filter_text = 'Uygulanan Filtreler:'
-            if search:
-                filter_text += f' Arama: {search},'
-            if company:
-                filter_text += f' Firma: {company.name},'
-            if min_price:
-                filter_text += f' Min Fiyat: {min_price} TL,'
-            if max_price:
-                filter_text += f' Max Fiyat: {max_price} TL,'
-            
-            elements.append(Paragraph(clean_text(filter_text.rstrip(',')), title_style))
-            elements.append(Spacer(1, 20))
-        
-        # Create table data
-        headers = [
-            'Palet Adı',
-            'Firma',
-            'Fiyat (TL)',
-            'Toplam Hacim (desi)',
-            'Ölçüler (cm)',
-            'Adet'
-        ]
-        
-        data = [[Paragraph(clean_text(header), title_style) for header in headers]]
-        
-        # Add pallet data
-        total_price = 0
-        total_volume = 0
-        invalid_records = 0
-        
-        for pallet in pallets:
-            try:
-                measurements = (
-                    f"Üst Tahta: {format_float(pallet.upper_board_length)}x{format_float(pallet.upper_board_width)}x{format_float(pallet.board_thickness)}\n"
-                    f"Alt Tahta: {format_float(pallet.lower_board_length)}x{format_float(pallet.lower_board_width)}x{format_float(pallet.board_thickness)}\n"
-                    f"Kapama: {format_float(pallet.closure_length)}x{format_float(pallet.closure_width)}x{format_float(pallet.board_thickness)}\n"
-                    f"Takoz: {format_float(pallet.block_length)}x{format_float(pallet.block_width)}x{format_float(pallet.block_height)}"
-                )
-                
-                quantities = (
-                    f"Üst: {pallet.upper_board_quantity}\n"
-                    f"Alt: {pallet.lower_board_quantity}\n"
-                    f"Kapama: {pallet.closure_quantity}\n"
-                    f"Takoz: 9"
-                )
-                
-                row = [
-                    Paragraph(clean_text(pallet.name), normal_style),
-                    Paragraph(clean_text(pallet.company.name), normal_style),
-                    Paragraph(format_float(pallet.price), normal_style),
-                    Paragraph(format_float(pallet.total_volume), normal_style),
-                    Paragraph(clean_text(measurements), normal_style),
-                    Paragraph(clean_text(quantities), normal_style)
-                ]
-                data.append(row)
-                
-                total_price += float(pallet.price) if pallet.price is not None else 0
-                total_volume += float(pallet.total_volume) if pallet.total_volume is not None else 0
-                
-            except Exception as row_error:
-                logger.error(f"Error processing pallet row {pallet.id}: {str(row_error)}")
-                invalid_records += 1
-                continue
-        
-        if invalid_records > 0:
-            logger.warning(f"{invalid_records} records were skipped due to data errors")
-        
-        # Create table with column widths
-        col_widths = [100*mm, 80*mm, 60*mm, 60*mm, 180*mm, 60*mm]
-        table = Table(data, colWidths=col_widths, repeatRows=1)
-        
-        # Apply table styling
-        table.setStyle(TableStyle([
-            # Header styling
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#2a2e35')),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 11),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            
-            # Content styling
-            ('BACKGROUND', (0, 1), (-1, -1), colors.white),
-            ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-            ('FONTSIZE', (0, 1), (-1, -1), 10),
-            ('TOPPADDING', (0, 1), (-1, -1), 6),
-            ('BOTTOMPADDING', (0, 1), (-1, -1), 6),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black),
-            
-            # Alternate row colors
-            ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f8f9fa')]),
-            
-            # Grid styling
-            ('LINEBEFORE', (0, 0), (-1, -1), 1, colors.black),
-            ('LINEAFTER', (0, 0), (-1, -1), 1, colors.black),
-            ('LINEBELOW', (0, 0), (-1, -1), 1, colors.black),
-            ('LINEABOVE', (0, 0), (-1, -1), 1, colors.black),
-        ]))
-        
-        elements.append(table)
-        elements.append(Spacer(1, 20))
-        
-        # Add summary section
-        summary_text = (
-            f"Özet:\n"
-            f"Toplam Palet Sayısı: {len(pallets)}\n"
-            f"Başarıyla İşlenen Kayıt: {len(pallets) - invalid_records}\n"
-            f"Hatalı Kayıt: {invalid_records}\n"
-            f"Toplam Fiyat: {format_float(total_price)} TL\n"
-            f"Toplam Hacim: {format_float(total_volume)} desi"
-        )
-        elements.append(Paragraph(clean_text(summary_text), title_style))
-        
-        # Build PDF with custom canvas for page numbers and header
-        doc.build(
-            elements,
-            onFirstPage=lambda canvas, doc: add_letterhead(canvas, doc, company),
-            onLaterPages=lambda canvas, doc: add_letterhead(canvas, doc, company),
-            canvasmaker=NumberedCanvas
-        )
+        filter_text, company = pdf_export_options(filters)
+        # ReportLab is only loaded once the first PDF is requested
+        from pdf_export import build_pallets_pdf
+        build_pallets_pdf(buffer, pallets, filter_text=filter_text, company=company)
         
         buffer.seek(0)
         logger.info("PDF generated successfully")
+        current_date = datetime.now().strftime('%d.%m.%Y %H:%M')
+        download_name = f'paletler_{current_date.replace(":", "_")}.pdf'
+        etag = export_cache.put(cache_key, buffer.getvalue(), 'application/pdf', download_name)
         
         # Create response with proper headers
         response = make_response(send_file(
             buffer,
             mimetype='application/pdf',
             as_attachment=True,
-            download_name=f'paletler_{current_date.replace(":", "_")}.pdf'
+            download_name=download_name
         ))
         
         # Add headers for better browser handling
-        response.headers['Content-Disposition'] = f'attachment; filename="paletler_{current_date.replace(":", "_")}.pdf"'
-        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['Content-Disposition'] = f'attachment; filename="{download_name}"'
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
         return response
         
     except Exception as e:
@@ -369,45 +184,163 @@ def export_pallets_pdf():
         flash('PDF oluşturulurken bir hata oluştu. Lütfen daha sonra tekrar deneyin.', 'danger')
         return redirect(url_for('pallets'))
 
+@app.route('/export/pallets/pdf/jobs', methods=['POST'])
+@login_required
+def submit_pdf_export_job():
+    """Queue a PDF export in the background worker pool"""
+    try:
+        try:
+            filters = parse_pallet_filters(request.values, current_user.id)
+        except FilterError as e:
+            return jsonify({'message': str(e)}), 400
+
+        query = filtered_pallet_query(filters, current_user.id, columns=EXPORT_COLUMNS)
+        pallets = [row._asdict() for row in query.all()]
+        if not pallets:
+            return jsonify({'message': 'Dışa aktarılacak palet bulunamadı.'}), 404
+
+        filter_text, company = pdf_export_options(filters)
+        current_date = datetime.now().strftime('%d.%m.%Y %H:%M')
+        job = export_jobs.submit_pdf_job(
+            current_user.id, pallets, filter_text=filter_text, company=company,
+            download_name=f'paletler_{current_date.replace(":", "_")}.pdf'
+        )
+        return jsonify(export_job_response(job)), 202
+    except Exception as e:
+        logger.error(f"PDF export job error: {str(e)}")
+        return jsonify({'message': 'PDF oluşturma işi başlatılamadı.'}), 500
+
+def export_job_response(job):
+    """Public view of an export job state"""
+    return {
+        'job_id': job['id'],
+        'status': job['status'],
+        'progress': job.get('progress', 0.0),
+        'rows': job.get('rows'),
+        'error': job.get('error'),
+        'status_url': url_for('export_job_status', job_id=job['id']),
+        'download_url': url_for('download_export_job', job_id=job['id'])
+    }
+
+def get_user_export_job(job_id):
+    """Return the export job if it belongs to the current user, otherwise None"""
+    job = export_jobs.read_job(job_id)
+    if not job or job.get('user_id') != current_user.id:
+        return None
+    return job
+
+@app.route('/export/jobs/<job_id>')
+@login_required
+def export_job_status(job_id):
+    job = get_user_export_job(job_id)
+    if not job:
+        return jsonify({'message': 'İşlem bulunamadı.'}), 404
+    return jsonify(export_job_response(job))
+
+@app.route('/export/jobs/<job_id>/download')
+@login_required
+def download_export_job(job_id):
+    job = get_user_export_job(job_id)
+    if not job:
+        return jsonify({'message': 'İşlem bulunamadı.'}), 404
+    if job['status'] != export_jobs.STATUS_DONE:
+        return jsonify({'message': 'Dosya henüz hazır değil.', 'status': job['status']}), 409
+
+    path = export_jobs.job_file_path(job_id)
+    if not os.path.exists(path):
+        return jsonify({'message': 'Dosyanın süresi doldu, lütfen tekrar oluşturun.'}), 410
+    return send_file(
+        path,
+        mimetype='application/pdf',
+        as_attachment=True,
+        download_name=job.get('download_name', 'paletler.pdf')
+    )
+
+def pallet_csv_row(pallet):
+    """Format one pallet (model instance or row) in the CSV export layout"""
+    return [
+        pallet.name,
+        pallet.company_name,
+        format_float(pallet.price),
+        format_float(pallet.total_volume),
+        f"{format_float(pallet.upper_board_length)}x{format_float(pallet.upper_board_width)}x{format_float(pallet.board_thickness)} ({pallet.upper_board_quantity} adet)",
+        f"{format_float(pallet.lower_board_length)}x{format_float(pallet.lower_board_width)}x{format_float(pallet.board_thickness)} ({pallet.lower_board_quantity} adet)",
+        f"{format_float(pallet.closure_length)}x{format_float(pallet.closure_width)}x{format_float(pallet.board_thickness)} ({pallet.closure_quantity} adet)",
+        f"{format_float(pallet.block_length)}x{format_float(pallet.block_width)}x{format_float(pallet.block_height)} (9 adet)"
+    ]
+
+def generate_pallets_csv(query, batch_size=CSV_EXPORT_BATCH_SIZE):
+    """Yield the CSV export of ``query`` in chunks of ``batch_size`` rows.
+
+    Rows are read with ``yield_per`` (a server-side cursor where the driver
+    supports it), so memory stays flat no matter how many rows are exported.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def flush():
+        data = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+        return data
+
+    writer.writerow(CSV_EXPORT_HEADERS)
+    yield flush()
+
+    count = 0
+    try:
+        for pallet in query.yield_per(batch_size):
+            writer.writerow(pallet_csv_row(pallet))
+            count += 1
+            if count % batch_size == 0:
+                yield flush()
+    except Exception as e:
+        # Headers are already sent, the only thing left to do is stop the stream
+        logger.error(f"CSV export stream error after {count} rows: {str(e)}")
+        raise
+    remainder = flush()
+    if remainder:
+        yield remainder
+    logger.info(f"CSV export streamed {count} rows")
+
+def cache_export_stream(chunks, cache_key, mimetype, download_name):
+    """Pass streamed text chunks through while storing them in the export cache"""
+    with export_cache.writer(cache_key, mimetype, download_name) as write:
+        for chunk in chunks:
+            data = chunk.encode('utf-8')
+            write(data)
+            yield data
+
 @app.route('/export/pallets/csv')
 @login_required
 def export_pallets_csv():
     try:
-        # Create string buffer for CSV data
-        output = io.StringIO()
-        writer = csv.writer(output)
-        
-        # Write headers
-        writer.writerow([
-            'Palet Adı', 'Firma', 'Fiyat (TL)', 'Toplam Hacim (desi)',
-            'Üst Tahta Ölçüleri', 'Alt Tahta Ölçüleri', 'Kapama Ölçüleri', 'Takoz Ölçüleri'
-        ])
-        
-        # Get pallets for current user
-        pallets = Pallet.query.join(Company).filter(Company.user_id == current_user.id).all()
-        
-        # Write pallet data
-        for pallet in pallets:
-            writer.writerow([
-                pallet.name,
-                pallet.company.name,
-                format_float(pallet.price),
-                format_float(pallet.total_volume),
-                f"{format_float(pallet.upper_board_length)}x{format_float(pallet.upper_board_width)}x{format_float(pallet.board_thickness)} ({pallet.upper_board_quantity} adet)",
-                f"{format_float(pallet.lower_board_length)}x{format_float(pallet.lower_board_width)}x{format_float(pallet.board_thickness)} ({pallet.lower_board_quantity} adet)",
-                f"{format_float(pallet.closure_length)}x{format_float(pallet.closure_width)}x{format_float(pallet.board_thickness)} ({pallet.closure_quantity} adet)",
-                f"{format_float(pallet.block_length)}x{format_float(pallet.block_width)}x{format_float(pallet.block_height)} (9 adet)"
-            ])
-        
-        # Prepare the response
-        output.seek(0)
+        # Same filter parameters as the PDF export
+        try:
+            filters = parse_pallet_filters(request.args, current_user.id)
+        except FilterError as e:
+            flash(str(e), 'warning')
+            return redirect(url_for('pallets'))
+
+        cache_key = export_cache.cache_key(
+            current_user.id, 'csv', filters.as_args(include_sort=False), get_data_version(current_user.id)
+        )
+        cached = export_cache.get(cache_key)
+        if cached:
+            return cached_export_response(cached)
+
+        query = filtered_pallet_query(filters, current_user.id, columns=EXPORT_COLUMNS).order_by(Pallet.id)
+
         current_date = datetime.now().strftime('%Y%m%d_%H%M')
+        download_name = f'paletler_{current_date}.csv'
+        chunks = cache_export_stream(generate_pallets_csv(query), cache_key, 'text/csv', download_name)
         return Response(
-            output,
+            stream_with_context(chunks),
             mimetype='text/csv',
             headers={
-                'Content-Disposition': f'attachment; filename=paletler_{current_date}.csv',
-                'Content-Type': 'text/csv; charset=utf-8'
+                'Content-Disposition': f'attachment; filename={download_name}',
+                'Content-Type': 'text/csv; charset=utf-8',
+                'X-Accel-Buffering': 'no'
             }
         )
         
@@ -415,3 +348,132 @@ def export_pallets_csv():
         logger.error(f"CSV export error: {str(e)}")
         flash('CSV oluşturulurken bir hata oluştu. Lütfen daha sonra tekrar deneyin.', 'danger')
         return redirect(url_for('pallets'))
+
+@app.route('/import/pallets', methods=['POST'])
+@login_required
+def import_pallets():
+    """Import a CSV catalog (export layout or flat layout) and report the result as JSON"""
+    from pallet_import import CatalogImportError, import_pallets_csv
+
+    upload = request.files.get('file')
+    if not upload or not upload.filename:
+        return jsonify({'message': 'Lütfen bir CSV dosyası seçin'}), 400
+    try:
+        result = import_pallets_csv(upload.stream, current_user.id)
+        return jsonify(result)
+    except CatalogImportError as e:
+        return jsonify({'message': str(e)}), 400
+    except UnicodeDecodeError:
+        return jsonify({'message': 'Dosya UTF-8 kodlamalı bir CSV olmalıdır'}), 400
+    except Exception as e:
+        logger.error(f"Pallet import error: {str(e)}")
+        return jsonify({'message': 'İçe aktarma sırasında bir hata oluştu'}), 500
+
+@app.route('/import/attendance', methods=['POST'])
+@login_required
+def import_attendance():
+    """Import a time clock punch log into the attendance and report the result as JSON"""
+    from attendance_import import AttendanceImportError, import_attendance_log
+
+    upload = request.files.get('file')
+    if not upload or not upload.filename:
+        return jsonify({'message': 'Lütfen bir kayıt dosyası seçin'}), 400
+    try:
+        result = import_attendance_log(upload.stream, current_user.id,
+                                       match=request.form.get('match', 'card_number'))
+        return jsonify(result)
+    except AttendanceImportError as e:
+        return jsonify({'message': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Attendance import error: {str(e)}")
+        return jsonify({'message': 'İçe aktarma sırasında bir hata oluştu'}), 500
+
+@app.route('/admin/db-metrics')
+@login_required
+def db_metrics_status():
+    """Connection pool state, checkout wait and statement latency of this worker"""
+    if not current_user.is_admin:
+        abort(403)
+    metrics = db_metrics.snapshot()
+    for histogram in [metrics['checkout_wait']] + list(metrics['statements'].values()):
+        # JSON has no infinity; name the buckets by their upper bound
+        histogram['buckets'] = {('+Inf' if bound == float('inf') else str(bound)): count
+                                for bound, count in histogram['buckets'].items()}
+    return jsonify(metrics)
+
+@app.route('/cutting-plan', methods=['GET', 'POST'])
+@login_required
+def cutting_plan():
+    """Order form and printable cutting plan"""
+    pallet_options = (
+        db.session.query(Pallet.id, Pallet.name, Company.name.label('company_name'))
+        .join(Company, Pallet.company_id == Company.id)
+        .filter(Company.user_id == current_user.id)
+        .order_by(Pallet.name, Pallet.id)
+        .limit(CUTTING_PLAN_PALLET_OPTIONS)
+        .all()
+    )
+    plan = None
+    if request.method == 'POST':
+        items = [
+            {'pallet_id': pallet_id, 'quantity': quantity}
+            for pallet_id, quantity in zip(request.form.getlist('pallet_id'), request.form.getlist('quantity'))
+            if pallet_id and quantity
+        ]
+        try:
+            plan = plan_user_order(current_user.id, items, request.form.get('stock_lengths'),
+                                   request.form.get('kerf'), request.form.get('mode'))
+        except CuttingPlanError as e:
+            flash(str(e), 'danger')
+    return render_template(
+        'cutting_plan.html',
+        pallet_options=pallet_options,
+        plan=plan,
+        form=request.form,
+        default_stock_lengths=', '.join(f'{length:g}' for length in DEFAULT_STOCK_LENGTHS),
+        default_kerf=f'{DEFAULT_KERF:g}'
+    )
+
+def selected_week():
+    """Monday of the week in the ``week`` query argument; the current week when invalid"""
+    try:
+        return parse_week(request.args.get('week'))
+    except PersonnelError as e:
+        flash(str(e), 'danger')
+        return parse_week(None)
+
+@app.route('/personnel')
+@login_required
+def personnel():
+    return render_template('personnel.html', employees=user_employees(current_user.id))
+
+@app.route('/personnel/attendance')
+@login_required
+def attendance():
+    """Weekly attendance grid with notes and the advances of the week"""
+    start = selected_week()
+    advances = week_advances(current_user.id, start)
+    names = {employee.id: employee.full_name for employee in user_employees(current_user.id)}
+    return render_template(
+        'attendance.html',
+        attendance=weekly_attendance(current_user.id, start),
+        advances=advances,
+        employee_names=names,
+        week_start=start,
+        previous_week=start - timedelta(days=7),
+        next_week=start + timedelta(days=7)
+    )
+
+@app.route('/personnel/payroll')
+@login_required
+def payroll():
+    """Printable weekly pay list"""
+    start = selected_week()
+    return render_template(
+        'payroll.html',
+        payroll=weekly_payroll(current_user.id, start),
+        day_names=DAY_NAMES,
+        week_start=start,
+        previous_week=start - timedelta(days=7),
+        next_week=start + timedelta(days=7)
+    )
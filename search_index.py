@@ -0,0 +1,486 @@
+"""In-process search index over the pallet and company names of a user.
+
+Names are folded with ``fold`` (Turkish-aware lower case without accents),
+so "IŞIK", "ışık" and "isik" all find each other. Every user gets an index
+with
+
+* a trigram index for substring search: the positions of the query's
+  trigrams are chained with NumPy, which finds exact matches without an
+  ``ILIKE '%...%'`` scan of the table or a check of every name;
+* a sorted list of the name suffixes starting at each word, searched with
+  ``bisect`` for prefix autocomplete in a few microseconds.
+
+Indexes are cached per worker and tagged with the user's data version
+(see ``data_version``). The first search after a write reads the pallets
+written since from the change log of ``similar_pallets`` and indexes only
+those in a small second index; the large one is built from one
+three-column query (about a second for 100,000 pallets) only the first
+time, when the log does not reach back far enough or when the written
+pallets outgrow ``MAX_DELTA_SHARE`` of it. Autocomplete keeps answering
+from the previous index while it is refreshed.
+
+Search conditions are id lists; lists longer than ``MAX_LITERAL_IDS`` are
+joined through a temporary table.
+"""
+from app import app, db
+from models import Company, Pallet
+from data_version import get_data_version
+from similar_pallets import PALLET_CHANGE_HISTORY, pallet_changes
+from sqlalchemy import (
+    Column, Integer, MetaData, Table, and_, delete, false, insert, literal_column, select, text, true
+)
+from bisect import bisect_left
+from collections import OrderedDict
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SEARCH_INDEX_MAX_USERS = int(os.environ.get('SEARCH_INDEX_MAX_USERS', '32'))
+# Characters of a name suffix kept in the prefix list; longer prefixes are checked on the name
+PREFIX_KEY_LENGTH = 32
+# Prefix list entries looked at per autocomplete request
+MAX_PREFIX_SCAN = 5000
+DEFAULT_SUGGESTIONS = 10
+MAX_SUGGESTIONS = 50
+# Id lists longer than this are joined through a temporary table instead of written into the statement
+MAX_LITERAL_IDS = 1000
+LOAD_CHUNK_SIZE = 1000
+# The index is rebuilt when the pallets written since its base exceed this many, or this share of the base
+MIN_DELTA_REBUILD = 5000
+MAX_DELTA_SHARE = 0.1
+
+_TURKISH_LETTERS = (
+    ('İ', 'i'), ('I', 'i'), ('ı', 'i'), ('Ş', 's'), ('ş', 's'), ('Ğ', 'g'), ('ğ', 'g'),
+    ('Ü', 'u'), ('ü', 'u'), ('Ö', 'o'), ('ö', 'o'), ('Ç', 'c'), ('ç', 'c'),
+)
+_COMBINING_MARKS = re.compile('[\u0300-\u036f]')
+_NAME_SEPARATOR = re.compile(' \x00 ?|\x00 ')
+# Code points of ASCII characters that do not belong to a word; all others do
+_SEPARATORS = np.array([ord(c) for c in ' \x00!"#$%&\'()*+,-./:;<=>?@[\\]^`{|}~'], dtype=np.uint64)
+
+
+def fold(text):
+    """Normalize a name or query for matching.
+
+    Turkish letters are mapped before lower casing, because ``str.lower``
+    turns "I" into "i" and "İ" into "i" plus a combining dot. Other accents
+    are dropped and runs of whitespace become one space.
+    """
+    text = text or ''
+    if not text.isascii():
+        text = unicodedata.normalize('NFC', text)
+        for letter, replacement in _TURKISH_LETTERS:
+            text = text.replace(letter, replacement)
+    text = text.casefold()
+    if not text.isascii():
+        text = _COMBINING_MARKS.sub('', unicodedata.normalize('NFKD', text))
+    return ' '.join(text.split())
+
+
+def fold_names(names):
+    """``fold`` every name; folds one joined string, which is much faster than name by name"""
+    if not names:
+        return []
+    folded = _NAME_SEPARATOR.sub('\x00', fold('\x00'.join(names))).split('\x00')
+    if len(folded) != len(names):
+        # A name contained the separator itself
+        return [fold(name) for name in names]
+    return folded
+
+
+def _trigram_codes(codes):
+    """Trigram keys of an array of code points; 0 (the separator) never starts a valid key"""
+    return (codes[:-2] << np.uint64(42)) | (codes[1:-1] << np.uint64(21)) | codes[2:]
+
+
+class NameIndex:
+    """Substring and prefix search over one list of names"""
+
+    def __init__(self, ids, names):
+        self.ids = np.array(ids, dtype=np.int64)
+        self.names = list(names)
+        self.folded = fold_names(self.names)
+        # All folded names in one code point array, separated by 0
+        text = '\x00'.join(self.folded) + '\x00'
+        codes = np.frombuffer(text.encode('utf-32-le'), dtype=np.uint32)
+        lengths = np.array([len(name) + 1 for name in self.folded], dtype=np.int64)
+        owners = np.repeat(np.arange(len(self.folded), dtype=np.int32), lengths)
+        name_starts = np.concatenate(([0], np.cumsum(lengths)[:-1])).astype(np.int64)
+        self._codes = codes
+        self._owners = owners
+        self._build_trigrams(codes.astype(np.uint64))
+        self._build_prefixes(text, codes, owners, name_starts)
+
+    def __len__(self):
+        return len(self.names)
+
+    def _build_trigrams(self, codes):
+        # Every trigram is stored with the positions it occurs at, so a query
+        # is matched exactly by chaining the positions of its trigrams
+        if len(codes) < 3:
+            self._grams = np.zeros(0, dtype=np.uint64)
+            self._positions = np.zeros(0, dtype=np.int64)
+            return
+        valid = (codes[:-2] != 0) & (codes[1:-1] != 0) & (codes[2:] != 0)
+        positions = np.flatnonzero(valid)
+        grams = _trigram_codes(codes)[valid]
+        # A stable sort keeps the positions of every trigram in ascending order
+        order = np.argsort(grams, kind='stable')
+        self._grams = grams[order]
+        self._positions = positions[order]
+
+    def _build_prefixes(self, text, codes, owners, name_starts):
+        # A word starts where a word character follows a separator
+        is_word = ~np.isin(codes, _SEPARATORS)
+        word_start = is_word.copy()
+        word_start[1:] &= ~is_word[:-1]
+        positions = np.flatnonzero(word_start)
+        keys = [text[position:position + PREFIX_KEY_LENGTH] for position in positions.tolist()]
+        order = sorted(range(len(keys)), key=keys.__getitem__)
+        key_owners = owners[positions]
+        self._prefix_keys = [keys[i] for i in order]
+        self._prefix_owners = key_owners[order].tolist()
+        self._prefix_starts = (positions - name_starts[key_owners])[order].tolist()
+
+    def _occurrences(self, gram):
+        start = np.searchsorted(self._grams, gram, side='left')
+        end = np.searchsorted(self._grams, gram, side='right')
+        return self._positions[start:end]
+
+    def search(self, text):
+        """Positions of the names containing ``text`` (folded), in index order"""
+        query = fold(text)
+        if not query:
+            return np.arange(len(self.names))
+        codes = np.frombuffer(query.encode('utf-32-le'), dtype=np.uint32)
+        if len(codes) > len(self._codes):
+            return np.zeros(0, dtype=np.int64)
+
+        if len(codes) < 3:
+            # One or two characters: compare the code point array directly
+            count = len(self._codes) - len(codes) + 1
+            found = self._codes[:count] == codes[0]
+            if len(codes) == 2:
+                found &= self._codes[1:count + 1] == codes[1]
+            starts = np.flatnonzero(found)
+        else:
+            postings = [self._occurrences(gram) for gram in _trigram_codes(codes.astype(np.uint64))]
+            # Start from the rarest trigram and keep the places where every
+            # other trigram follows at its offset
+            anchor = min(range(len(postings)), key=lambda offset: len(postings[offset]))
+            starts = postings[anchor] - anchor
+            for offset, posting in enumerate(postings):
+                if offset == anchor or not len(starts):
+                    continue
+                expected = starts + offset
+                found = np.searchsorted(posting, expected)
+                found[found == len(posting)] = 0
+                starts = starts[posting[found] == expected]
+        # Starts are ascending, so the names holding them are too
+        owners = self._owners[starts].astype(np.int64)
+        if len(owners):
+            owners = owners[np.concatenate(([True], owners[1:] != owners[:-1]))]
+        return owners
+
+    def complete_entries(self, text, limit=DEFAULT_SUGGESTIONS, alive=None):
+        """``(group, key, folded name, position)`` of up to ``limit`` names with a word starting with ``text``.
+
+        ``group`` is 0 for names starting with the prefix and 1 for names
+        where a later word matches, ``key`` is the name from the matching
+        word on; entries are ordered by both. Duplicate names are returned
+        once and positions whose ``alive`` entry is false are skipped.
+        """
+        query = fold(text)
+        if not query or limit <= 0:
+            return []
+        key = query[:PREFIX_KEY_LENGTH]
+        start = bisect_left(self._prefix_keys, key)
+        end = min(start + MAX_PREFIX_SCAN, len(self._prefix_keys))
+        leading, inner = [], []
+        seen = set()
+        for position in range(start, end):
+            if not self._prefix_keys[position].startswith(key):
+                break
+            index = self._prefix_owners[position]
+            if alive is not None and not alive[index]:
+                continue
+            name_start = self._prefix_starts[position]
+            folded = self.folded[index]
+            if len(query) > PREFIX_KEY_LENGTH and not folded.startswith(query, name_start):
+                continue
+            if folded in seen:
+                continue
+            group = leading if name_start == 0 else inner
+            if len(group) < limit:
+                seen.add(folded)
+                group.append((0 if name_start == 0 else 1, self._prefix_keys[position], folded, index))
+            if len(leading) >= limit:
+                break
+        return (leading + inner)[:limit]
+
+    def complete(self, text, limit=DEFAULT_SUGGESTIONS):
+        """Positions of up to ``limit`` names with a word starting with ``text``.
+
+        Names starting with the prefix come first, then names where a later
+        word matches; both groups are in alphabetical order. Duplicate names
+        are returned once.
+        """
+        return [index for _, _, _, index in self.complete_entries(text, limit)]
+
+
+_MATCH_TABLE = Table('search_match', MetaData(), Column('id', Integer, primary_key=True))
+
+
+def _id_list_condition(ids, negate):
+    """``pallet.id [NOT] IN (...)`` for an array of ids.
+
+    Up to ``MAX_LITERAL_IDS`` ids are written into the statement: bind
+    parameters would hit the database's limit on large lists, and
+    SQLAlchemy's literal rendering costs about as much as running the query.
+    The values are NumPy integers, so formatting them directly is safe.
+    Longer lists are written to the temporary ``search_match`` table of the
+    session's connection and the condition selects from it, so only one
+    such condition per connection can be in use at a time.
+    """
+    if not len(ids):
+        return true() if negate else false()
+    if len(ids) <= MAX_LITERAL_IDS:
+        values = literal_column('(' + ','.join(map(str, ids.tolist())) + ')')
+        return Pallet.id.op('NOT IN' if negate else 'IN')(values)
+    connection = db.session.connection()
+    connection.execute(text('CREATE TEMPORARY TABLE IF NOT EXISTS search_match (id INTEGER PRIMARY KEY)'))
+    connection.execute(delete(_MATCH_TABLE))
+    connection.execute(insert(_MATCH_TABLE), [{'id': pallet_id} for pallet_id in ids.tolist()])
+    matches = select(_MATCH_TABLE.c.id)
+    return Pallet.id.not_in(matches) if negate else Pallet.id.in_(matches)
+
+
+class SearchIndex:
+    """Pallet and company name indexes of one user at one data version.
+
+    The pallet names are a large ``base`` index, built once, and a small
+    ``delta`` index of the pallets written since. Refreshing marks the
+    written pallets dead in the base and rebuilds only the delta.
+    """
+
+    def __init__(self, version, company_rows, pallet_rows=(), previous=None, delta_rows=None, stale_ids=(),
+                 dropped_companies=()):
+        self.version = version
+        self.companies = NameIndex([row.id for row in company_rows], [row.name for row in company_rows])
+        self.company_ids = set(self.companies.ids.tolist())
+        self.company_names = dict(zip(self.companies.ids.tolist(), self.companies.names))
+        if previous is None:
+            self.base = NameIndex([row.id for row in pallet_rows], [row.name for row in pallet_rows])
+            self.base_companies = np.array([row.company_id for row in pallet_rows], dtype=np.int64)
+            self.base_alive = np.ones(len(self.base), dtype=bool)
+            self.delta_rows = {}
+        else:
+            self.base = previous.base
+            self.base_companies = previous.base_companies
+            self.base_alive = previous.base_alive & ~np.isin(self.base.ids, list(stale_ids)) & \
+                ~np.isin(self.base_companies, list(dropped_companies))
+            self.delta_rows = delta_rows
+        rows = [self.delta_rows[pallet_id] for pallet_id in sorted(self.delta_rows)]
+        self.delta = NameIndex([row.id for row in rows], [row.name for row in rows])
+        self.delta_companies = np.array([row.company_id for row in rows], dtype=np.int64)
+        # Pallets created after the version have larger ids and are never matched
+        self.max_id = max(self.base.ids[self.base_alive].max(initial=0), self.delta.ids.max(initial=0))
+
+    def __len__(self):
+        return int(self.base_alive.sum()) + len(self.delta)
+
+    def _segments(self):
+        return ((self.base, self.base_companies, self.base_alive),
+                (self.delta, self.delta_companies, None))
+
+    def _pallet_matches(self, text, company_id):
+        """``(ids whose name matches, ids in scope that do not match)``, ascending"""
+        matched, unmatched = [], []
+        for names, companies, alive in self._segments():
+            found = np.zeros(len(names), dtype=bool)
+            found[names.search(text)] = True
+            scope = np.ones(len(names), dtype=bool) if alive is None else alive.copy()
+            if company_id is not None:
+                scope &= companies == company_id
+            matched.append(names.ids[found & scope])
+            unmatched.append(names.ids[scope & ~found])
+        return np.sort(np.concatenate(matched)), np.sort(np.concatenate(unmatched))
+
+    def pallet_ids(self, text, company_id=None):
+        """Ids of the pallets whose name contains ``text``"""
+        matched, _ = self._pallet_matches(text, company_id)
+        return matched
+
+    def pallet_filter(self, text, company_id=None):
+        """SQL condition selecting the pallets whose name contains ``text``.
+
+        When most pallets match, the shorter list of those that do not is
+        used instead, limited to the ids the index knows of.
+        """
+        matched, unmatched = self._pallet_matches(text, company_id)
+        if len(matched) <= len(unmatched):
+            return _id_list_condition(matched, negate=False)
+        return and_(Pallet.id <= int(self.max_id), _id_list_condition(unmatched, negate=True))
+
+    def suggestions(self, text, limit=DEFAULT_SUGGESTIONS):
+        """Autocomplete entries for the pallet and company names starting with ``text``"""
+        entries = []
+        for names, companies, alive in self._segments():
+            entries.extend((group, key, folded, names, companies, index)
+                           for group, key, folded, index in names.complete_entries(text, limit, alive))
+        entries.sort(key=lambda entry: entry[:2])
+        pallets = []
+        seen = set()
+        for _, _, folded, names, companies, i in entries:
+            if folded in seen or len(pallets) >= limit:
+                continue
+            seen.add(folded)
+            pallets.append({
+                'id': int(names.ids[i]),
+                'name': names.names[i],
+                'company_id': int(companies[i]),
+                'company_name': self.company_names.get(int(companies[i])),
+            })
+        companies = [
+            {'id': int(self.companies.ids[i]), 'name': self.companies.names[i]}
+            for i in self.companies.complete(text, limit)
+        ]
+        return {'pallets': pallets, 'companies': companies}
+
+
+_indexes = OrderedDict()
+_build_locks = {}
+_lock = threading.Lock()
+
+
+def _company_rows(user_id):
+    return db.session.execute(
+        select(Company.id, Company.name).where(Company.user_id == user_id).order_by(Company.id)
+    ).all()
+
+
+def _pallet_rows(user_id, condition):
+    return db.session.execute(
+        select(Pallet.id, Pallet.name, Pallet.company_id)
+        .join(Company, Pallet.company_id == Company.id)
+        .where(Company.user_id == user_id, condition)
+        .order_by(Pallet.id)
+    ).all()
+
+
+def _load_index(user_id, version):
+    started = time.perf_counter()
+    company_rows = _company_rows(user_id)
+    pallet_rows = _pallet_rows(user_id, true()) if company_rows else []
+    index = SearchIndex(version, company_rows, pallet_rows)
+    logger.info(f"Built search index for user {user_id} ({len(pallet_rows)} pallets, "
+                f"{len(company_rows)} companies) in {time.perf_counter() - started:.3f} s")
+    return index
+
+
+def _refresh_index(index, user_id, version):
+    """A new index with the pallets written since ``index`` was built; None when a rebuild is cheaper"""
+    started = time.perf_counter()
+    company_rows = _company_rows(user_id)
+    company_ids = {row.id for row in company_rows}
+    pallet_ids, logged_companies = pallet_changes(user_id, index.version, version)
+    reload_companies = ((company_ids - index.company_ids) | logged_companies) & company_ids
+    dropped_companies = (index.company_ids - company_ids) | reload_companies
+    delta_rows = {pallet_id: row for pallet_id, row in index.delta_rows.items()
+                  if pallet_id not in pallet_ids and row.company_id not in dropped_companies}
+    conditions = [Pallet.company_id.in_(sorted(reload_companies))] if reload_companies else []
+    ids = sorted(pallet_ids)
+    conditions += [Pallet.id.in_(ids[start:start + LOAD_CHUNK_SIZE]) for start in range(0, len(ids), LOAD_CHUNK_SIZE)]
+    for condition in conditions:
+        # Deleted pallets and pallets moved to another user are not found and stay out
+        delta_rows.update((row.id, row) for row in _pallet_rows(user_id, condition))
+    if len(delta_rows) > max(MIN_DELTA_REBUILD, len(index.base) * MAX_DELTA_SHARE):
+        return None
+    refreshed = SearchIndex(version, company_rows, previous=index, delta_rows=delta_rows, stale_ids=pallet_ids,
+                            dropped_companies=dropped_companies)
+    logger.debug(f"Refreshed search index for user {user_id}: {len(pallet_ids)} pallets, "
+                 f"{len(reload_companies)} companies reloaded in {time.perf_counter() - started:.3f} s")
+    return refreshed
+
+
+def _store_index(user_id, version):
+    """Refresh or build and cache the index of a user unless a current one appeared meanwhile"""
+    with _lock:
+        index = _indexes.get(user_id)
+    if index is not None and index.version >= version:
+        return index
+    refreshed = None
+    if index is not None and version - index.version <= PALLET_CHANGE_HISTORY:
+        refreshed = _refresh_index(index, user_id, version)
+    index = refreshed or _load_index(user_id, version)
+    with _lock:
+        _indexes[user_id] = index
+        _indexes.move_to_end(user_id)
+        while len(_indexes) > SEARCH_INDEX_MAX_USERS:
+            evicted, _ = _indexes.popitem(last=False)
+            _build_locks.pop(evicted, None)
+    return index
+
+
+def _rebuild_in_background(user_id, version, build_lock):
+    try:
+        with app.app_context():
+            _store_index(user_id, version)
+    except Exception as e:
+        logger.error(f"Error rebuilding search index for user {user_id}: {str(e)}")
+    finally:
+        build_lock.release()
+
+
+def get_search_index(user_id, allow_stale=False):
+    """Return the search index of a user, rebuilding it if the user's data changed.
+
+    With ``allow_stale`` an outdated index is returned at once and rebuilt in
+    a background thread; autocomplete uses this so that typing right after
+    an edit does not wait for the rebuild.
+    """
+    # The version is read before loading, so a write committed while loading
+    # leaves the index with an outdated version and it is rebuilt next time
+    version = get_data_version(user_id)
+    with _lock:
+        index = _indexes.get(user_id)
+        if index is not None and index.version == version:
+            _indexes.move_to_end(user_id)
+            return index
+        build_lock = _build_locks.setdefault(user_id, threading.Lock())
+
+    if allow_stale and index is not None:
+        if build_lock.acquire(blocking=False):
+            threading.Thread(target=_rebuild_in_background, args=(user_id, version, build_lock),
+                             daemon=True).start()
+        return index
+    # One build per user at a time; concurrent requests wait for it
+    with build_lock:
+        return _store_index(user_id, version)
+
+
+def search_pallet_ids(user_id, text, company_id=None):
+    """Ids of the user's pallets whose name contains ``text`` (Turkish-aware, case-insensitive)"""
+    return get_search_index(user_id).pallet_ids(text, company_id).tolist()
+
+
+def pallet_search_filter(user_id, text, company_id=None):
+    """SQL condition for the user's pallets whose name contains ``text``"""
+    return get_search_index(user_id).pallet_filter(text, company_id)
+
+
+def autocomplete(user_id, text, limit=DEFAULT_SUGGESTIONS):
+    """Pallet and company name suggestions for a prefix"""
+    return get_search_index(user_id, allow_stale=True).suggestions(text, limit)
+
+
+def clear_search_indexes():
+    with _lock:
+        _indexes.clear()
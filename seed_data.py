@@ -1,6 +1,7 @@
 from app import app, db
 from models import Company, Pallet, User
-from utils import calculate_component_volumes
+from sqlalchemy import select
+from pallet_specs import assign_specs, pallet_rows
 import logging
 
 logger = logging.getLogger(__name__)
@@ -33,11 +34,14 @@ def seed_data():
             
             admin = User.query.filter_by(username='admin').first()
             if admin:
+                # One query for all existing names instead of one per company
+                existing_names = set(db.session.scalars(
+                    select(Company.name).where(Company.name.in_([company.name for company in companies]))
+                ))
                 for company in companies:
                     try:
                         company.user_id = admin.id
-                        existing = Company.query.filter_by(name=company.name).first()
-                        if not existing:
+                        if company.name not in existing_names:
                             db.session.add(company)
                     except Exception as e:
                         logger.error(f'Firma eklenirken hata oluştu {company.name}: {str(e)}')
@@ -91,21 +95,15 @@ def seed_data():
 
                 first_company = Company.query.first()
                 if first_company:
-                    # Add pallets with error handling
                     for pallet_data in pallets:
-                        try:
-                            pallet_data['company_id'] = first_company.id
-                            pallet = Pallet(**pallet_data)
-                            volumes = calculate_component_volumes(pallet)
-                            pallet.upper_board_desi = volumes['upper_board_desi']
-                            pallet.lower_board_desi = volumes['lower_board_desi']
-                            pallet.closure_desi = volumes['closure_desi']
-                            pallet.block_desi = volumes['block_desi']
-                            pallet.total_volume = volumes['total_desi']
-                            db.session.add(pallet)
-                        except Exception as e:
-                            logger.error(f'Palet eklenirken hata oluştu {pallet_data["name"]}: {str(e)}')
+                        pallet_data['company_id'] = first_company.id
+                    # The shared spec of every pallet holds its dimensions and desi
+                    assign_specs(pallets)
+                    for pallet_data in pallets:
+                        if pallet_data['spec_id'] is None:
+                            logger.error(f'Palet eklenirken hata oluştu {pallet_data["name"]}: Geçersiz ölçü değerleri')
                             continue
+                        db.session.add(Pallet(**pallet_rows([pallet_data])[0]))
 
                     try:
                         db.session.commit()
@@ -120,4 +118,7 @@ def seed_data():
             db.session.rollback()
 
 if __name__ == '__main__':
+    # Same as "flask --app main init-db" followed by "flask --app main seed"
+    with app.app_context():
+        db.create_all()
     seed_data()
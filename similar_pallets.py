@@ -0,0 +1,307 @@
+"""Nearest-neighbour search for pallets with nearly the same dimensions.
+
+Every pallet is a vector of its 13 dimension and quantity columns. Each
+worker keeps the vectors of a user's pallets in one float32 NumPy matrix and
+answers a query with a vectorized scan. The difference in every column is
+divided by the requested value (at least 1), so it counts relative to the
+requested size: 2 cm off a 20 cm board is 0.1, 2 cm off a 100 cm board is
+0.02. The score is the root mean square of these 13 relative differences;
+0 means identical. A scan of one million pallets takes about 20 ms.
+
+Indexes are kept up to date incrementally (``search_index`` reads the same
+log for the pallet names). Every write logs the changed pallets (or, for bulk inserts, their companies) in ``PalletChange`` with the
+owner's new data version; an index that is behind reads the log entries
+after its version and reloads only those rows. Companies that were added
+or removed are compared on every query. An index more than
+``PALLET_CHANGE_HISTORY`` versions behind is rebuilt.
+"""
+from app import db
+from models import Company, Pallet, PalletChange, PalletSpec, UserDataVersion
+from data_version import get_data_version
+from cache import user_companies
+from utils import DIMENSION_FIELDS
+from sqlalchemy import Float, delete, event, insert, inspect, select, type_coerce
+from sqlalchemy.orm import Session
+from collections import OrderedDict
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SIMILAR_INDEX_MAX_USERS = int(os.environ.get('SIMILAR_INDEX_MAX_USERS', '8'))
+# Versions of change log kept per user; older indexes are rebuilt from scratch
+PALLET_CHANGE_HISTORY = 1000
+# The log of a user is pruned when its version is a multiple of this
+PRUNE_EVERY = 100
+DEFAULT_NEIGHBOURS = 5
+MAX_NEIGHBOURS = 50
+LOAD_CHUNK_SIZE = 1000
+BUILD_CHUNK_SIZE = 50000
+
+_VECTOR_COLUMNS = [type_coerce(getattr(PalletSpec, field), Float) for field in DIMENSION_FIELDS]
+
+
+class SimilarityIndex:
+    """Dimension vectors of one user's pallets, updated in place"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset(None, ())
+
+    def reset(self, version, company_ids):
+        self.version = version
+        self.company_ids = set(company_ids)
+        self.size = 0
+        # One row per dimension: the scan walks each column contiguously
+        self.vectors = np.zeros((len(DIMENSION_FIELDS), 0), dtype=np.float32)
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.companies = np.zeros(0, dtype=np.int64)
+        self.alive = np.zeros(0, dtype=bool)
+        self.positions = {}
+
+    def __len__(self):
+        return len(self.positions)
+
+    def _reserve(self, count):
+        needed = self.size + count
+        if needed <= len(self.ids):
+            return
+        capacity = max(needed, 2 * len(self.ids), 1024)
+        vectors = np.zeros((len(DIMENSION_FIELDS), capacity), dtype=np.float32)
+        vectors[:, :self.size] = self.vectors[:, :self.size]
+        self.vectors = vectors
+        for name, dtype in (('ids', np.int64), ('companies', np.int64), ('alive', bool)):
+            grown = np.zeros(capacity, dtype=dtype)
+            grown[:self.size] = getattr(self, name)[:self.size]
+            setattr(self, name, grown)
+
+    def upsert(self, rows):
+        """Add or overwrite rows of (id, company_id, *dimensions)"""
+        if not rows:
+            return
+        columns = list(zip(*rows))
+        ids = np.array(columns[0], dtype=np.int64)
+        companies = np.array(columns[1], dtype=np.int64)
+        # NULL dimensions become NaN and never match
+        vectors = np.array(columns[2:], dtype=np.float32)
+        if self.positions:
+            positions = np.array([self.positions.get(pallet_id, -1) for pallet_id in columns[0]], dtype=np.int64)
+        else:
+            positions = np.full(len(ids), -1, dtype=np.int64)
+        new = positions < 0
+        count = int(new.sum())
+        self._reserve(count)
+        positions[new] = np.arange(self.size, self.size + count)
+        self.positions.update(zip(ids[new].tolist(), positions[new].tolist()))
+        self.size += count
+        self.ids[positions] = ids
+        self.alive[positions] = True
+        self.companies[positions] = companies
+        self.vectors[:, positions] = vectors
+
+    def remove(self, pallet_ids):
+        for pallet_id in pallet_ids:
+            position = self.positions.pop(pallet_id, None)
+            if position is not None:
+                self.alive[position] = False
+
+    def remove_companies(self, company_ids):
+        if not company_ids:
+            return
+        dropped = self.alive[:self.size] & np.isin(self.companies[:self.size], list(company_ids))
+        self.remove(self.ids[:self.size][dropped].tolist())
+
+    def nearest(self, vector, k=DEFAULT_NEIGHBOURS, company_id=None, exclude_id=None):
+        """``(ids, scores)`` of the ``k`` pallets closest to ``vector``, closest first"""
+        query = np.asarray(vector, dtype=np.float32)
+        weights = 1 / np.maximum(np.abs(query), 1)
+        scores = np.zeros(self.size, dtype=np.float32)
+        diff = np.empty(self.size, dtype=np.float32)
+        for column, value, weight in zip(self.vectors[:, :self.size], query, weights):
+            np.subtract(column, value, out=diff)
+            diff *= weight
+            diff *= diff
+            scores += diff
+        valid = self.alive[:self.size].copy()
+        if company_id is not None:
+            valid &= self.companies[:self.size] == company_id
+        if exclude_id is not None and exclude_id in self.positions:
+            valid[self.positions[exclude_id]] = False
+        scores[~valid] = np.inf
+        k = min(k, int(valid.sum()))
+        if k <= 0:
+            return [], []
+        closest = np.argpartition(scores, k - 1)[:k]
+        closest = closest[np.argsort(scores[closest], kind='stable')]
+        rms = np.sqrt(scores[closest] / len(DIMENSION_FIELDS))
+        return self.ids[closest].tolist(), rms.tolist()
+
+
+def _pallet_chunks(condition):
+    """Rows of (id, company_id, *dimensions) matching ``condition``, in id order and chunks"""
+    connection = db.session.connection()
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            select(Pallet.id, Pallet.company_id, *_VECTOR_COLUMNS)
+            .join(PalletSpec, Pallet.spec_id == PalletSpec.id)
+            .where(condition, Pallet.id > last_id)
+            .order_by(Pallet.id)
+            .limit(BUILD_CHUNK_SIZE)
+        ).all()
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1][0]
+
+
+def _build_index(index, user_id, version, company_ids):
+    """Load all pallets of the user; the caller holds ``index.lock``"""
+    started = time.perf_counter()
+    index.reset(version, company_ids)
+    if company_ids:
+        for rows in _pallet_chunks(Pallet.company_id.in_(list(company_ids))):
+            index.upsert(rows)
+    logger.info(f"Built similarity index for user {user_id} ({len(index)} pallets) "
+                f"in {time.perf_counter() - started:.3f} s")
+
+
+def pallet_changes(user_id, since, version):
+    """``(pallet ids, company ids)`` logged for the user after data version ``since`` up to ``version``.
+
+    Only complete while ``version - since`` is at most ``PALLET_CHANGE_HISTORY``.
+    """
+    changes = db.session.execute(
+        select(PalletChange.pallet_id, PalletChange.company_id)
+        .where(PalletChange.user_id == user_id,
+               PalletChange.version > since,
+               PalletChange.version <= version)
+    ).all()
+    pallet_ids = {change.pallet_id for change in changes if change.pallet_id is not None}
+    company_ids = {change.company_id for change in changes if change.pallet_id is None}
+    return pallet_ids, company_ids
+
+
+def _refresh_index(index, user_id, version, company_ids):
+    """Apply the changes since the index's version; the caller holds ``index.lock``"""
+    pallet_ids, logged_companies = pallet_changes(user_id, index.version, version)
+    reload_companies = ((company_ids - index.company_ids) | logged_companies) & company_ids
+    pallet_ids = sorted(pallet_ids)
+
+    index.remove_companies((index.company_ids - company_ids) | reload_companies)
+    if reload_companies:
+        for rows in _pallet_chunks(Pallet.company_id.in_(list(reload_companies))):
+            index.upsert(rows)
+    for start in range(0, len(pallet_ids), LOAD_CHUNK_SIZE):
+        chunk = pallet_ids[start:start + LOAD_CHUNK_SIZE]
+        rows = [row for rows in _pallet_chunks(Pallet.id.in_(chunk)) for row in rows if row[1] in company_ids]
+        index.upsert(rows)
+        # Deleted, or moved to a company of another user
+        index.remove(set(chunk) - {row[0] for row in rows})
+    index.version = version
+    index.company_ids = set(company_ids)
+    logger.debug(f"Refreshed similarity index for user {user_id}: {len(pallet_ids)} pallets, "
+                 f"{len(reload_companies)} companies reloaded")
+
+
+_indexes = OrderedDict()
+_lock = threading.Lock()
+
+
+def find_similar(user_id, vector, k=DEFAULT_NEIGHBOURS, company_id=None, exclude_id=None):
+    """``(ids, scores)`` of the user's pallets closest to a dimension vector.
+
+    The index of the user is built on first use and brought up to date with
+    the change log before the scan.
+    """
+    # Read the version first: changes committed meanwhile are applied next time
+    version = get_data_version(user_id)
+    company_ids = {company.id for company in user_companies(user_id)}
+    with _lock:
+        index = _indexes.get(user_id)
+        if index is None:
+            index = _indexes[user_id] = SimilarityIndex()
+        _indexes.move_to_end(user_id)
+        while len(_indexes) > SIMILAR_INDEX_MAX_USERS:
+            _indexes.popitem(last=False)
+
+    with index.lock:
+        # Rebuild when too far behind the log or when most rows are deleted ones
+        if index.version is None or version - index.version > PALLET_CHANGE_HISTORY or \
+                index.size > 2 * len(index) + LOAD_CHUNK_SIZE:
+            _build_index(index, user_id, version, company_ids)
+        elif index.version < version or index.company_ids != company_ids:
+            _refresh_index(index, user_id, version, company_ids)
+        return index.nearest(vector, k, company_id, exclude_id)
+
+
+def log_pallet_changes(user_id, pallet_ids=(), company_ids=(), connection=None):
+    """Record written pallets at the user's current data version.
+
+    Call after ``bump_data_version`` in the same transaction. Pass
+    ``company_ids`` for bulk inserts whose pallet ids are not known.
+    """
+    rows = [{'pallet_id': pallet_id, 'company_id': None} for pallet_id in sorted(set(pallet_ids))]
+    rows += [{'pallet_id': None, 'company_id': company_id} for company_id in sorted(set(company_ids))]
+    if not rows:
+        return
+    connection = connection or db.session.connection()
+    version = connection.execute(
+        select(UserDataVersion.version).where(UserDataVersion.user_id == user_id)
+    ).scalar() or 0
+    for row in rows:
+        row.update(user_id=user_id, version=version)
+    connection.execute(insert(PalletChange), rows)
+    if version % PRUNE_EVERY == 0:
+        connection.execute(
+            delete(PalletChange)
+            .where(PalletChange.user_id == user_id, PalletChange.version <= version - PALLET_CHANGE_HISTORY)
+        )
+
+
+@event.listens_for(Session, 'after_flush')
+def _log_changes_after_flush(session, flush_context):
+    """Log pallets whose spec (dimensions), name or company were flushed.
+
+    Registered after the data version hook, so the owners' versions are
+    already bumped when this runs.
+    """
+    pallet_companies = {}
+    for instance in list(session.new) + list(session.dirty) + list(session.deleted):
+        if not isinstance(instance, Pallet):
+            continue
+        state = inspect(instance)
+        if instance in session.dirty and not any(
+            state.attrs[field].history.has_changes() for field in ('spec_id', 'name', 'company_id')
+        ):
+            continue
+        companies = {instance.company_id}
+        companies.update(state.attrs.company_id.history.deleted or ())
+        pallet_companies[instance.id] = companies
+    if not pallet_companies:
+        return
+    try:
+        connection = session.connection()
+        company_ids = set().union(*pallet_companies.values()) - {None}
+        owners = dict(connection.execute(
+            select(Company.id, Company.user_id).where(Company.id.in_(company_ids))
+        ).all())
+        by_user = {}
+        for pallet_id, companies in pallet_companies.items():
+            # Companies deleted in the same flush are noticed by the indexes themselves
+            for user_id in {owners[company_id] for company_id in companies if company_id in owners}:
+                by_user.setdefault(user_id, set()).add(pallet_id)
+        for user_id, pallet_ids in by_user.items():
+            log_pallet_changes(user_id, pallet_ids, connection=connection)
+    except Exception as e:
+        logger.error(f"Error logging pallet changes: {str(e)}")
+        raise
+
+
+def clear_similarity_indexes():
+    with _lock:
+        _indexes.clear()
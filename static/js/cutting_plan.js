@@ -0,0 +1,37 @@
+document.addEventListener('DOMContentLoaded', function() {
+    const rows = document.getElementById('orderRows');
+    const addButton = document.getElementById('addOrderRow');
+    const printButton = document.getElementById('printPlan');
+
+    if (addButton) {
+        addButton.addEventListener('click', function() {
+            const template = rows.querySelector('.order-row');
+            const row = template.cloneNode(true);
+            row.querySelector('select').value = '';
+            row.querySelector('input').value = '';
+            rows.appendChild(row);
+        });
+    }
+
+    if (rows) {
+        rows.addEventListener('click', function(e) {
+            const button = e.target.closest('.remove-row');
+            if (!button) {
+                return;
+            }
+            const row = button.closest('.order-row');
+            if (rows.querySelectorAll('.order-row').length > 1) {
+                row.remove();
+            } else {
+                row.querySelector('select').value = '';
+                row.querySelector('input').value = '';
+            }
+        });
+    }
+
+    if (printButton) {
+        printButton.addEventListener('click', function() {
+            window.print();
+        });
+    }
+});
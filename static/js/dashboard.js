@@ -1,9 +1,10 @@
 document.addEventListener('DOMContentLoaded', function() {
-    const img = new Image();
-    img.onload = function() {
-        // Image loaded successfully, use it
-    };
-    img.onerror = function() {
+    // The tile image itself: no second download just to check that it loads
+    const img = document.querySelector('.dashboard-btn[href*="companies"] .dashboard-tile-image');
+    if (!img) {
+        return;
+    }
+    const drawFallback = function() {
         // Create fallback canvas pallet image
         const canvas = document.createElement('canvas');
         canvas.width = 300;
@@ -20,7 +21,52 @@ document.addEventListener('DOMContentLoaded', function() {
         
         // Save as image
         const dataUrl = canvas.toDataURL();
-        document.querySelector('.dashboard-btn[href*="companies"]').style.backgroundImage = `url(${dataUrl})`;
+        img.parentElement.querySelectorAll('source').forEach(source => source.remove());
+        img.removeAttribute('srcset');
+        img.src = dataUrl;
     };
-    img.src = '/static/images/pallet.jpg';
+    if (img.complete && img.naturalWidth === 0) {
+        drawFallback();
+    } else {
+        img.addEventListener('error', drawFallback, { once: true });
+    }
+});
+
+// Company statistics charts, drawn from the stored per-company aggregates
+document.addEventListener('DOMContentLoaded', function() {
+    const countCanvas = document.getElementById('palletCountChart');
+    const priceCanvas = document.getElementById('pricePerDesiChart');
+    if (!countCanvas || !priceCanvas || typeof Chart === 'undefined') {
+        return;
+    }
+
+    fetch('/api/stats/companies')
+        .then(response => {
+            if (!response.ok) {
+                throw new Error('İstatistikler yüklenemedi');
+            }
+            return response.json();
+        })
+        .then(data => {
+            const companies = data.companies;
+            const labels = companies.map(company => company.name);
+            drawBarChart(countCanvas, labels, companies.map(company => company.pallet_count), 'Palet Sayısı');
+            drawBarChart(priceCanvas, labels, companies.map(company => company.price_per_desi), 'Desi Başına Fiyat (TL)');
+        })
+        .catch(error => console.error('Error:', error));
 });
+
+function drawBarChart(canvas, labels, values, title) {
+    new Chart(canvas, {
+        type: 'bar',
+        data: {
+            labels: labels,
+            datasets: [{ label: title, data: values, backgroundColor: 'rgba(13, 110, 253, 0.6)' }]
+        },
+        options: {
+            responsive: true,
+            plugins: { legend: { display: false }, title: { display: true, text: title } },
+            scales: { y: { beginAtZero: true } }
+        }
+    });
+}
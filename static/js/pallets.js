@@ -1,19 +1,66 @@
 document.addEventListener('DOMContentLoaded', function() {
-    // Initialize filter elements
-    const filterElements = {
-        searchName: document.getElementById('searchName'),
-        filterCompany: document.getElementById('filterCompany'),
-        minPrice: document.getElementById('minPrice'),
-        maxPrice: document.getElementById('maxPrice'),
-        sortOrder: document.getElementById('sortOrder')
-    };
+    // Filters, sorting and paging are applied on the server: submit the filter form on change
+    const filterForm = document.getElementById('palletFilters');
+    if (filterForm) {
+        let submitTimer = null;
+        const submitFilters = function(delay) {
+            clearTimeout(submitTimer);
+            submitTimer = setTimeout(function() { filterForm.submit(); }, delay);
+        };
+
+        ['minPrice', 'maxPrice'].forEach(function(id) {
+            const element = document.getElementById(id);
+            if (element) {
+                element.addEventListener('input', function() { submitFilters(500); });
+            }
+        });
+        ['filterCompany', 'sortOrder', 'pageSize'].forEach(function(id) {
+            const element = document.getElementById(id);
+            if (element) {
+                element.addEventListener('change', function() { submitFilters(0); });
+            }
+        });
 
-    // Add event listeners for filters
-    Object.values(filterElements).forEach(function(element) {
-        if (element) {
-            element.addEventListener('input', filterAndSortPallets);
+        // The search box suggests names while typing and searches on Enter,
+        // on leaving the box or when a suggestion is picked
+        const searchName = document.getElementById('searchName');
+        if (searchName) {
+            setupSearchSuggestions(searchName, document.getElementById('searchSuggestions'), function() {
+                submitFilters(0);
+            });
+            searchName.addEventListener('change', function() { submitFilters(0); });
         }
-    });
+
+        // Keep the cursor at the end of the search box after the page reloads
+        if (searchName && searchName.value) {
+            searchName.focus();
+            searchName.setSelectionRange(searchName.value.length, searchName.value.length);
+        }
+    }
+
+    // PDF exports are rendered by a background job; poll it and download when ready
+    const exportPdfButton = document.getElementById('exportPdf');
+    if (exportPdfButton && exportPdfButton.dataset.jobUrl) {
+        exportPdfButton.addEventListener('click', function(e) {
+            e.preventDefault();
+            startPdfExportJob(exportPdfButton);
+        });
+    }
+
+    const previewRepriceButton = document.getElementById('previewReprice');
+    if (previewRepriceButton) {
+        previewRepriceButton.addEventListener('click', function() { handleReprice(true); });
+        document.getElementById('applyReprice').addEventListener('click', function() { handleReprice(false); });
+        // A changed input needs a new preview before it can be applied
+        document.getElementById('repriceForm').addEventListener('input', function() {
+            document.getElementById('applyReprice').disabled = true;
+        });
+    }
+
+    const importButton = document.getElementById('startImport');
+    if (importButton) {
+        importButton.addEventListener('click', handlePalletImport);
+    }
 
     // Initialize save button event listener
     const saveButton = document.getElementById('savePallet');
@@ -21,6 +68,11 @@ document.addEventListener('DOMContentLoaded', function() {
         saveButton.addEventListener('click', handleSavePallet);
     }
 
+    const similarButton = document.getElementById('findSimilar');
+    if (similarButton) {
+        similarButton.addEventListener('click', handleFindSimilar);
+    }
+
     // Initialize edit buttons
     Array.prototype.forEach.call(document.querySelectorAll('.edit-pallet'), function(button) {
         button.addEventListener('click', async function(e) {
@@ -79,72 +131,292 @@ document.addEventListener('DOMContentLoaded', function() {
     });
 });
 
-function filterAndSortPallets() {
-    const searchTerm = document.getElementById('searchName')?.value.toLowerCase() || '';
-    const companyId = document.getElementById('filterCompany')?.value || '';
-    const minPrice = parseFloat(document.getElementById('minPrice')?.value) || 0;
-    const maxPrice = parseFloat(document.getElementById('maxPrice')?.value) || Infinity;
-    const sortOrder = document.getElementById('sortOrder')?.value;
-
-    const palletsList = document.getElementById('palletsList');
-    const palletsAccordion = document.getElementById('palletsAccordion');
-    const noResults = document.getElementById('noResults');
-
-    let items = [];
-    if (palletsList) {
-        items = Array.prototype.slice.call(palletsList.getElementsByTagName('tr'));
-    } else if (palletsAccordion) {
-        items = Array.prototype.slice.call(palletsAccordion.getElementsByClassName('accordion-item'));
+async function startPdfExportJob(button) {
+    const label = button.querySelector('.export-label');
+    const originalLabel = label ? label.textContent : '';
+    const setLabel = function(text) { if (label) label.textContent = text; };
+
+    if (button.classList.contains('disabled')) {
+        return;
     }
+    button.classList.add('disabled');
+    try {
+        const response = await fetch(button.dataset.jobUrl, { method: 'POST' });
+        let job = await response.json();
+        if (!response.ok) {
+            throw new Error(job.message || 'PDF oluşturma işi başlatılamadı');
+        }
 
-    let visibleCount = 0;
+        while (job.status === 'queued' || job.status === 'running') {
+            setLabel(`Hazırlanıyor... %${Math.round((job.progress || 0) * 100)}`);
+            await new Promise(function(resolve) { setTimeout(resolve, 1000); });
+            const statusResponse = await fetch(job.status_url);
+            job = await statusResponse.json();
+            if (!statusResponse.ok) {
+                throw new Error(job.message || 'İşlem durumu alınamadı');
+            }
+        }
 
-    items.forEach(function(item) {
-        const itemName = item.querySelector('td:first-child, .accordion-button')?.textContent.toLowerCase() || '';
-        const itemCompanyId = item.dataset.companyId;
-        const itemPrice = parseFloat(item.dataset.price) || 0;
+        if (job.status !== 'done') {
+            throw new Error(job.error || 'PDF oluşturulurken bir hata oluştu');
+        }
+        window.location.href = job.download_url;
+    } catch (error) {
+        console.error('PDF dışa aktarma hatası:', error);
+        alert('Hata: ' + error.message);
+    } finally {
+        setLabel(originalLabel);
+        button.classList.remove('disabled');
+    }
+}
 
-        const matchesSearch = itemName.includes(searchTerm);
-        const matchesCompany = !companyId || itemCompanyId === companyId;
-        const matchesPrice = itemPrice >= minPrice && (!maxPrice || itemPrice <= maxPrice);
+function handlePalletImport() {
+    const form = document.getElementById('importForm');
+    const fileInput = document.getElementById('importFile');
+    const progress = document.getElementById('importProgress');
+    const bar = progress.querySelector('.progress-bar');
+    const result = document.getElementById('importResult');
+    const button = document.getElementById('startImport');
 
-        const isVisible = matchesSearch && matchesCompany && matchesPrice;
-        if (isVisible) visibleCount++;
+    if (!fileInput.files.length) {
+        alert('Lütfen bir CSV dosyası seçin');
+        return;
+    }
 
-        item.style.display = isVisible ? '' : 'none';
+    // XMLHttpRequest instead of fetch to report upload progress
+    const request = new XMLHttpRequest();
+    request.open('POST', form.action);
+    request.upload.addEventListener('progress', function(e) {
+        if (e.lengthComputable) {
+            bar.style.width = Math.round(e.loaded / e.total * 100) + '%';
+        }
+    });
+    request.upload.addEventListener('load', function() {
+        bar.textContent = 'İşleniyor...';
+    });
+    request.addEventListener('load', function() {
+        button.disabled = false;
+        progress.classList.add('d-none');
+        let data = {};
+        try {
+            data = JSON.parse(request.responseText);
+        } catch (e) {
+            data = {message: 'İçe aktarma sırasında bir hata oluştu'};
+        }
+        if (request.status !== 200) {
+            result.innerHTML = '';
+            const alertBox = document.createElement('div');
+            alertBox.className = 'alert alert-danger';
+            alertBox.textContent = data.message || 'İçe aktarma sırasında bir hata oluştu';
+            result.appendChild(alertBox);
+            return;
+        }
+        renderImportResult(result, data);
+    });
+    request.addEventListener('error', function() {
+        button.disabled = false;
+        progress.classList.add('d-none');
+        alert('Hata: Sunucuya ulaşılamadı');
     });
 
-    if (visibleCount > 0 && sortOrder) {
-        const sortedItems = items
-            .filter(function(item) { return item.style.display !== 'none'; })
-            .sort(function(a, b) {
-                const aValue = getSortValue(a, sortOrder);
-                const bValue = getSortValue(b, sortOrder);
-                return sortOrder.includes('desc') ? bValue - aValue : aValue - bValue;
+    button.disabled = true;
+    result.innerHTML = '';
+    bar.style.width = '0%';
+    bar.textContent = '';
+    progress.classList.remove('d-none');
+    request.send(new FormData(form));
+}
+
+function renderImportResult(container, data) {
+    container.innerHTML = '';
+    const summary = document.createElement('div');
+    summary.className = data.rejected ? 'alert alert-warning' : 'alert alert-success';
+    summary.textContent = `${data.imported} palet içe aktarıldı, ${data.rejected} satır reddedildi (${data.seconds} sn).`;
+    container.appendChild(summary);
+
+    if (data.rejected_rows && data.rejected_rows.length) {
+        const list = document.createElement('ul');
+        list.className = 'small mb-0';
+        data.rejected_rows.forEach(function(row) {
+            const item = document.createElement('li');
+            const messages = Object.entries(row.errors).map(function([field, message]) {
+                return field === '_' ? message : `${field}: ${message}`;
             });
+            item.textContent = `Satır ${row.line}: ${messages.join(', ')}`;
+            list.appendChild(item);
+        });
+        container.appendChild(list);
+    }
+
+    if (data.imported) {
+        // Show the new pallets once the dialog is closed
+        document.getElementById('importModal').addEventListener('hidden.bs.modal', function() {
+            window.location.reload();
+        }, {once: true});
+    }
+}
+
+let repriceVersion = null;
 
-        const container = palletsList || palletsAccordion;
-        if (container) {
-            sortedItems.forEach(function(item) { container.appendChild(item); });
+async function handleReprice(dryRun) {
+    const form = document.getElementById('repriceForm');
+    const result = document.getElementById('repriceResult');
+    const applyButton = document.getElementById('applyReprice');
+    if (!form.reportValidity()) {
+        return;
+    }
+    if (!dryRun && !confirm('Yeni fiyatlar uygulanacak. Devam etmek istiyor musunuz?')) {
+        return;
+    }
+
+    const payload = Object.fromEntries(new FormData(form).entries());
+    payload.dry_run = dryRun;
+    if (!dryRun) {
+        payload.expected_version = repriceVersion;
+    }
+    applyButton.disabled = true;
+
+    try {
+        const response = await fetch('/api/pallets/reprice', {
+            method: 'POST',
+            headers: {'Content-Type': 'application/json'},
+            body: JSON.stringify(payload)
+        });
+        const data = await response.json();
+        if (!response.ok) {
+            throw new Error(data.message || 'Fiyatlandırma sırasında bir hata oluştu');
         }
+        repriceVersion = data.data_version;
+        renderRepriceResult(result, data);
+        if (dryRun) {
+            applyButton.disabled = data.changed === 0;
+        } else {
+            document.getElementById('repriceModal').addEventListener('hidden.bs.modal', function() {
+                window.location.reload();
+            }, {once: true});
+        }
+    } catch (error) {
+        console.error('Error:', error);
+        result.innerHTML = '';
+        const alertBox = document.createElement('div');
+        alertBox.className = 'alert alert-danger';
+        alertBox.textContent = error.message;
+        result.appendChild(alertBox);
     }
+}
 
-    if (noResults) {
-        noResults.classList.toggle('d-none', visibleCount > 0);
+function renderRepriceResult(container, data) {
+    container.innerHTML = '';
+    const summary = document.createElement('div');
+    summary.className = data.dry_run ? 'alert alert-info' : 'alert alert-success';
+    summary.textContent = (data.dry_run ? 'Önizleme: ' : 'Uygulandı: ') +
+        `${data.pallets} paletten ${data.changed} fiyat değişiyor, ${data.skipped} palet desi eksik olduğu için atlandı. ` +
+        `Toplam: ${data.old_total.toFixed(2)} TL → ${data.new_total.toFixed(2)} TL`;
+    container.appendChild(summary);
+
+    if (!data.dry_run || !data.rows.length) {
+        return;
+    }
+    const table = document.createElement('table');
+    table.className = 'table table-sm';
+    table.innerHTML = '<thead><tr><th>Palet</th><th>Eski Fiyat</th><th>Yeni Fiyat</th><th>Değişim</th></tr></thead>';
+    const body = document.createElement('tbody');
+    data.rows.forEach(function(row) {
+        const tr = document.createElement('tr');
+        const change = row.change_percent === null ? '-' : `%${row.change_percent.toFixed(2)}`;
+        [row.name, row.old_price.toFixed(2), row.new_price.toFixed(2), change].forEach(function(value) {
+            const td = document.createElement('td');
+            td.textContent = value;
+            tr.appendChild(td);
+        });
+        body.appendChild(tr);
+    });
+    table.appendChild(body);
+    container.appendChild(table);
+    if (data.changed > data.rows.length) {
+        const note = document.createElement('p');
+        note.className = 'small text-muted';
+        note.textContent = `En büyük ${data.rows.length} değişiklik gösteriliyor.`;
+        container.appendChild(note);
     }
 }
 
-function getSortValue(item, sortOrder) {
-    if (sortOrder.startsWith('name')) {
-        return item.querySelector('td:first-child, .accordion-button')?.textContent.toLowerCase() || '';
+// Closest existing pallets to the dimensions in the form, e.g. to price a quote
+async function handleFindSimilar() {
+    const container = document.getElementById('similarPallets');
+    const fields = {
+        board_thickness: 'boardThickness',
+        upper_board_length: 'upperBoardLength', upper_board_width: 'upperBoardWidth',
+        upper_board_quantity: 'upperBoardQuantity',
+        lower_board_length: 'lowerBoardLength', lower_board_width: 'lowerBoardWidth',
+        lower_board_quantity: 'lowerBoardQuantity',
+        closure_length: 'closureLength', closure_width: 'closureWidth', closure_quantity: 'closureQuantity',
+        block_length: 'blockLength', block_width: 'blockWidth', block_height: 'blockHeight'
+    };
+    const spec = {k: 5, exclude_id: document.getElementById('palletId').value || null};
+    for (const [field, id] of Object.entries(fields)) {
+        const value = document.getElementById(id).value;
+        if (value === '') {
+            container.innerHTML = '<div class="alert alert-warning">Benzer palet aramak için tüm ölçüleri giriniz.</div>';
+            return;
+        }
+        spec[field] = parseFloat(value);
     }
-    if (sortOrder.includes('price')) {
-        return parseFloat(item.dataset.price) || 0;
+
+    try {
+        const response = await fetch('/api/pallets/similar', {
+            method: 'POST',
+            headers: {'Content-Type': 'application/json'},
+            body: JSON.stringify(spec)
+        });
+        const data = await response.json();
+        if (!response.ok) {
+            throw new Error(data.message || 'Benzer paletler bulunamadı');
+        }
+        renderSimilarPallets(container, data.items);
+    } catch (error) {
+        console.error('Benzer palet hatası:', error);
+        container.innerHTML = '';
+        const alertBox = document.createElement('div');
+        alertBox.className = 'alert alert-danger';
+        alertBox.textContent = error.message;
+        container.appendChild(alertBox);
     }
-    if (sortOrder.includes('volume')) {
-        return parseFloat(item.dataset.volume) || 0;
+}
+
+function renderSimilarPallets(container, items) {
+    container.innerHTML = '';
+    if (!items.length) {
+        container.innerHTML = '<div class="alert alert-info">Benzer palet bulunamadı.</div>';
+        return;
     }
-    return 0;
+    const table = document.createElement('table');
+    table.className = 'table table-sm align-middle';
+    table.innerHTML = '<thead><tr><th>Palet</th><th>Firma</th><th>Fiyat</th><th>Toplam Desi</th><th>Fark</th><th></th></tr></thead>';
+    const body = document.createElement('tbody');
+    items.forEach(function(item) {
+        const tr = document.createElement('tr');
+        [item.name, item.company_name, item.price.toFixed(2) + ' TL',
+         item.total_volume === null ? '-' : item.total_volume.toFixed(2),
+         `%${item.difference_percent.toFixed(2)}`].forEach(function(value) {
+            const td = document.createElement('td');
+            td.textContent = value;
+            tr.appendChild(td);
+        });
+        const action = document.createElement('td');
+        const button = document.createElement('button');
+        button.type = 'button';
+        button.className = 'btn btn-sm btn-outline-secondary';
+        button.textContent = 'Fiyatı Kullan';
+        button.addEventListener('click', function() {
+            document.getElementById('price').value = item.price;
+        });
+        action.appendChild(button);
+        tr.appendChild(action);
+        body.appendChild(tr);
+    });
+    table.appendChild(body);
+    container.appendChild(table);
 }
 
 function calculateDesi() {
@@ -301,3 +573,98 @@ function populatePalletForm(pallet) {
     
     calculateDesi();
 }
+
+// Pallet and company name suggestions from /api/search/autocomplete under the search box
+function setupSearchSuggestions(input, menu, submit) {
+    if (!menu || !input.dataset.suggestUrl) {
+        return;
+    }
+    let timer = null;
+    let lastQuery = null;
+
+    const hide = function() {
+        menu.classList.remove('show');
+        menu.innerHTML = '';
+    };
+
+    const addItem = function(label, detail, onPick) {
+        const item = document.createElement('button');
+        item.type = 'button';
+        item.className = 'dropdown-item text-truncate';
+        item.textContent = label;
+        if (detail) {
+            const small = document.createElement('small');
+            small.className = 'text-muted ms-2';
+            small.textContent = detail;
+            item.appendChild(small);
+        }
+        // mousedown runs before the input loses focus
+        item.addEventListener('mousedown', function(event) {
+            event.preventDefault();
+            hide();
+            onPick();
+        });
+        menu.appendChild(item);
+    };
+
+    const render = function(data) {
+        menu.innerHTML = '';
+        data.pallets.forEach(function(pallet) {
+            addItem(pallet.name, pallet.company_name, function() {
+                input.value = pallet.name;
+                submit();
+            });
+        });
+        if (data.companies.length) {
+            const header = document.createElement('h6');
+            header.className = 'dropdown-header';
+            header.textContent = 'Firmalar';
+            menu.appendChild(header);
+            data.companies.forEach(function(company) {
+                addItem(company.name, null, function() {
+                    const select = document.getElementById('filterCompany');
+                    if (select) {
+                        select.value = company.id;
+                    }
+                    input.value = '';
+                    submit();
+                });
+            });
+        }
+        menu.classList.toggle('show', menu.children.length > 0);
+    };
+
+    const suggest = function() {
+        const query = input.value.trim();
+        if (query === lastQuery) {
+            return;
+        }
+        lastQuery = query;
+        if (!query) {
+            hide();
+            return;
+        }
+        fetch(input.dataset.suggestUrl + '?q=' + encodeURIComponent(query), {
+            headers: {'Accept': 'application/json'}
+        })
+            .then(function(response) { return response.ok ? response.json() : null; })
+            .then(function(data) {
+                // Ignore answers to queries the user has typed past
+                if (data && data.query === input.value.trim()) {
+                    render(data);
+                }
+            })
+            .catch(function() { hide(); });
+    };
+
+    input.addEventListener('input', function() {
+        clearTimeout(timer);
+        timer = setTimeout(suggest, 150);
+    });
+    input.addEventListener('keydown', function(event) {
+        if (event.key === 'Escape') {
+            hide();
+        }
+    });
+    input.addEventListener('blur', hide);
+}
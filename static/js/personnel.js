@@ -0,0 +1,300 @@
+async function sendJson(url, method, body) {
+    const response = await fetch(url, {
+        method: method,
+        headers: {
+            'Content-Type': 'application/json',
+        },
+        body: body === undefined ? undefined : JSON.stringify(body)
+    });
+    const data = await response.json();
+    if (!response.ok) {
+        throw new Error(data.message || 'İşlem sırasında bir hata oluştu');
+    }
+    return data;
+}
+
+function showError(error) {
+    alert('Hata: ' + (error.message || 'Bilinmeyen bir hata oluştu'));
+}
+
+function formatDate(value) {
+    return value ? `${value.slice(8, 10)}.${value.slice(5, 7)}.${value.slice(0, 4)}` : '';
+}
+
+// Employees
+document.addEventListener('DOMContentLoaded', function() {
+    const modalElement = document.getElementById('employeeModal');
+    if (!modalElement) {
+        return;
+    }
+    const employeeModal = new bootstrap.Modal(modalElement);
+    const form = document.getElementById('employeeForm');
+    const fields = ['first_name', 'last_name', 'national_id', 'card_number', 'phone', 'email', 'address', 'start_date',
+                    'daily_rate'];
+
+    document.getElementById('addEmployee').addEventListener('click', () => {
+        form.reset();
+        document.getElementById('employeeId').value = '';
+        form.elements.start_date.value = new Date().toISOString().slice(0, 10);
+        employeeModal.show();
+    });
+
+    document.querySelectorAll('.edit-employee').forEach(button => {
+        button.addEventListener('click', async (e) => {
+            try {
+                const employeeId = e.currentTarget.dataset.id;
+                const response = await fetch(`/api/employees/${employeeId}`);
+                const employee = await response.json();
+                if (!response.ok) {
+                    throw new Error(employee.message || 'Personel bilgileri alınamadı');
+                }
+                document.getElementById('employeeId').value = employeeId;
+                fields.forEach(field => {
+                    form.elements[field].value = employee[field] ?? '';
+                });
+                form.elements.active.checked = employee.active;
+                employeeModal.show();
+            } catch (error) {
+                showError(error);
+            }
+        });
+    });
+
+    document.getElementById('saveEmployee').addEventListener('click', async () => {
+        try {
+            const employeeId = document.getElementById('employeeId').value;
+            const body = {active: form.elements.active.checked};
+            fields.forEach(field => {
+                body[field] = form.elements[field].value.trim();
+            });
+            if (!body.first_name || !body.last_name) {
+                throw new Error('Ad ve soyad boş olamaz');
+            }
+            await sendJson(employeeId ? `/api/employees/${employeeId}` : '/api/employees',
+                           employeeId ? 'PUT' : 'POST', body);
+            alert(employeeId ? 'Personel başarıyla güncellendi' : 'Personel başarıyla eklendi');
+            location.reload();
+        } catch (error) {
+            showError(error);
+        }
+    });
+
+    document.querySelectorAll('.delete-employee').forEach(button => {
+        button.addEventListener('click', async (e) => {
+            if (!confirm('Bu personeli silmek istediğinizden emin misiniz?')) {
+                return;
+            }
+            try {
+                await sendJson(`/api/employees/${e.currentTarget.dataset.id}`, 'DELETE');
+                location.reload();
+            } catch (error) {
+                showError(error);
+            }
+        });
+    });
+
+    const historyModal = new bootstrap.Modal(document.getElementById('historyModal'));
+    const historyRows = document.getElementById('historyRows');
+    document.querySelectorAll('.payment-history').forEach(button => {
+        button.addEventListener('click', async (e) => {
+            try {
+                const response = await fetch(`/api/employees/${e.currentTarget.dataset.id}/payments`);
+                const data = await response.json();
+                if (!response.ok) {
+                    throw new Error(data.message || 'Ödeme geçmişi alınamadı');
+                }
+                historyRows.replaceChildren();
+                data.payments.forEach(payment => {
+                    const row = historyRows.insertRow();
+                    const description = payment.type === 'salary'
+                        ? `${formatDate(payment.week_start)} haftası: ${payment.days_worked} gün × ${payment.daily_rate.toFixed(2)}` +
+                          ` = ${payment.gross.toFixed(2)}, avans ${payment.advances.toFixed(2)}`
+                        : (payment.note || '');
+                    [formatDate(payment.date), payment.type === 'salary' ? 'Maaş' : 'Avans', description]
+                        .forEach(text => { row.insertCell().textContent = text; });
+                    const amount = row.insertCell();
+                    amount.className = 'text-end';
+                    amount.textContent = payment.amount.toFixed(2);
+                });
+                if (!data.payments.length) {
+                    const cell = historyRows.insertRow().insertCell();
+                    cell.colSpan = 4;
+                    cell.className = 'text-center';
+                    cell.textContent = 'Ödeme kaydı yok';
+                }
+                historyModal.show();
+            } catch (error) {
+                showError(error);
+            }
+        });
+    });
+});
+
+// Attendance and advances
+document.addEventListener('DOMContentLoaded', function() {
+    const form = document.getElementById('attendanceForm');
+    if (!form) {
+        return;
+    }
+
+    form.addEventListener('click', (e) => {
+        const selectWeek = e.target.closest('.select-week');
+        if (selectWeek) {
+            const boxes = selectWeek.closest('tr').querySelectorAll('.attendance-day');
+            const check = Array.from(boxes).some(box => !box.checked);
+            boxes.forEach(box => { box.checked = check; });
+            return;
+        }
+        const noteButton = e.target.closest('.attendance-note');
+        if (noteButton) {
+            const note = prompt('Not', noteButton.dataset.note);
+            if (note === null) {
+                return;
+            }
+            noteButton.dataset.note = note.trim();
+            noteButton.dataset.changed = '1';
+            noteButton.title = note.trim() || 'Not ekle';
+            noteButton.classList.toggle('text-warning', !!note.trim());
+            noteButton.classList.toggle('text-muted', !note.trim());
+        }
+    });
+
+    document.getElementById('saveAttendance').addEventListener('click', async () => {
+        try {
+            const items = [];
+            const notes = [];
+            form.querySelectorAll('.attendance-row').forEach(row => {
+                const employeeId = Number(row.dataset.id);
+                const rate = row.querySelector('.week-rate').value.trim();
+                items.push({
+                    employee_id: employeeId,
+                    days: Array.from(row.querySelectorAll('.attendance-day')).map(box => box.checked),
+                    daily_rate: rate === '' ? null : rate
+                });
+                row.querySelectorAll('.attendance-note[data-changed]').forEach(button => {
+                    notes.push({employee_id: employeeId, date: button.dataset.date, note: button.dataset.note});
+                });
+            });
+            await sendJson('/api/attendance', 'PUT', {week: form.dataset.week, items: items, notes: notes});
+            alert('Puantaj kaydedildi');
+            location.reload();
+        } catch (error) {
+            showError(error);
+        }
+    });
+
+    const advanceForm = document.getElementById('advanceForm');
+    document.getElementById('saveAdvance').addEventListener('click', async () => {
+        try {
+            if (!advanceForm.elements.employee_id.value) {
+                throw new Error('Personel seçiniz');
+            }
+            await sendJson('/api/advances', 'POST', {
+                employee_id: advanceForm.elements.employee_id.value,
+                date: advanceForm.elements.date.value,
+                amount: advanceForm.elements.amount.value,
+                note: advanceForm.elements.note.value
+            });
+            location.reload();
+        } catch (error) {
+            showError(error);
+        }
+    });
+
+    const importForm = document.getElementById('attendanceImportForm');
+    const importButton = document.getElementById('startAttendanceImport');
+    importButton.addEventListener('click', async () => {
+        const result = document.getElementById('attendanceImportResult');
+        if (!importForm.elements.file.files.length) {
+            alert('Lütfen bir kayıt dosyası seçin');
+            return;
+        }
+        importButton.disabled = true;
+        result.replaceChildren();
+        try {
+            const response = await fetch(importForm.action, {method: 'POST', body: new FormData(importForm)});
+            const data = await response.json();
+            if (!response.ok) {
+                throw new Error(data.message || 'İçe aktarma sırasında bir hata oluştu');
+            }
+            renderAttendanceImport(result, data);
+        } catch (error) {
+            const alertBox = document.createElement('div');
+            alertBox.className = 'alert alert-danger';
+            alertBox.textContent = error.message;
+            result.appendChild(alertBox);
+        } finally {
+            importButton.disabled = false;
+        }
+    });
+
+    document.querySelectorAll('.delete-advance').forEach(button => {
+        button.addEventListener('click', async (e) => {
+            if (!confirm('Bu avansı silmek istediğinizden emin misiniz?')) {
+                return;
+            }
+            try {
+                await sendJson(`/api/advances/${e.currentTarget.dataset.id}`, 'DELETE');
+                location.reload();
+            } catch (error) {
+                showError(error);
+            }
+        });
+    });
+});
+
+function renderAttendanceImport(container, data) {
+    const problems = data.invalid + data.unknown_punches + data.conflicts;
+    const summary = document.createElement('div');
+    summary.className = problems ? 'alert alert-warning' : 'alert alert-success';
+    summary.textContent = `${data.punches} okutma işlendi: ${data.days} gün puantaja eklendi ` +
+        `(${data.weeks_created} yeni, ${data.weeks_updated} güncellenen hafta), ` +
+        `${data.unknown_punches} okutma tanınmayan numaralara ait, ${data.conflicts} çakışma, ` +
+        `${data.invalid} hatalı satır (${data.seconds} sn).`;
+    container.appendChild(summary);
+
+    const lines = [
+        ...data.unknown_employees.map(row => `Tanınmayan numara ${row.employee}: ${row.punches} okutma`),
+        ...data.conflict_rows.map(row => `${row.employee}, ${formatDate(row.date)}: ${row.message}`),
+        ...data.invalid_rows.map(row => `Satır ${row.line}: ${row.message}`)
+    ];
+    if (lines.length) {
+        const list = document.createElement('ul');
+        list.className = 'small mb-0';
+        lines.forEach(text => {
+            list.appendChild(document.createElement('li')).textContent = text;
+        });
+        container.appendChild(list);
+    }
+    if (data.days) {
+        // Show the imported days once the dialog is closed
+        document.getElementById('attendanceImportModal').addEventListener('hidden.bs.modal', () => {
+            location.reload();
+        }, {once: true});
+    }
+}
+
+// Weekly pay list
+document.addEventListener('DOMContentLoaded', function() {
+    const printButton = document.getElementById('printPayroll');
+    if (printButton) {
+        printButton.addEventListener('click', function() {
+            window.print();
+        });
+    }
+    const payButton = document.getElementById('payWeek');
+    if (payButton) {
+        payButton.addEventListener('click', async () => {
+            if (!confirm('Bu haftanın ödemeleri yapıldı olarak kaydedilecek. Devam edilsin mi?')) {
+                return;
+            }
+            try {
+                const result = await sendJson('/api/payroll/pay', 'POST', {week: payButton.dataset.week});
+                alert(`${result.paid} personelin ödemesi kaydedildi (${result.net.toFixed(2)} TL)`);
+                location.reload();
+            } catch (error) {
+                showError(error);
+            }
+        });
+    }
+});
@@ -0,0 +1,43 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# The app reads its configuration when it is imported
+_database_dir = tempfile.mkdtemp(prefix='palet_tests_')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_database_dir, 'test.db')}"
+os.environ['EXPORT_CACHE_ENABLED'] = '0'
+
+# Registers the routes, models and session hooks in the order the app does
+import main  # noqa: E402
+
+
+@pytest.fixture()
+def app():
+    from app import db
+
+    with main.app.app_context():
+        db.create_all()
+        yield main.app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture()
+def company(app):
+    """A company of a new user"""
+    from app import db
+    from models import Company, User
+
+    user = User(username='tester', email='tester@example.com')
+    user.set_password('test-password')
+    db.session.add(user)
+    db.session.flush()
+    company = Company(name='Test Palet', contact_email='info@testpalet.com', user_id=user.id)
+    db.session.add(company)
+    db.session.commit()
+    return company
@@ -0,0 +1,9 @@
+def pallet_values(company, name, price):
+    """Create payload of a Euro-like pallet of ``company``"""
+    return {
+        'name': name, 'company_id': company.id, 'price': price, 'board_thickness': 2.2,
+        'upper_board_length': 120, 'upper_board_width': 10, 'upper_board_quantity': 5,
+        'lower_board_length': 120, 'lower_board_width': 10, 'lower_board_quantity': 3,
+        'closure_length': 100, 'closure_width': 10, 'closure_quantity': 3,
+        'block_length': 10, 'block_width': 10, 'block_height': 8,
+    }
@@ -0,0 +1,29 @@
+import json
+import os
+
+from flask import url_for
+
+import assets
+
+NAME = 'css/custom.css'
+
+
+def built_name():
+    with open(os.path.join(assets.app.static_folder, NAME), 'rb') as f:
+        return assets.hashed_name(NAME, f.read())
+
+
+def test_manifest_entries_of_changed_sources_are_dropped(tmp_path):
+    path = tmp_path / 'manifest.json'
+    path.write_text(json.dumps({'files': {NAME: built_name(), 'js/pallets.js': 'js/pallets.000000000000.js'},
+                                'images': {}}), encoding='utf-8')
+
+    assert assets.load_manifest(str(path))['files'] == {NAME: built_name()}
+
+
+def test_debug_serves_files_edited_after_loading_unhashed(app, monkeypatch):
+    monkeypatch.setattr(assets, '_manifest', {'files': {NAME: built_name()}, 'images': {}, 'loaded_at': 0})
+    with app.test_request_context():
+        assert url_for('static', filename=NAME) == f'/static/dist/{built_name()}'
+        monkeypatch.setattr(app, 'debug', True)
+        assert url_for('static', filename=NAME) == f'/static/{NAME}'
@@ -0,0 +1,43 @@
+from collections import Counter
+
+import pytest
+
+import cutting_plan
+from cutting_plan import CuttingPlanError, MAX_ORDER_PALLETS, parse_order_items, plan_profile, sequential_patterns
+
+STOCK = [20000, 25000, 30000, 40000]
+KERF = 40
+
+
+def demand(count=60):
+    """Many distinct lengths in 1/100 cm, like an order of many different pallets"""
+    return Counter({8000 + 50 * i: 40 + i % 7 for i in range(count)})
+
+
+def assert_valid(plan, wanted):
+    cut = Counter()
+    for (stock_length, cuts), repeat in plan.items():
+        assert sum(length * n for length, n in cuts) + KERF * (sum(n for _, n in cuts) - 1) <= stock_length
+        for length, n in cuts:
+            cut[length] += n * repeat
+    assert cut == wanted
+
+
+def test_sequential_patterns_cover_the_demand_with_less_waste():
+    wanted = demand()
+    plan, algorithm = plan_profile(wanted, STOCK, KERF, mode='optimal')
+    fast, _ = plan_profile(wanted, STOCK, KERF)
+
+    assert algorithm == 'sequential_patterns'
+    assert_valid(plan, wanted)
+    assert cutting_plan._plan_length(plan) < cutting_plan._plan_length(fast)
+
+
+def test_spent_budget_falls_back_to_best_fit_decreasing():
+    wanted = demand()
+    assert_valid(sequential_patterns(wanted, STOCK, KERF, deadline=0), wanted)
+
+
+def test_order_pallet_count_is_capped():
+    with pytest.raises(CuttingPlanError):
+        parse_order_items([{'pallet_id': i, 'quantity': 1} for i in range(MAX_ORDER_PALLETS + 1)])
@@ -0,0 +1,26 @@
+import random
+
+from utils import (
+    DESI_FIELDS, DIMENSION_FIELDS, calculate_component_volumes, calculate_component_volumes_batch, pallet_columns,
+)
+
+
+def random_pallets(count, seed=1):
+    rng = random.Random(seed)
+    return [{field: rng.randrange(0, 9) if field.endswith('quantity') else round(rng.uniform(0, 150), 2)
+             for field in DIMENSION_FIELDS} for _ in range(count)]
+
+
+def test_single_and_batch_calculation_agree():
+    pallets = random_pallets(1000)
+    batch = calculate_component_volumes_batch(pallet_columns(pallets))
+    for i, pallet in enumerate(pallets):
+        single = calculate_component_volumes(pallet)
+        assert [single[field] for field in DESI_FIELDS] == [batch[field][i] for field in DESI_FIELDS]
+
+
+def test_missing_dimension_is_an_error_in_both():
+    pallet = random_pallets(1)[0]
+    pallet['block_height'] = None
+    assert calculate_component_volumes(pallet)['total_desi'] == 0
+    assert calculate_component_volumes_batch(pallet_columns([pallet]))['error'].tolist() == [True]
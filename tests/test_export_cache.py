@@ -0,0 +1,27 @@
+import json
+import threading
+
+import export_cache
+
+
+def test_concurrent_writes_of_one_key_publish_a_complete_entry(tmp_path, monkeypatch):
+    monkeypatch.setattr(export_cache, 'EXPORT_CACHE_DIR', str(tmp_path))
+    monkeypatch.setattr(export_cache, 'EXPORT_CACHE_ENABLED', True)
+    errors = []
+
+    def store(size):
+        try:
+            for _ in range(100):
+                export_cache.put('pallets', b'x' * size, 'text/csv', 'paletler.csv')
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=store, args=(1000 * (i + 1),)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['pallets.bin', 'pallets.json']
+    assert json.loads((tmp_path / 'pallets.json').read_text(encoding='utf-8'))['mimetype'] == 'text/csv'
@@ -0,0 +1,77 @@
+import os
+import signal
+import threading
+import time
+
+import pytest
+
+import export_jobs
+
+
+def wait_for(job_id, statuses, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = export_jobs.read_job(job_id)
+        if job and job['status'] in statuses:
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f'job {job_id} did not reach {statuses}')
+
+
+@pytest.fixture()
+def job_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(export_jobs, 'EXPORT_JOB_DIR', str(tmp_path))
+    yield tmp_path
+    executor = export_jobs._executor
+    if executor is not None:
+        export_jobs._reset_executor(executor)
+
+
+def test_pool_is_restarted_after_a_worker_dies(job_dir, monkeypatch):
+    pallets = [{'id': i, 'name': f'Palet {i}', 'company_name': 'Firma', 'price': 100, 'total_volume': 10,
+                'board_thickness': 2.2,
+                'upper_board_length': 120, 'upper_board_width': 10, 'upper_board_quantity': 5,
+                'lower_board_length': 120, 'lower_board_width': 10, 'lower_board_quantity': 3,
+                'closure_length': 80, 'closure_width': 10, 'closure_quantity': 3,
+                'block_length': 10, 'block_width': 10, 'block_height': 10} for i in range(20)]
+    # A job that never starts rendering keeps the worker busy until it is killed
+    monkeypatch.setattr(export_jobs, 'render_pdf_job', _hang)
+    job = export_jobs.submit_pdf_job(1, pallets)
+    broken = export_jobs._executor
+    for process in list(broken._processes.values()):
+        os.kill(process.pid, signal.SIGKILL)
+
+    assert wait_for(job['id'], {export_jobs.STATUS_FAILED})['status'] == export_jobs.STATUS_FAILED
+
+    monkeypatch.undo()
+    monkeypatch.setattr(export_jobs, 'EXPORT_JOB_DIR', str(job_dir))
+    job = export_jobs.submit_pdf_job(1, pallets)
+    assert export_jobs._executor is not broken
+    assert wait_for(job['id'], {export_jobs.STATUS_DONE, export_jobs.STATUS_FAILED})['status'] == \
+        export_jobs.STATUS_DONE
+
+
+def test_concurrent_state_writes_of_one_job(job_dir):
+    job_id = '0' * 32
+    errors = []
+
+    def write(index):
+        try:
+            for step in range(100):
+                export_jobs._write_meta(job_id, progress=step / 100, writer=index)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=write, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert export_jobs.read_job(job_id)['progress'] == 0.99
+    assert sorted(path.name for path in job_dir.iterdir()) == [f'{job_id}.json']
+
+
+def _hang(*args):
+    time.sleep(60)
@@ -0,0 +1,32 @@
+from api import apply_pallet_batch
+from app import db
+from company_stats import company_stats, recompute_company_stats
+from helpers import pallet_values
+
+
+def create_pallets(company, count):
+    result, status = apply_pallet_batch(company.user_id, {
+        'create': [pallet_values(company, f'Palet {i}', 100 + i) for i in range(count)],
+    })
+    assert status == 200 and not result['errors']
+    return result['created_ids']
+
+
+def test_repeated_ids_are_rejected_and_stats_stay_exact(company):
+    ids = create_pallets(company, 5)
+
+    result, status = apply_pallet_batch(company.user_id, {
+        'update': [{'id': ids[0], 'price': 200}, {'id': ids[0], 'price': 300}, {'id': ids[1], 'price': 50}],
+        'delete': [ids[1], ids[2], ids[2]],
+    })
+
+    assert status == 200
+    assert (result['updated'], result['deleted']) == (1, 2)
+    assert [(error['operation'], error['index']) for error in result['errors']] == [('delete', 2), ('update', 1)]
+
+    stored = company_stats(company.user_id)
+    recompute_company_stats([company.id])
+    db.session.commit()
+    assert stored == company_stats(company.user_id)
+    assert stored[0]['pallet_count'] == 3
+    assert stored[0]['total_price'] == 200 + 103 + 104
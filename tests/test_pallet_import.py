@@ -0,0 +1,44 @@
+import io
+
+from app import db
+from models import Pallet
+from pallet_import import FLAT_LAYOUT_COLUMNS, import_pallets_csv
+from sqlalchemy import func, select
+
+HEADER = ';'.join(('name', 'company_id') + FLAT_LAYOUT_COLUMNS[1:])
+# board_thickness, then length;width;quantity of the boards and length;width;height of the blocks
+DIMENSIONS = '2.2;120;10;5;120;10;4;100;10;3;10;10;8'
+
+
+def catalog(*rows):
+    return io.StringIO('\n'.join((HEADER,) + rows) + '\n')
+
+
+def test_malformed_rows_are_rejected_and_valid_rows_imported(company):
+    stream = catalog(
+        f'Euro;{company.id};100;{DIMENSIONS}',
+        # Trailing columns missing
+        f'Kısa;{company.id};10;2;100;10;5;100;10;3',
+        f'Fiyatsız;{company.id};abc;{DIMENSIONS}',
+        f'Amerikan;{company.id};250,50;{DIMENSIONS}',
+    )
+
+    stats = import_pallets_csv(stream, company.user_id, chunk_size=10)
+
+    assert stats['processed'] == 4
+    assert stats['imported'] == 2
+    assert stats['rejected'] == 2
+    rejected = {row['line']: row['errors'] for row in stats['rejected_rows']}
+    assert set(rejected) == {3, 4}
+    assert 'price' in rejected[4]
+    names = set(db.session.scalars(select(Pallet.name).where(Pallet.company_id == company.id)))
+    assert names == {'Euro', 'Amerikan'}
+
+
+def test_dry_run_reports_malformed_rows_without_writing(company):
+    stream = catalog(f'Euro;{company.id};100;{DIMENSIONS}', f'Bozuk;{company.id};1;x')
+
+    stats = import_pallets_csv(stream, company.user_id, dry_run=True)
+
+    assert (stats['imported'], stats['rejected']) == (1, 1)
+    assert db.session.scalar(select(func.count()).select_from(Pallet)) == 0
@@ -0,0 +1,48 @@
+import pytest
+from sqlalchemy import select, update
+
+import repricing
+from api import apply_pallet_batch
+from app import db
+from data_version import bump_data_version, get_data_version
+from models import Pallet
+from repricing import RepricingConflict, parse_repricing_params, reprice
+from helpers import pallet_values
+
+PARAMS = {'board_rate': 9.5, 'block_rate': 12, 'labor_per_piece': 1.5, 'margin': 20, 'round_to': 1}
+
+
+@pytest.fixture()
+def pallet_id(company):
+    result, _ = apply_pallet_batch(company.user_id, {'create': [pallet_values(company, 'Euro', 100)]})
+    return result['created_ids'][0]
+
+
+def test_apply_with_the_preview_version(company, pallet_id):
+    preview = reprice(company.user_id, parse_repricing_params(PARAMS))
+
+    result = reprice(company.user_id, parse_repricing_params(PARAMS), dry_run=False,
+                     expected_version=preview['data_version'])
+
+    assert result['changed'] == 1
+    assert result['data_version'] == preview['data_version'] + 1
+    assert db.session.get(Pallet, pallet_id).price == pytest.approx(preview['rows'][0]['new_price'])
+
+
+def test_write_committed_after_the_version_read_is_a_conflict(company, pallet_id, monkeypatch):
+    preview = reprice(company.user_id, parse_repricing_params(PARAMS))
+
+    def read_then_concurrent_write(user_id):
+        version = get_data_version(user_id)
+        # Another worker changes a price right after this request read the version
+        with db.engine.begin() as connection:
+            connection.execute(update(Pallet.__table__).where(Pallet.id == pallet_id).values(price=555))
+            bump_data_version([user_id], connection)
+        return version
+
+    monkeypatch.setattr(repricing, 'get_data_version', read_then_concurrent_write)
+    with pytest.raises(RepricingConflict):
+        reprice(company.user_id, parse_repricing_params(PARAMS), dry_run=False,
+                expected_version=preview['data_version'])
+
+    assert db.session.scalar(select(Pallet.price).where(Pallet.id == pallet_id)) == 555
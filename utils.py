@@ -1,58 +1,147 @@
+import logging
+import math
+from decimal import Decimal
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Number of blocks (takoz) on every pallet
+BLOCK_COUNT = 9
+
+# Dimension and quantity columns that feed the desi formula, in model order
+DIMENSION_FIELDS = (
+    'board_thickness',
+    'upper_board_length', 'upper_board_width', 'upper_board_quantity',
+    'lower_board_length', 'lower_board_width', 'lower_board_quantity',
+    'closure_length', 'closure_width', 'closure_quantity',
+    'block_length', 'block_width', 'block_height',
+)
+
+# Output columns of the desi calculation
+DESI_FIELDS = ('upper_board_desi', 'lower_board_desi', 'closure_desi', 'block_desi', 'total_desi')
+
+
+def _to_float_column(values):
+    """Convert a column of numbers (Decimal, str, int, None ...) to a float64 array.
+
+    Values that can not be converted become NaN so they show up in the error mask.
+    """
+    if isinstance(values, np.ndarray) and values.dtype.kind in 'fiu':
+        return values.astype(np.float64, copy=False)
+    try:
+        return np.asarray(values, dtype=np.float64)
+    except (TypeError, ValueError, ArithmeticError):
+        column = np.empty(len(values), dtype=np.float64)
+        for i, value in enumerate(values):
+            try:
+                column[i] = float(value) if value is not None else np.nan
+            except (TypeError, ValueError, ArithmeticError):
+                column[i] = np.nan
+        return column
+
+
+def _round2(value):
+    """``np.round(value, 2)`` for one float, so single and batch results agree to the last bit"""
+    return round(value * 100) / 100
+
+
+def _component_desi(values, round2):
+    """The desi formula, for floats or float arrays in ``values`` (keyed by ``DIMENSION_FIELDS``)"""
+    thickness = values['board_thickness']
+    upper_board_desi = round2(values['upper_board_length'] * values['upper_board_width'] * thickness *
+                              values['upper_board_quantity'] / 1000)
+    lower_board_desi = round2(values['lower_board_length'] * values['lower_board_width'] * thickness *
+                              values['lower_board_quantity'] / 1000)
+    closure_desi = round2(values['closure_length'] * values['closure_width'] * thickness *
+                          values['closure_quantity'] / 1000)
+    block_desi = round2(values['block_length'] * values['block_width'] * values['block_height'] *
+                        BLOCK_COUNT / 1000)
+    return {
+        'upper_board_desi': upper_board_desi,
+        'lower_board_desi': lower_board_desi,
+        'closure_desi': closure_desi,
+        'block_desi': block_desi,
+        'total_desi': round2(upper_board_desi + lower_board_desi + closure_desi + block_desi),
+    }
+
+
+def calculate_component_volumes_batch(columns):
+    """Calculate component volumes in desi for many pallets at once.
+
+    ``columns`` maps every name in ``DIMENSION_FIELDS`` to a sequence (or NumPy
+    array) with one value per pallet. Returns a dict with a float64 array for
+    every name in ``DESI_FIELDS`` plus an ``error`` boolean array. Rows with a
+    missing, non-numeric or negative input are flagged in ``error`` and their
+    desi values are NaN.
+    """
+    missing = [field for field in DIMENSION_FIELDS if field not in columns]
+    if missing:
+        raise KeyError(f"Missing dimension columns: {', '.join(missing)}")
+
+    values = {field: _to_float_column(columns[field]) for field in DIMENSION_FIELDS}
+    sizes = {len(column) for column in values.values()}
+    if len(sizes) > 1:
+        raise ValueError("All dimension columns must have the same length")
+
+    with np.errstate(invalid='ignore'):
+        stacked = np.vstack([values[field] for field in DIMENSION_FIELDS])
+        error = ~np.isfinite(stacked).all(axis=0) | (stacked < 0).any(axis=0)
+        result = _component_desi(values, lambda column: np.round(column, 2))
+
+    for column in result.values():
+        column[error] = np.nan
+    result['error'] = error
+    return result
+
+
+def pallet_columns(pallets):
+    """Build the column arrays expected by ``calculate_component_volumes_batch``.
+
+    ``pallets`` may contain model instances, dicts or row objects with the
+    dimension fields as attributes.
+    """
+    columns = {field: [] for field in DIMENSION_FIELDS}
+    for pallet in pallets:
+        getter = pallet.get if isinstance(pallet, dict) else lambda field: getattr(pallet, field, None)
+        for field in DIMENSION_FIELDS:
+            columns[field].append(getter(field))
+    return columns
+
+
+def format_float(value, precision=2):
+    """Format float values with proper error handling"""
+    try:
+        return f"{float(value):.{precision}f}" if value is not None else "0.00"
+    except (ValueError, TypeError) as e:
+        logger.error(f"Error formatting float value {value}: {str(e)}")
+        return "0.00"
+
+
+def desi_to_decimal(value):
+    """Convert a calculated desi value to a Decimal suitable for Numeric(10, 2) columns"""
+    if value is None or not np.isfinite(value):
+        return None
+    return Decimal(f"{float(value):.2f}")
+
+
 def calculate_component_volumes(pallet):
-    """Calculate individual and total volumes of pallet components in desi (1 desi = 1000 cm³)"""
+    """Calculate individual and total volumes of pallet components in desi (1 desi = 1000 cm³).
+
+    Plain float arithmetic for one pallet; ``calculate_component_volumes_batch``
+    computes the same values for many. As there, a missing, non-numeric or
+    negative dimension is an error; the result is then all zeros.
+    """
     try:
-        # Convert Decimal to float for calculations
-        def to_float(value):
-            return float(str(value)) if value is not None else 0.0
-        
-        # Get dimensions as floats
-        board_thickness = to_float(pallet.board_thickness)
-        
-        # Calculate upper boards volume
-        upper_board_volume = (
-            to_float(pallet.upper_board_length) * 
-            to_float(pallet.upper_board_width) * 
-            board_thickness * 
-            to_float(pallet.upper_board_quantity)
-        )
-        upper_board_desi = round(upper_board_volume / 1000, 2)
-        
-        # Calculate lower boards volume
-        lower_board_volume = (
-            to_float(pallet.lower_board_length) * 
-            to_float(pallet.lower_board_width) * 
-            board_thickness * 
-            to_float(pallet.lower_board_quantity)
-        )
-        lower_board_desi = round(lower_board_volume / 1000, 2)
-        
-        # Calculate closure boards volume
-        closure_volume = (
-            to_float(pallet.closure_length) * 
-            to_float(pallet.closure_width) * 
-            board_thickness * 
-            to_float(pallet.closure_quantity)
-        )
-        closure_desi = round(closure_volume / 1000, 2)
-        
-        # Calculate blocks volume (fixed 9 blocks)
-        block_volume = (
-            to_float(pallet.block_length) * 
-            to_float(pallet.block_width) * 
-            to_float(pallet.block_height) * 9  # Fixed 9 blocks
-        )
-        block_desi = round(block_volume / 1000, 2)
-        
-        # Total desi
-        total_desi = round(upper_board_desi + lower_board_desi + closure_desi + block_desi, 2)
-        
-        return {
-            'upper_board_desi': upper_board_desi,
-            'lower_board_desi': lower_board_desi,
-            'closure_desi': closure_desi,
-            'block_desi': block_desi,
-            'total_desi': total_desi
-        }
+        getter = pallet.get if isinstance(pallet, dict) else lambda field: getattr(pallet, field, None)
+        values = {}
+        for field in DIMENSION_FIELDS:
+            value = getter(field)
+            value = float(value) if value is not None else math.nan
+            if not math.isfinite(value) or value < 0:
+                raise ValueError(f"Invalid {field} for pallet {getter('name') or ''}")
+            values[field] = value
+        return _component_desi(values, _round2)
     except Exception as e:
         logger.error(f"Error calculating component volumes: {str(e)}")
         # Return zero values if calculation fails